@@ -0,0 +1,148 @@
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+
+from analytics.models import ComplianceMetrics, UserComplianceMetrics, ViolationTypeMetrics
+from ppe_detection.models import Detection, PersonDetection, Violation
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the daily compliance rollups (per user, per site, per violation type) from the '
+        'detection tables. Use for the initial backfill or to repair drift; run while uploads are quiet.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', help='Only rebuild the per-user rollups of this username (site rollups are left alone)'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        detections = Detection.objects.filter(status='completed')
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']} not found")
+            detections = detections.filter(user=user)
+
+        violations = Violation.objects.filter(detection__in=detections)
+        persons = PersonDetection.objects.filter(detection__in=detections)
+
+        user_rows = self.user_rollups(detections, persons, violations)
+        type_rows = self.type_rollups(violations)
+        site_rows = [] if options['user'] else self.site_rollups(detections, persons)
+
+        with transaction.atomic():
+            user_metrics = UserComplianceMetrics.objects.all()
+            type_metrics = ViolationTypeMetrics.objects.all()
+            if options['user']:
+                user_metrics = user_metrics.filter(user=user)
+                type_metrics = type_metrics.filter(user=user)
+            user_metrics.delete()
+            type_metrics.delete()
+            UserComplianceMetrics.objects.bulk_create(user_rows, batch_size=options['batch_size'])
+            ViolationTypeMetrics.objects.bulk_create(type_rows, batch_size=options['batch_size'])
+
+            if not options['user']:
+                ComplianceMetrics.objects.all().delete()
+                ComplianceMetrics.objects.bulk_create(site_rows, batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {len(user_rows)} user-day, {len(type_rows)} violation-type and {len(site_rows)} site-day rollup(s)'
+        ))
+
+    @staticmethod
+    def _scan_counts():
+        return {
+            'total_scans': Count('id'),
+            'compliant_scans': Count('id', filter=Q(compliance_status='compliant')),
+            'partial_scans': Count('id', filter=Q(compliance_status='partial')),
+            'non_compliant_scans': Count('id', filter=Q(compliance_status='non_compliant')),
+            'total_persons': Sum('total_persons_detected'),
+            'compliant_persons': Sum('compliant_persons'),
+            'non_compliant_persons': Sum('non_compliant_persons'),
+        }
+
+    @staticmethod
+    def _ppe_counts():
+        # Persons missing an item; equivalent to the item appearing in missing_ppe
+        return {
+            'helmet_violations': Count('id', filter=Q(helmet_detected=False)),
+            'vest_violations': Count('id', filter=Q(vest_detected=False)),
+            'mask_violations': Count('id', filter=Q(mask_detected=False)),
+        }
+
+    def user_rollups(self, detections, persons, violations):
+        """One grouped query per source table, merged on (user, day)"""
+        rows = defaultdict(dict)
+
+        for row in detections.annotate(day=TruncDate('created_at')).values('user_id', 'day').annotate(
+            **self._scan_counts()
+        ):
+            rows[row.pop('user_id'), row.pop('day')].update(row)
+
+        for row in persons.annotate(day=TruncDate('detection__created_at')).values(
+            'detection__user_id', 'day'
+        ).annotate(**self._ppe_counts()):
+            rows[row.pop('detection__user_id'), row.pop('day')].update(row)
+
+        violation_counts = {'total_violations': Count('id')}
+        for severity, _ in Violation.SEVERITY_CHOICES:
+            violation_counts[f'{severity}_violations'] = Count('id', filter=Q(severity=severity))
+        for status, _ in Violation.STATUS_CHOICES:
+            violation_counts[f'{status}_violations'] = Count('id', filter=Q(status=status))
+        for row in violations.annotate(day=TruncDate('detection__created_at')).values(
+            'detection__user_id', 'day'
+        ).annotate(**violation_counts):
+            rows[row.pop('detection__user_id'), row.pop('day')].update(row)
+
+        return [
+            UserComplianceMetrics(user_id=user_id, date=day, **{name: value or 0 for name, value in counts.items()})
+            for (user_id, day), counts in rows.items()
+        ]
+
+    def type_rollups(self, violations):
+        return [
+            ViolationTypeMetrics(
+                user_id=row['detection__user_id'], date=row['day'],
+                violation_type=row['violation_type'], count=row['total']
+            )
+            for row in violations.annotate(day=TruncDate('detection__created_at')).values(
+                'detection__user_id', 'day', 'violation_type'
+            ).annotate(total=Count('id'))
+        ]
+
+    def site_rollups(self, detections, persons):
+        rows = defaultdict(dict)
+        scan_counts = self._scan_counts()
+        for name in ('compliant_scans', 'partial_scans', 'non_compliant_scans'):
+            scan_counts.pop(name)
+
+        for row in detections.filter(site__isnull=False).annotate(day=TruncDate('created_at')).values(
+            'site_id', 'day'
+        ).annotate(**scan_counts):
+            rows[row.pop('site_id'), row.pop('day')].update(row)
+
+        for row in persons.filter(detection__site__isnull=False).annotate(
+            day=TruncDate('detection__created_at')
+        ).values('detection__site_id', 'day').annotate(**self._ppe_counts()):
+            rows[row.pop('detection__site_id'), row.pop('day')].update(row)
+
+        metrics = []
+        for (site_id, day), counts in rows.items():
+            counts = {name: value or 0 for name, value in counts.items()}
+            total_persons = counts.get('total_persons', 0)
+            metrics.append(ComplianceMetrics(
+                site_id=site_id, date=day,
+                compliance_rate=100.0 * counts.get('compliant_persons', 0) / total_persons if total_persons > 0 else 0.0,
+                **counts
+            ))
+        return metrics
@@ -0,0 +1,70 @@
+# Generated by Django 5.1 on 2026-10-17 15:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='compliancemetrics',
+            name='mask_violations',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='UserComplianceMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('total_scans', models.IntegerField(default=0)),
+                ('compliant_scans', models.IntegerField(default=0)),
+                ('partial_scans', models.IntegerField(default=0)),
+                ('non_compliant_scans', models.IntegerField(default=0)),
+                ('total_persons', models.IntegerField(default=0)),
+                ('compliant_persons', models.IntegerField(default=0)),
+                ('non_compliant_persons', models.IntegerField(default=0)),
+                ('total_violations', models.IntegerField(default=0)),
+                ('helmet_violations', models.IntegerField(default=0)),
+                ('vest_violations', models.IntegerField(default=0)),
+                ('mask_violations', models.IntegerField(default=0)),
+                ('critical_violations', models.IntegerField(default=0)),
+                ('high_violations', models.IntegerField(default=0)),
+                ('medium_violations', models.IntegerField(default=0)),
+                ('low_violations', models.IntegerField(default=0)),
+                ('open_violations', models.IntegerField(default=0)),
+                ('acknowledged_violations', models.IntegerField(default=0)),
+                ('resolved_violations', models.IntegerField(default=0)),
+                ('dismissed_violations', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='compliance_metrics', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'user_compliance_metrics',
+                'ordering': ['-date'],
+                'unique_together': {('user', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ViolationTypeMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('violation_type', models.CharField(max_length=100)),
+                ('count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='violation_type_metrics', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'violation_type_metrics',
+                'ordering': ['-date'],
+                'unique_together': {('user', 'date', 'violation_type')},
+            },
+        ),
+    ]
@@ -6,7 +6,7 @@ User = get_user_model()
 
 
 class ComplianceMetrics(models.Model):
-    """Daily compliance metrics aggregation"""
+    """Daily compliance metrics aggregation (maintained incrementally by analytics.rollups)"""
     
     site = models.ForeignKey(Site, on_delete=models.CASCADE, related_name='metrics')
     date = models.DateField()
@@ -18,6 +18,10 @@ class ComplianceMetrics(models.Model):
     
     helmet_violations = models.IntegerField(default=0)
     vest_violations = models.IntegerField(default=0)
+    mask_violations = models.IntegerField(default=0)
+    boots_violations = models.IntegerField(default=0)
+    gloves_violations = models.IntegerField(default=0)
+    glasses_violations = models.IntegerField(default=0)
     
     compliance_rate = models.FloatField(default=0.0)
     
@@ -34,3 +38,62 @@ class ComplianceMetrics(models.Model):
     
     def __str__(self):
         return f"{self.site.name} - {self.date}"
+
+
+class UserComplianceMetrics(models.Model):
+    """Daily per-user rollup behind the dashboard statistics (maintained by analytics.rollups)"""
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='compliance_metrics')
+    date = models.DateField()
+    
+    total_scans = models.IntegerField(default=0)
+    compliant_scans = models.IntegerField(default=0)
+    partial_scans = models.IntegerField(default=0)
+    non_compliant_scans = models.IntegerField(default=0)
+    
+    total_persons = models.IntegerField(default=0)
+    compliant_persons = models.IntegerField(default=0)
+    non_compliant_persons = models.IntegerField(default=0)
+    
+    total_violations = models.IntegerField(default=0)
+    helmet_violations = models.IntegerField(default=0)
+    vest_violations = models.IntegerField(default=0)
+    mask_violations = models.IntegerField(default=0)
+    
+    critical_violations = models.IntegerField(default=0)
+    high_violations = models.IntegerField(default=0)
+    medium_violations = models.IntegerField(default=0)
+    low_violations = models.IntegerField(default=0)
+    
+    open_violations = models.IntegerField(default=0)
+    acknowledged_violations = models.IntegerField(default=0)
+    resolved_violations = models.IntegerField(default=0)
+    dismissed_violations = models.IntegerField(default=0)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'user_compliance_metrics'
+        unique_together = ['user', 'date']
+        ordering = ['-date']
+    
+    def __str__(self):
+        return f"{self.user} - {self.date}"
+
+
+class ViolationTypeMetrics(models.Model):
+    """Daily per-user violation counts by violation type (for the top violations list)"""
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='violation_type_metrics')
+    date = models.DateField()
+    violation_type = models.CharField(max_length=100)
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'violation_type_metrics'
+        unique_together = ['user', 'date', 'violation_type']
+        ordering = ['-date']
+    
+    def __str__(self):
+        return f"{self.violation_type} - {self.date}: {self.count}"
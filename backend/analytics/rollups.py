@@ -0,0 +1,156 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, ExpressionWrapper, F, FloatField, Sum, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import ComplianceMetrics, UserComplianceMetrics, ViolationTypeMetrics
+
+
+# Missing PPE item -> rollup column
+PPE_VIOLATION_FIELDS = {
+    'helmet': 'helmet_violations',
+    'safety_vest': 'vest_violations',
+    'face_mask': 'mask_violations',
+}
+
+USER_COUNTERS = [
+    field.name for field in UserComplianceMetrics._meta.concrete_fields
+    if field.get_internal_type() == 'IntegerField'
+]
+
+
+def _upsert(model, key, deltas):
+    """Add deltas to the rollup row for key, creating it on first use.
+
+    The increment is a single UPDATE ... SET col = col + n, so concurrent writers
+    never lose counts. Two writers creating the same row race on the unique key;
+    the loser's INSERT fails inside its savepoint and it falls back to the UPDATE.
+    """
+    deltas = {name: value for name, value in deltas.items() if value}
+    if not deltas:
+        return
+
+    increments = {name: F(name) + value for name, value in deltas.items()}
+    if any(field.name == 'updated_at' for field in model._meta.concrete_fields):
+        # QuerySet.update() skips auto_now
+        increments['updated_at'] = timezone.now()
+
+    if model.objects.filter(**key).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **deltas)
+    except IntegrityError:
+        model.objects.filter(**key).update(**increments)
+
+
+def _detection_deltas(detection, persons, violations):
+    """Per-user, per-site and per-type counter deltas for one completed detection"""
+    persons = list(persons)
+    violations = list(violations)
+
+    user = Counter(total_scans=1, total_persons=len(persons), total_violations=len(violations))
+    if detection.compliance_status in ('compliant', 'partial', 'non_compliant'):
+        user[f'{detection.compliance_status}_scans'] += 1
+
+    for person in persons:
+        user['compliant_persons' if person.is_compliant else 'non_compliant_persons'] += 1
+        for item in person.missing_ppe or []:
+            if item in PPE_VIOLATION_FIELDS:
+                user[PPE_VIOLATION_FIELDS[item]] += 1
+
+    for violation in violations:
+        user[f'{violation.severity}_violations'] += 1
+        user[f'{violation.status}_violations'] += 1
+
+    site = {
+        name: user[name]
+        for name in (
+            'total_scans', 'total_persons', 'compliant_persons', 'non_compliant_persons',
+            *PPE_VIOLATION_FIELDS.values()
+        )
+    }
+    types = Counter(violation.violation_type for violation in violations)
+    return user, site, types
+
+
+def record_detection(detection, persons, violations, sign=1):
+    """Add a completed detection (or remove it, with sign=-1) to the daily rollups.
+
+    Call inside the transaction that writes the detection's rows so the rollups
+    commit or roll back with them.
+    """
+    date = timezone.localdate(detection.created_at)
+    user, site, types = _detection_deltas(detection, persons, violations)
+
+    _upsert(
+        UserComplianceMetrics,
+        {'user_id': detection.user_id, 'date': date},
+        {name: sign * value for name, value in user.items()}
+    )
+    for violation_type, count in types.items():
+        _upsert(
+            ViolationTypeMetrics,
+            {'user_id': detection.user_id, 'date': date, 'violation_type': violation_type},
+            {'count': sign * count}
+        )
+
+    if detection.site_id:
+        key = {'site_id': detection.site_id, 'date': date}
+        _upsert(ComplianceMetrics, key, {name: sign * value for name, value in site.items()})
+        ComplianceMetrics.objects.filter(**key).update(compliance_rate=Case(
+            When(total_persons__gt=0, then=ExpressionWrapper(
+                100.0 * F('compliant_persons') / F('total_persons'), output_field=FloatField()
+            )),
+            default=0.0,
+            output_field=FloatField(),
+        ))
+
+
+def remove_detection(detection):
+    """Take a completed detection back out of the rollups (before it is deleted)"""
+    if detection.status != 'completed':
+        return
+    record_detection(
+        detection,
+        detection.person_detections.only('is_compliant', 'missing_ppe'),
+        detection.violations.only('violation_type', 'severity', 'status'),
+        sign=-1
+    )
+
+
+def record_status_change(user_id, date, old_status, new_status, count=1):
+    """Move count violations from one status column to another.
+
+    date is the local date of the violations' detection, the day they were rolled up under.
+    """
+    if old_status == new_status or not count:
+        return
+    _upsert(
+        UserComplianceMetrics,
+        {'user_id': user_id, 'date': date},
+        {f'{old_status}_violations': -count, f'{new_status}_violations': count}
+    )
+
+
+def user_totals(user, start_date=None, end_date=None):
+    """All-time (or date-bounded) sums of a user's rollup counters, in one query"""
+    rows = UserComplianceMetrics.objects.filter(user=user)
+    if start_date:
+        rows = rows.filter(date__gte=start_date)
+    if end_date:
+        rows = rows.filter(date__lte=end_date)
+    return rows.aggregate(**{name: Coalesce(Sum(name), 0) for name in USER_COUNTERS})
+
+
+def top_violation_types(user, limit=5, start_date=None, end_date=None):
+    """Most frequent violation types for a user: [{'violation_type', 'count'}]"""
+    rows = ViolationTypeMetrics.objects.filter(user=user)
+    if start_date:
+        rows = rows.filter(date__gte=start_date)
+    if end_date:
+        rows = rows.filter(date__lte=end_date)
+    rows = rows.values('violation_type').annotate(total=Sum('count')).filter(total__gt=0).order_by('-total')[:limit]
+    return [{'violation_type': row['violation_type'], 'count': row['total']} for row in rows]
@@ -0,0 +1,196 @@
+from datetime import datetime, time, timedelta
+
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce, TruncDay, TruncHour, TruncWeek
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from ppe_detection.models import Detection, Violation
+
+from . import rollups
+
+
+SERIES_BUCKETS = {
+    'hour': TruncHour,
+    'day': TruncDay,
+    'week': TruncWeek,
+}
+
+# Window shown when a series request gives no start date
+DEFAULT_SERIES_SPAN = {
+    'hour': timedelta(hours=48),
+    'day': timedelta(days=30),
+    'week': timedelta(weeks=26),
+}
+
+
+def filters_from_params(params):
+    """site / start / end (YYYY-MM-DD, inclusive) from query params; ValueError if malformed"""
+    filters = {'site': None, 'start_date': None, 'end_date': None}
+    site = params.get('site')
+    if site:
+        try:
+            filters['site'] = int(site)
+        except ValueError:
+            raise ValueError(f'Invalid site: {site} (expected a site id)') from None
+    for name, key in (('start', 'start_date'), ('end', 'end_date')):
+        value = params.get(name)
+        if value:
+            filters[key] = parse_date(value)
+            if filters[key] is None:
+                raise ValueError(f'Invalid {name} date: {value} (expected YYYY-MM-DD)')
+    return filters
+
+
+def day_start(date):
+    """Aware datetime for local midnight at the start of date"""
+    return timezone.make_aware(datetime.combine(date, time.min))
+
+
+def scan_aggregates():
+    """Conditional aggregates over completed detections: scans by compliance and person totals"""
+    return {
+        'total_scans': Count('id'),
+        'compliant_scans': Count('id', filter=Q(compliance_status='compliant')),
+        'partial_scans': Count('id', filter=Q(compliance_status='partial')),
+        'non_compliant_scans': Count('id', filter=Q(compliance_status='non_compliant')),
+        'total_persons': Coalesce(Sum('total_persons_detected'), 0),
+        'compliant_persons': Coalesce(Sum('compliant_persons'), 0),
+        'non_compliant_persons': Coalesce(Sum('non_compliant_persons'), 0),
+    }
+
+
+def violation_aggregates(recent_since=None):
+    """Conditional aggregates over violations: total, by severity, by status (and since recent_since)"""
+    aggregates = {'total_violations': Count('id')}
+    if recent_since is not None:
+        aggregates['recent_violations'] = Count('id', filter=Q(created_at__gte=recent_since))
+    for severity, _ in Violation.SEVERITY_CHOICES:
+        aggregates[f'{severity}_violations'] = Count('id', filter=Q(severity=severity))
+    for status, _ in Violation.STATUS_CHOICES:
+        aggregates[f'{status}_violations'] = Count('id', filter=Q(status=status))
+    return aggregates
+
+
+def completed_detections(user, site=None, start_date=None, end_date=None):
+    """A user's completed detections, optionally for one site and local-date range"""
+    detections = Detection.objects.filter(user=user, status='completed')
+    if site:
+        detections = detections.filter(site_id=site)
+    # Bounds on created_at itself keep the (user, -created_at) index usable
+    if start_date:
+        detections = detections.filter(created_at__gte=day_start(start_date))
+    if end_date:
+        detections = detections.filter(created_at__lt=day_start(end_date + timedelta(days=1)))
+    return detections
+
+
+def _raw_totals(user, site, start_date, end_date, recent_since):
+    """Counters straight from the detection tables: one statement per table"""
+    detections = completed_detections(user, site, start_date, end_date)
+    totals = detections.aggregate(**scan_aggregates())
+    totals.update(
+        Violation.objects.filter(detection__in=detections).aggregate(**violation_aggregates(recent_since))
+    )
+    return totals
+
+
+def _raw_top_violation_types(user, site, start_date, end_date, limit):
+    rows = (
+        Violation.objects.filter(detection__in=completed_detections(user, site, start_date, end_date))
+        .values('violation_type')
+        .annotate(count=Count('id'))
+        .order_by('-count')[:limit]
+    )
+    return list(rows)
+
+
+def dashboard_summary(user, site=None, start_date=None, end_date=None, top=5):
+    """Every dashboard number for a user's completed scans, in three queries.
+
+    Without a site filter the counters come from the per-user daily rollups (one
+    aggregate over at most one row per day) and only the 24h violation count is
+    read live. With a site the detection and violation tables are aggregated
+    directly with conditional counts. Either way the query count does not grow
+    with the number of detections.
+    """
+    recent_since = timezone.now() - timedelta(hours=24)
+
+    if site:
+        totals = _raw_totals(user, site, start_date, end_date, recent_since)
+        top_violations = _raw_top_violation_types(user, site, start_date, end_date, top)
+    else:
+        totals = rollups.user_totals(user, start_date, end_date)
+        totals['recent_violations'] = Violation.objects.filter(
+            detection__in=completed_detections(user, start_date=start_date, end_date=end_date),
+            created_at__gte=recent_since
+        ).count()
+        top_violations = rollups.top_violation_types(user, limit=top, start_date=start_date, end_date=end_date)
+
+    total_scans = totals['total_scans']
+    total_persons = totals['total_persons']
+    return {
+        'total_detections': total_scans,
+        'total_persons_scanned': total_persons,
+        'compliant_persons': totals['compliant_persons'],
+        'non_compliant_persons': totals['non_compliant_persons'],
+        'total_violations': totals['total_violations'],
+        'recent_violations': totals['recent_violations'],
+        'compliant': totals['compliant_scans'],
+        'partial_compliant': totals['partial_scans'],
+        'non_compliant': totals['non_compliant_scans'],
+        'compliance_rate': round(totals['compliant_scans'] / total_scans * 100, 2) if total_scans > 0 else 100.0,
+        'person_compliance_rate': (
+            round(totals['compliant_persons'] / total_persons * 100, 2) if total_persons > 0 else 100.0
+        ),
+        'by_severity': {
+            severity: totals[f'{severity}_violations']
+            for severity, _ in Violation.SEVERITY_CHOICES
+            if totals[f'{severity}_violations']
+        },
+        'by_status': {
+            status: totals[f'{status}_violations']
+            for status, _ in Violation.STATUS_CHOICES
+            if totals[f'{status}_violations']
+        },
+        'top_violations': top_violations,
+    }
+
+
+def compliance_series(user, bucket='day', site=None, start_date=None, end_date=None):
+    """Per-bucket scan, person and violation counts for charts, in one grouped query.
+
+    Buckets are local-time hours, days or (Monday-based) weeks; empty buckets are
+    omitted. Without a start date the series covers DEFAULT_SERIES_SPAN[bucket].
+    """
+    if bucket not in SERIES_BUCKETS:
+        raise ValueError(f"Unknown bucket: {bucket} (expected one of {', '.join(SERIES_BUCKETS)})")
+
+    detections = completed_detections(user, site, start_date, end_date)
+    if start_date is None:
+        detections = detections.filter(created_at__gte=timezone.now() - DEFAULT_SERIES_SPAN[bucket])
+
+    rows = (
+        detections
+        .annotate(bucket=SERIES_BUCKETS[bucket]('created_at'))
+        .values('bucket')
+        .annotate(**scan_aggregates())
+        .order_by('bucket')
+    )
+
+    series = []
+    for row in rows:
+        total_scans = row['total_scans']
+        series.append({
+            'bucket': row['bucket'],
+            'total_detections': total_scans,
+            'compliant': row['compliant_scans'],
+            'partial_compliant': row['partial_scans'],
+            'non_compliant': row['non_compliant_scans'],
+            'total_persons_scanned': row['total_persons'],
+            'compliant_persons': row['compliant_persons'],
+            # save_detection_results writes one violation per non-compliant person
+            'violations': row['non_compliant_persons'],
+            'compliance_rate': round(row['compliant_scans'] / total_scans * 100, 2) if total_scans > 0 else 100.0,
+        })
+    return series
@@ -1,3 +1,193 @@
-from django.test import TestCase
+import io
+from datetime import date, timedelta
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from ppe_detection.models import Detection, Notification, Violation
+from ppe_detection.services import save_detection_results
+from ppe_detection.views import set_violation_status
+from users.models import Site
+
+from .models import ComplianceMetrics, UserComplianceMetrics, ViolationTypeMetrics
+from .statistics import filters_from_params
+
+
+class FiltersFromParamsTests(SimpleTestCase):
+    def test_parses_site_and_dates(self):
+        filters = filters_from_params(QueryDict('site=7&start=2024-03-01&end=2024-03-31'))
+        self.assertEqual(filters, {'site': 7, 'start_date': date(2024, 3, 1), 'end_date': date(2024, 3, 31)})
+
+    def test_empty_params_mean_no_filter(self):
+        self.assertEqual(
+            filters_from_params(QueryDict('site=&start=&end=')),
+            {'site': None, 'start_date': None, 'end_date': None}
+        )
+
+    def test_malformed_values_raise_value_error(self):
+        for query in ('site=abc', 'site=1.5', 'start=yesterday', 'start=2024-13-01', 'end=2024/03/31', 'end=2024-02-30'):
+            with self.subTest(query=query):
+                with self.assertRaises(ValueError):
+                    filters_from_params(QueryDict(query))
+
+
+class StatisticsFilterValidationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user('inspector', password='secret'))
+
+    def test_malformed_filters_are_bad_requests(self):
+        urls = (
+            '/api/analytics/statistics/', '/api/analytics/statistics/series/',
+            '/api/ppe/detections/statistics/', '/api/ppe/violation-stats/', '/api/ppe/export-violations/',
+        )
+        for url in urls:
+            for query in ('site=abc', 'start=not-a-date', 'end=2024-02-30'):
+                with self.subTest(url=url, query=query):
+                    response = self.client.get(f'{url}?{query}')
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn('error', response.data)
+
+
+ROLLUP_KEYS = (
+    (UserComplianceMetrics, ('user_id', 'date')),
+    (ViolationTypeMetrics, ('user_id', 'date', 'violation_type')),
+    (ComplianceMetrics, ('site_id', 'date')),
+)
+
+
+def rollup_snapshot():
+    """{(table, key...): counters} for every rollup row with a non-zero counter"""
+    snapshot = {}
+    for model, key in ROLLUP_KEYS:
+        counters = [field.name for field in model._meta.concrete_fields if field.get_internal_type() == 'IntegerField']
+        for row in model.objects.values(*key, *counters, *(['compliance_rate'] if model is ComplianceMetrics else [])):
+            values = {name: row[name] for name in counters}
+            if not any(values.values()):
+                continue
+            if 'compliance_rate' in row:
+                values['compliance_rate'] = round(row['compliance_rate'], 6)
+            snapshot[(model._meta.db_table, *[row[name] for name in key])] = values
+    return snapshot
+
+
+def worker(helmet=True, vest=True, mask=True):
+    """A person as the detector reports it"""
+    return {
+        'bbox': [100.0, 200.0, 220.0, 600.0],
+        'confidence': 0.9,
+        'ppe': {
+            'helmet': {'detected': helmet, 'confidence': 0.9 if helmet else 0.0},
+            'safety_vest': {'detected': vest, 'confidence': 0.8 if vest else 0.0},
+            'face_mask': {'detected': mask, 'confidence': 0.7 if mask else 0.0},
+        },
+    }
+
+
+class RollupConsistencyTests(TestCase):
+    """Incrementally maintained rollups must equal a full `rebuild_rollups` after every write path"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('inspector', password='secret')
+        self.other = User.objects.create_user('foreman', password='secret')
+        self.site = Site.objects.create(name='North Yard', location='Pier 4', manager=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        self.scan(self.user, [worker(), worker(helmet=False), worker(vest=False, mask=False)])
+        self.scan(self.user, [worker(), worker()])
+        self.scan(self.user, [worker(helmet=False, vest=False)], days_ago=1)
+        self.scan(self.user, [], site=None, days_ago=2)
+        self.scan(self.user, [worker(mask=False)], site=None)
+        self.scan(self.other, [worker(helmet=False), worker()])
+
+    def scan(self, user, persons, site=True, days_ago=0):
+        """A processed upload, days_ago local days back"""
+        detection = Detection.objects.create(
+            user=user, site=self.site if site else None, original_image='uploads/photo.jpg', status='processing'
+        )
+        if days_ago:
+            Detection.objects.filter(pk=detection.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+            detection.refresh_from_db()
+        return save_detection_results(detection, {
+            'num_persons': len(persons), 'persons': persons, 'avg_confidence': 0.85, 'processing_time': 0.1,
+        })
+
+    def test_results_are_saved_once(self):
+        # A requeued job finished by two workers: the second result is dropped
+        detection = self.scan(self.user, [worker(helmet=False)])
+        before = rollup_snapshot()
+        save_detection_results(Detection.objects.get(pk=detection.pk), {
+            'num_persons': 2, 'persons': [worker(), worker(vest=False)], 'avg_confidence': 0.5, 'processing_time': 0.2,
+        })
+        self.assertEqual(rollup_snapshot(), before)
+        self.assertEqual(Violation.objects.filter(detection=detection).count(), 1)
+        self.assertEqual(Notification.objects.filter(detection=detection).count(), 1)
+        self.assertEqual(Detection.objects.get(pk=detection.pk).total_persons_detected, 1)
+        self.assertRollupsMatchRebuild()
+
+    def assertRollupsMatchRebuild(self, *args):
+        incremental = rollup_snapshot()
+        self.assertTrue(incremental)
+        call_command('rebuild_rollups', *args, stdout=io.StringIO())
+        self.assertEqual(incremental, rollup_snapshot())
+
+    def violations(self, **filters):
+        return Violation.objects.filter(detection__user=self.user, **filters).select_related('detection')
+
+    def test_record_detection(self):
+        self.assertRollupsMatchRebuild()
+        self.assertEqual(UserComplianceMetrics.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(ComplianceMetrics.objects.filter(site=self.site).count(), 2)
+
+    def test_rebuild_for_one_user(self):
+        self.assertRollupsMatchRebuild('--user', 'inspector')
+
+    def test_set_violation_status(self):
+        old = self.violations(detection__created_at__lt=timezone.now() - timedelta(hours=12))[0]
+        new = self.violations(detection__created_at__gte=timezone.now() - timedelta(hours=12))[0]
+        set_violation_status(old, 'acknowledged', acknowledged_by=self.user, acknowledged_at=timezone.now())
+        set_violation_status(new, 'resolved', resolved_at=timezone.now())
+        self.assertRollupsMatchRebuild()
+
+        # Setting the status a violation already has moves nothing
+        set_violation_status(new, 'resolved', resolved_at=timezone.now())
+        self.assertRollupsMatchRebuild()
+
+    def test_acknowledge_then_resolve(self):
+        violation = self.violations()[0]
+        response = self.client.post(f'/api/ppe/violations/{violation.pk}/acknowledge/')
+        self.assertEqual(response.status_code, 200)
+        self.assertRollupsMatchRebuild()
+
+        response = self.client.post(f'/api/ppe/violations/{violation.pk}/resolve/')
+        self.assertEqual(response.status_code, 200)
+        self.assertRollupsMatchRebuild()
+
+    def test_mark_notification_read(self):
+        violation = self.violations()[0]
+        for _ in range(2):
+            response = self.client.post(f'/api/ppe/notifications/violation_{violation.pk}/read/')
+            self.assertEqual(response.status_code, 200)
+            self.assertRollupsMatchRebuild()
+        self.assertEqual(Violation.objects.get(pk=violation.pk).status, 'acknowledged')
+
+    def test_mark_all_notifications_read(self):
+        set_violation_status(self.violations()[0], 'resolved', resolved_at=timezone.now())
+
+        response = self.client.post('/api/ppe/notifications/mark-all-read/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(self.violations(status='open').exists())
+        self.assertTrue(Violation.objects.filter(detection__user=self.other, status='open').exists())
+        self.assertRollupsMatchRebuild()
+
+    def test_delete_detection(self):
+        for detection in Detection.objects.filter(user=self.user, non_compliant_persons__gt=0)[:2]:
+            response = self.client.delete(f'/api/ppe/detections/{detection.pk}/')
+            self.assertEqual(response.status_code, 204)
+            self.assertRollupsMatchRebuild()
@@ -0,0 +1,7 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('statistics/', views.statistics_summary, name='statistics-summary'),
+    path('statistics/series/', views.statistics_series, name='statistics-series'),
+]
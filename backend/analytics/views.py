@@ -1,3 +1,33 @@
-from django.shortcuts import render
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
-# Create your views here.
+from .statistics import compliance_series, dashboard_summary, filters_from_params
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def statistics_summary(request):
+    """Dashboard counters for the current user (?site=<id>&start=YYYY-MM-DD&end=YYYY-MM-DD)"""
+    try:
+        filters = filters_from_params(request.query_params)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+    
+    return Response(dashboard_summary(request.user, **filters))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def statistics_series(request):
+    """Compliance time series for charts (?bucket=hour|day|week plus the summary filters)"""
+    try:
+        filters = filters_from_params(request.query_params)
+        series = compliance_series(request.user, bucket=request.query_params.get('bucket', 'day'), **filters)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+    
+    return Response({
+        'bucket': request.query_params.get('bucket', 'day'),
+        'series': series,
+    })
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class PpeDetectionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ppe_detection'
+
+    def ready(self):
+        if settings.PPE_WARMUP_ON_START:
+            from .yolo_service import get_detector
+            modes = {settings.IMAGE_DETECTOR_MODE, settings.STREAM_DETECTOR_MODE, settings.VIDEO_DETECTOR_MODE}
+            for mode in modes:
+                get_detector(mode).warmup()
@@ -0,0 +1,356 @@
+import ast
+import os
+import re
+import time
+
+import cv2
+import numpy as np
+import torch
+from django.conf import settings
+from ultralytics import YOLO
+from ultralytics.data.augment import LetterBox
+from ultralytics.engine.results import Results
+from ultralytics.utils import ops
+
+
+INFERENCE_BACKENDS = ('torch', 'onnx', 'onnx_int8', 'openvino')
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def exported_path(weight_path, backend):
+    """Where `manage.py export_models` puts the exported model for a .pt weight file"""
+    stem = os.path.splitext(weight_path)[0]
+    if backend == 'onnx':
+        return f'{stem}.onnx'
+    if backend == 'onnx_int8':
+        return f'{stem}_int8.onnx'
+    if backend == 'openvino':
+        return os.path.join(f'{stem}_openvino_model', f'{os.path.basename(stem)}.xml')
+    return weight_path
+
+
+def load_inference_model(weight_path, backend):
+    """Load a model for `backend`; returns (callable model, file it was loaded from).
+
+    Every backend is called like an ultralytics YOLO model and returns a list of
+    Results, so detection code does not depend on the backend. Falls back to the
+    PyTorch weights when the exported model is missing.
+    """
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+
+    if backend != 'torch':
+        path = exported_path(weight_path, backend)
+        if os.path.exists(path):
+            model_class = OpenVINOModel if backend == 'openvino' else OnnxRuntimeModel
+            return model_class(path), path
+        command = 'quantize_model' if backend == 'onnx_int8' else f'export_models --backend {backend}'
+        print(f"[BACKEND] ⚠️ {path} not found, using PyTorch weights (run `manage.py {command}`)")
+
+    model = YOLO(weight_path)
+    if torch.cuda.is_available():
+        model.to('cuda')
+    return model, weight_path
+
+
+def export_model(weight_path, backend, imgsz=640):
+    """Export a .pt model for an inference backend; returns the exported path"""
+    if backend == 'onnx_int8':
+        raise ValueError("INT8 models are built from the ONNX export with quantize_model()")
+    if backend == 'torch':
+        return weight_path
+    model = YOLO(weight_path)
+    if backend == 'onnx':
+        model.export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True)
+    elif backend == 'openvino':
+        model.export(format='openvino', imgsz=imgsz, dynamic=True)
+    else:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    return exported_path(weight_path, backend)
+
+
+def sample_image_paths(directory, limit):
+    """Up to `limit` image files under `directory` (recursively), newest first"""
+    paths = []
+    for root, _, files in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(IMAGE_EXTENSIONS))
+    paths.sort(key=os.path.getmtime, reverse=True)
+    return paths[:limit]
+
+
+def iter_images(paths):
+    """Decode images one at a time (unreadable files are skipped)"""
+    for path in paths:
+        image = cv2.imread(path)
+        if image is not None:
+            yield image
+
+
+def letterbox_batch(images, letterbox):
+    """BGR images -> normalized float32 NCHW batch, as the ultralytics predictor feeds the model"""
+    batch = np.stack([letterbox(image=image) for image in images])
+    batch = batch[..., ::-1].transpose(0, 3, 1, 2)  # BGR -> RGB, BHWC -> BCHW
+    return np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+
+
+class ExportedYOLOModel:
+    """YOLO-compatible wrapper around an exported detection graph.
+
+    Pre- and post-processing use ultralytics' own LetterBox, NMS and box scaling,
+    so outputs match the PyTorch predictor; subclasses only run the graph.
+    """
+    backend = None
+
+    def __init__(self, path, metadata):
+        self.path = path
+        self.names = metadata['names']
+        self.imgsz = tuple(metadata.get('imgsz', (640, 640)))
+        self.stride = int(metadata.get('stride', 32))
+        self.max_batch = None  # None: dynamic batch dimension
+        self._letterbox = LetterBox(self.imgsz, auto=False, stride=self.stride)
+
+    def __call__(self, source, verbose=False, conf=0.25, iou=0.7, max_det=300, **kwargs):
+        images = [source] if isinstance(source, np.ndarray) else list(source)
+        step = self.max_batch or len(images) or 1
+
+        results = []
+        for start in range(0, len(images), step):
+            chunk = images[start:start + step]
+            batch = self._preprocess(chunk)
+            begin = time.time()
+            output = self._forward(batch)
+            if verbose:
+                print(f"[{self.backend}] {len(chunk)} image(s) in {(time.time() - begin) * 1000:.1f}ms")
+            results.extend(self._postprocess(output, batch, chunk, conf, iou, max_det))
+        return results
+
+    def _preprocess(self, images):
+        return letterbox_batch(images, self._letterbox)
+
+    def _postprocess(self, output, batch, images, conf, iou, max_det):
+        detections = ops.non_max_suppression(torch.from_numpy(output), conf, iou, max_det=max_det)
+        results = []
+        for det, image in zip(detections, images):
+            det[:, :4] = ops.scale_boxes(batch.shape[2:], det[:, :4], image.shape)
+            results.append(Results(image, path='', names=self.names, boxes=det))
+        return results
+
+    def _forward(self, batch):
+        raise NotImplementedError
+
+    @staticmethod
+    def _parse_metadata(metadata):
+        """Ultralytics stores export metadata as strings (ONNX) or YAML values (OpenVINO)"""
+        parsed = {}
+        for key in ('names', 'imgsz', 'stride'):
+            value = metadata.get(key)
+            if isinstance(value, str):
+                value = ast.literal_eval(value)
+            if value is not None:
+                parsed[key] = value
+        return parsed
+
+
+class OnnxRuntimeModel(ExportedYOLOModel):
+    """ONNX Runtime CPU session with ONNX_* thread and graph optimization settings"""
+    backend = 'onnx'
+
+    GRAPH_OPTIMIZATION = {
+        'disable': 'ORT_DISABLE_ALL',
+        'basic': 'ORT_ENABLE_BASIC',
+        'extended': 'ORT_ENABLE_EXTENDED',
+        'all': 'ORT_ENABLE_ALL',
+    }
+
+    def __init__(self, path):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = settings.ONNX_INTRA_OP_THREADS
+        options.inter_op_num_threads = settings.ONNX_INTER_OP_THREADS
+        options.graph_optimization_level = getattr(
+            ort.GraphOptimizationLevel, self.GRAPH_OPTIMIZATION[settings.ONNX_GRAPH_OPTIMIZATION]
+        )
+        self.session = ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+        super().__init__(path, self._parse_metadata(self.session.get_modelmeta().custom_metadata_map))
+        batch_dim = self.session.get_inputs()[0].shape[0]
+        self.max_batch = batch_dim if isinstance(batch_dim, int) else None
+
+    def _forward(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class OpenVINOModel(ExportedYOLOModel):
+    """OpenVINO IR compiled for OPENVINO_DEVICE with a latency/throughput hint"""
+    backend = 'openvino'
+
+    def __init__(self, path):
+        import openvino as ov
+        import yaml
+
+        core = ov.Core()
+        model = core.read_model(path)
+        config = {'PERFORMANCE_HINT': settings.OPENVINO_PERFORMANCE_HINT}
+        if settings.OPENVINO_THREADS:
+            config['INFERENCE_NUM_THREADS'] = settings.OPENVINO_THREADS
+        self.compiled = core.compile_model(model, settings.OPENVINO_DEVICE, config)
+
+        with open(os.path.join(os.path.dirname(path), 'metadata.yaml')) as f:
+            metadata = yaml.safe_load(f)
+        super().__init__(path, self._parse_metadata(metadata))
+        batch_dim = model.inputs[0].partial_shape[0]
+        self.max_batch = None if batch_dim.is_dynamic else batch_dim.get_length()
+
+    def _forward(self, batch):
+        return self.compiled(batch)[0]
+
+
+def compare_models(reference, candidate, images, conf=0.4, iou=0.5, match_iou=0.9):
+    """Parity report of `candidate` against `reference` on the same images.
+
+    Each reference box is matched greedily to the unmatched candidate box of the
+    same class with the highest IoU (>= match_iou). Also reports per-image latency
+    and, per class id, how many reference boxes the candidate reproduced.
+    """
+    from .yolo_service import YOLOPPEDetector
+
+    report = {
+        'images': 0,
+        'reference_boxes': 0,
+        'candidate_boxes': 0,
+        'matched': 0,
+        'max_confidence_delta': 0.0,
+        'reference_ms': 0.0,
+        'candidate_ms': 0.0,
+        'per_class': {},
+    }
+
+    for image in images:
+        start = time.time()
+        expected = reference(image, verbose=False, conf=conf, iou=iou)[0].boxes.data.cpu().numpy()
+        report['reference_ms'] += (time.time() - start) * 1000
+
+        start = time.time()
+        actual = candidate(image, verbose=False, conf=conf, iou=iou)[0].boxes.data.cpu().numpy()
+        report['candidate_ms'] += (time.time() - start) * 1000
+
+        report['images'] += 1
+        report['reference_boxes'] += len(expected)
+        report['candidate_boxes'] += len(actual)
+        for class_id in expected[:, 5].astype(int).tolist():
+            counts = report['per_class'].setdefault(class_id, {'reference': 0, 'matched': 0})
+            counts['reference'] += 1
+        if not len(expected) or not len(actual):
+            continue
+
+        overlaps = YOLOPPEDetector._iou_matrix(expected[:, :4], actual[:, :4])
+        overlaps[expected[:, 5][:, None] != actual[:, 5][None, :]] = 0
+        taken = np.zeros(len(actual), dtype=bool)
+        for idx in range(len(expected)):
+            candidates = np.where(taken, -1.0, overlaps[idx])
+            best = int(np.argmax(candidates))
+            if candidates[best] >= match_iou:
+                taken[best] = True
+                report['matched'] += 1
+                report['per_class'][int(expected[idx, 5])]['matched'] += 1
+                report['max_confidence_delta'] = max(
+                    report['max_confidence_delta'], float(abs(expected[idx, 4] - actual[best, 4]))
+                )
+
+    images_run = max(report['images'], 1)
+    report['reference_ms'] = round(report['reference_ms'] / images_run, 1)
+    report['candidate_ms'] = round(report['candidate_ms'] / images_run, 1)
+    report['match_rate'] = report['matched'] / report['reference_boxes'] if report['reference_boxes'] else 1.0
+    report['speedup'] = round(report['reference_ms'] / report['candidate_ms'], 2) if report['candidate_ms'] else 0.0
+    return report
+
+
+def quantize_model(onnx_path, calibration_paths, output_path, imgsz=640, method='minmax'):
+    """Post-training static INT8 quantization of an exported ONNX model.
+
+    Activation ranges are calibrated on `calibration_paths` (our own uploads, so the
+    ranges match site imagery). Weights are quantized per channel (QDQ format); the
+    Detect head (the last `/model.N/` block) stays FP32 because box regression and
+    class scores are the most sensitive to quantization error.
+    """
+    import onnx
+    import onnxruntime as ort
+    from onnxruntime.quantization import (
+        CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType, quantize_static
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    class CalibrationReader(CalibrationDataReader):
+        """Sample images, decoded and preprocessed one at a time"""
+
+        def __init__(self, input_name):
+            self.input_name = input_name
+            self.letterbox = LetterBox((imgsz, imgsz), auto=False)
+            self.images = iter_images(calibration_paths)
+
+        def get_next(self):
+            image = next(self.images, None)
+            if image is None:
+                return None
+            return {self.input_name: letterbox_batch([image], self.letterbox)}
+
+    methods = {
+        'minmax': CalibrationMethod.MinMax,
+        'entropy': CalibrationMethod.Entropy,
+        'percentile': CalibrationMethod.Percentile,
+    }
+
+    prepared_path = f'{os.path.splitext(output_path)[0]}.prep.onnx'
+    quant_pre_process(onnx_path, prepared_path)
+    try:
+        nodes = onnx.load(prepared_path).graph.node
+        blocks = [int(match.group(1)) for match in (re.match(r'/model\.(\d+)/', node.name) for node in nodes) if match]
+        head = f'/model.{max(blocks)}/' if blocks else None
+        exclude = [node.name for node in nodes if head and node.name.startswith(head)]
+
+        input_name = ort.InferenceSession(
+            prepared_path, providers=['CPUExecutionProvider']
+        ).get_inputs()[0].name
+
+        quantize_static(
+            prepared_path, output_path, CalibrationReader(input_name),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+            calibrate_method=methods[method],
+            nodes_to_exclude=exclude,
+        )
+    finally:
+        if os.path.exists(prepared_path):
+            os.remove(prepared_path)
+
+    # Keep the ultralytics metadata (class names, imgsz, stride) OnnxRuntimeModel reads
+    original = onnx.load(onnx_path)
+    quantized = onnx.load(output_path)
+    onnx.helper.set_model_props(quantized, {prop.key: prop.value for prop in original.metadata_props})
+    onnx.save(quantized, output_path)
+    return output_path
+
+
+def evaluate_labelled(model_path, data, imgsz=640):
+    """mAP and per-class recall of a .pt or .onnx model on a labelled YOLO dataset (data.yaml)"""
+    metrics = YOLO(model_path, task='detect').val(
+        data=data, imgsz=imgsz, batch=1, plots=False, verbose=False
+    )
+    per_class = {}
+    for idx, class_id in enumerate(metrics.box.ap_class_index.tolist()):
+        precision, recall, ap50, ap = metrics.box.class_result(idx)
+        per_class[metrics.names[class_id]] = {
+            'precision': round(float(precision), 4),
+            'recall': round(float(recall), 4),
+            'ap50': round(float(ap50), 4),
+        }
+    return {
+        'map50': round(float(metrics.box.map50), 4),
+        'map50_95': round(float(metrics.box.map), 4),
+        'per_class': per_class,
+    }
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import time
+from urllib.parse import parse_qs
+
+import cv2
+import numpy as np
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+
+from .streaming import frame_metrics, encode_jpeg
+from .yolo_service import get_detector
+
+
+class DetectionConsumer(AsyncWebsocketConsumer):
+    """Real-time detection over one persistent WebSocket.
+
+    The client sends binary JPEG frames and receives a JSON metrics message per
+    processed frame, followed by the annotated JPEG as a binary message when
+    annotation is on (?annotate=1 or {"annotate": true}). Only the newest frame
+    is kept: frames that arrive while inference is running replace the pending
+    one and are counted as dropped.
+    """
+
+    async def connect(self):
+        params = parse_qs(self.scope.get('query_string', b'').decode())
+        self.user = await self._authenticate(params.get('token', [None])[0])
+        if self.user is None:
+            await self.close(code=4401)
+            return
+
+        self.annotate = params.get('annotate', ['0'])[0].lower() in ('1', 'true', 'yes')
+        self.pending_frame = None
+        self.frame_ready = asyncio.Event()
+        self.received = 0
+        self.dropped = 0
+        self.processed = 0
+
+        await self.accept()
+        self.worker = asyncio.create_task(self._process_frames())
+        print(f"[WS] {self.user.username} connected (annotate={self.annotate})")
+
+    async def disconnect(self, code):
+        worker = getattr(self, 'worker', None)
+        if worker is not None:
+            worker.cancel()
+        if getattr(self, 'user', None) is not None:
+            print(f"[WS] {self.user.username} disconnected: {self.processed} processed, {self.dropped} dropped")
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if bytes_data:
+            self.received += 1
+            if self.pending_frame is not None:
+                self.dropped += 1
+            self.pending_frame = bytes_data
+            self.frame_ready.set()
+            return
+
+        if text_data:
+            try:
+                message = json.loads(text_data)
+            except ValueError:
+                await self.send(text_data=json.dumps({'error': 'Invalid JSON'}))
+                return
+            if 'annotate' in message:
+                self.annotate = bool(message['annotate'])
+
+    async def _process_frames(self):
+        while True:
+            await self.frame_ready.wait()
+            self.frame_ready.clear()
+
+            frame_bytes, self.pending_frame = self.pending_frame, None
+            if frame_bytes is None:
+                continue
+
+            try:
+                # thread_sensitive=False: inference runs on a pool thread, not the shared sync thread
+                metrics, annotated = await sync_to_async(self._detect, thread_sensitive=False)(
+                    frame_bytes, self.annotate
+                )
+            except Exception as e:
+                await self.send(text_data=json.dumps({'error': str(e)}))
+                continue
+
+            self.processed += 1
+            metrics.update({
+                'frames_received': self.received,
+                'frames_dropped': self.dropped,
+            })
+            await self.send(text_data=json.dumps(metrics))
+            if annotated is not None:
+                await self.send(bytes_data=annotated)
+
+    @staticmethod
+    def _detect(frame_bytes, annotate):
+        frame = cv2.imdecode(np.frombuffer(frame_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError('Invalid image data')
+
+        start_time = time.time()
+        result = get_detector(settings.STREAM_DETECTOR_MODE).detect_frame(frame)
+        metrics = frame_metrics(result, time.time() - start_time)
+        metrics['persons'] = result.get('persons', [])
+
+        annotated = None
+        if annotate:
+            annotated = encode_jpeg(result['results'].plot(), 85)
+        return metrics, annotated
+
+    @database_sync_to_async
+    def _authenticate(self, token_key):
+        if not token_key:
+            return None
+        from rest_framework.authtoken.models import Token
+        try:
+            return Token.objects.select_related('user').get(key=token_key).user
+        except Token.DoesNotExist:
+            return None
@@ -0,0 +1,188 @@
+import csv
+import io
+import json
+from datetime import timedelta
+from itertools import islice
+
+from analytics.statistics import day_start
+
+from .models import Violation
+
+
+# (column, ORM lookup) - read with values_list so rows never become model instances
+VIOLATION_EXPORT_COLUMNS = [
+    ('violation_id', 'id'),
+    ('created_at', 'created_at'),
+    ('violation_type', 'violation_type'),
+    ('severity', 'severity'),
+    ('status', 'status'),
+    ('osha_standard', 'osha_standard'),
+    ('description', 'description'),
+    ('detection_id', 'detection_id'),
+    ('detected_at', 'detection__created_at'),
+    ('site_id', 'detection__site_id'),
+    ('site_name', 'detection__site__name'),
+    ('person_id', 'person_detection__person_id'),
+    ('person_confidence', 'person_detection__confidence'),
+    ('missing_ppe', 'person_detection__missing_ppe'),
+    ('acknowledged_at', 'acknowledged_at'),
+    ('resolved_at', 'resolved_at'),
+]
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+EXPORT_CHUNK_SIZE = 5000
+
+
+def violation_export_queryset(user, filters):
+    """A user's violations for export, newest first.
+
+    filters: site, start_date / end_date (local dates, inclusive, on the violation
+    time), severity and status (lists). Raises ValueError for unknown values.
+    """
+    violations = Violation.objects.filter(detection__user=user)
+    if filters.get('site'):
+        violations = violations.filter(detection__site_id=filters['site'])
+    if filters.get('start_date'):
+        violations = violations.filter(created_at__gte=day_start(filters['start_date']))
+    if filters.get('end_date'):
+        violations = violations.filter(created_at__lt=day_start(filters['end_date'] + timedelta(days=1)))
+
+    for name, choices in (('severity', Violation.SEVERITY_CHOICES), ('status', Violation.STATUS_CHOICES)):
+        values = filters.get(name)
+        if not values:
+            continue
+        unknown = set(values) - {value for value, _ in choices}
+        if unknown:
+            raise ValueError(f"Unknown {name}: {', '.join(sorted(unknown))}")
+        violations = violations.filter(**{f'{name}__in': values})
+
+    return violations.order_by('-created_at').values_list(*[lookup for _, lookup in VIOLATION_EXPORT_COLUMNS])
+
+
+def _chunks(queryset, chunk_size):
+    # .iterator() streams from a server-side cursor on PostgreSQL instead of caching the result
+    rows = queryset.iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class _Echo:
+    """File-like object for csv.writer that hands back each formatted line"""
+
+    def write(self, value):
+        return value
+
+
+def _json_value(value):
+    # datetimes as ISO 8601, UUIDs as strings
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+def _text_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return ';'.join(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def stream_csv(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([name for name, _ in VIOLATION_EXPORT_COLUMNS])
+    for chunk in _chunks(queryset, chunk_size):
+        yield ''.join(writer.writerow([_text_value(value) for value in row]) for row in chunk)
+
+
+def stream_ndjson(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    names = [name for name, _ in VIOLATION_EXPORT_COLUMNS]
+    for chunk in _chunks(queryset, chunk_size):
+        yield ''.join(
+            json.dumps(dict(zip(names, row)), default=_json_value) + '\n'
+            for row in chunk
+        )
+
+
+class _ByteSink(io.RawIOBase):
+    """Write-only sink that collects what the Parquet writer emits until drained"""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet_schema():
+    """Arrow schema of the Parquet export (pyarrow is imported lazily)"""
+    import pyarrow as pa
+
+    timestamp = pa.timestamp('us', tz='UTC')
+    types = {
+        'violation_id': pa.int64(),
+        'created_at': timestamp,
+        'detection_id': pa.string(),
+        'detected_at': timestamp,
+        'site_id': pa.int64(),
+        'person_id': pa.int32(),
+        'person_confidence': pa.float64(),
+        'missing_ppe': pa.list_(pa.string()),
+        'acknowledged_at': timestamp,
+        'resolved_at': timestamp,
+    }
+    return pa.schema([(name, types.get(name, pa.string())) for name, _ in VIOLATION_EXPORT_COLUMNS])
+
+
+def stream_parquet(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """One Parquet row group per chunk; each is yielded as soon as it is written"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema()
+    sink = _ByteSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    try:
+        for chunk in _chunks(queryset, chunk_size):
+            arrays = []
+            for column, field in zip(zip(*chunk), schema):
+                if field.name == 'detection_id':
+                    column = [str(value) for value in column]
+                arrays.append(pa.array(column, type=field.type))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def stream_violations(queryset, export_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """Generator of encoded export chunks for a StreamingHttpResponse"""
+    if export_format == 'parquet':
+        return stream_parquet(queryset, chunk_size)
+    if export_format == 'ndjson':
+        return stream_ndjson(queryset, chunk_size)
+    return stream_csv(queryset, chunk_size)
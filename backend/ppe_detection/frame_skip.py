@@ -0,0 +1,116 @@
+import math
+import time
+
+import cv2
+import numpy as np
+from django.conf import settings
+
+
+# Motion is measured on a small grayscale thumbnail
+MOTION_THUMBNAIL_SIZE = (64, 36)
+
+
+class AdaptiveFrameSkipper:
+    """Decides which source frames get inference, shared by every streaming path.
+
+    The stride (analyse one of every `stride` source frames) is the smallest that
+    lets inference keep up with the source at FRAME_SKIP_UTILIZATION, i.e.
+    latency x source FPS / utilization. While the measured end-to-end latency is
+    above the target the stride is raised one step per update, and lowered again
+    once it is back under. With a motion threshold > 0, a frame that is due is
+    still skipped when it barely differs from the last analysed frame, for at
+    most FRAME_SKIP_MAX_IDLE seconds of source time.
+    """
+
+    def __init__(self, source_fps=None, target_latency=None, min_stride=1, max_stride=None,
+                 motion_threshold=None, smoothing=0.2):
+        self.fixed_fps = bool(source_fps)
+        self.source_fps = float(source_fps or 0.0)
+        self.target_latency = settings.FRAME_SKIP_TARGET_LATENCY if target_latency is None else target_latency
+        self.min_stride = max(1, int(min_stride))
+        self.max_stride = max(self.min_stride, max_stride or settings.FRAME_SKIP_MAX_STRIDE)
+        self.motion_threshold = settings.FRAME_SKIP_MOTION_THRESHOLD if motion_threshold is None else motion_threshold
+        self.smoothing = smoothing
+
+        self.stride = self.min_stride
+        self.latency = None
+        self.end_to_end = None
+        self.backoff = 0
+        self.frames_seen = 0
+        self.frames_processed = 0
+        self.motion_skipped = 0
+        self.started = time.monotonic()
+        self._since_processed = 0
+        self._last_observed = None
+        self._last_thumbnail = None
+
+    def observe_frames(self, count=1):
+        """Account for `count` new source frames (estimates the source FPS when it is not fixed)"""
+        now = time.monotonic()
+        if not self.fixed_fps and count and self._last_observed is not None and now > self._last_observed:
+            fps = count / (now - self._last_observed)
+            self.source_fps = fps if not self.source_fps else self._ema(self.source_fps, fps)
+        if count:
+            self._last_observed = now
+        self.frames_seen += count
+        self._since_processed += count
+
+    def should_process(self, frame=None, frames=1):
+        """Per-frame paths: call for every frame received (`frames` source frames since the last call)"""
+        self.observe_frames(frames)
+        if self._since_processed < self.stride:
+            return False
+        return self.motion_gate(frame)
+
+    def motion_gate(self, frame):
+        """True if a due frame should be analysed (moved, idle for too long, or gating off)"""
+        thumbnail = None
+        if self.motion_threshold > 0 and frame is not None:
+            thumbnail = cv2.cvtColor(
+                cv2.resize(frame, MOTION_THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY
+            )
+            max_idle_frames = max(self.stride, self.source_fps * settings.FRAME_SKIP_MAX_IDLE)
+            if (self._last_thumbnail is not None and self._since_processed < max_idle_frames and
+                    float(np.mean(cv2.absdiff(thumbnail, self._last_thumbnail))) < self.motion_threshold):
+                self.motion_skipped += 1
+                return False
+
+        self._last_thumbnail = thumbnail
+        self._since_processed = 0
+        self.frames_processed += 1
+        return True
+
+    def record(self, latency, end_to_end=None):
+        """Feed back one inference's latency (and capture-to-result latency if known), in seconds"""
+        self.latency = latency if self.latency is None else self._ema(self.latency, latency)
+        if end_to_end is not None:
+            self.end_to_end = end_to_end if self.end_to_end is None else self._ema(self.end_to_end, end_to_end)
+            if self.target_latency > 0 and self.end_to_end > self.target_latency:
+                self.backoff = min(self.backoff + 1, self.max_stride)
+            elif self.backoff:
+                self.backoff -= 1
+
+        keep_up = 1
+        if self.source_fps:
+            keep_up = math.ceil(self.latency * self.source_fps / settings.FRAME_SKIP_UTILIZATION)
+        self.stride = int(min(self.max_stride, max(self.min_stride, keep_up + self.backoff)))
+
+    @property
+    def interval(self):
+        """Seconds of source time between analysed frames at the current stride"""
+        return self.stride / self.source_fps if self.source_fps else 0.0
+
+    def metrics(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        return {
+            'stride': self.stride,
+            'source_fps': round(self.source_fps, 2),
+            'inference_fps': round(self.frames_processed / elapsed, 2),
+            'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+            'end_to_end_ms': round(self.end_to_end * 1000, 1) if self.end_to_end is not None else None,
+            'motion_gate': self.motion_threshold > 0,
+            'motion_skipped': self.motion_skipped,
+        }
+
+    def _ema(self, current, value):
+        return (1 - self.smoothing) * current + self.smoothing * value
@@ -0,0 +1,203 @@
+import threading
+import time
+
+from django.conf import settings
+
+from .frame_skip import AdaptiveFrameSkipper
+from .streaming import rtsp_manager, frame_metrics
+from .yolo_service import get_detector
+
+
+class CameraIngestService:
+    """Decodes every registered RTSP camera and feeds a bounded inference scheduler.
+
+    Each camera has a decode thread (RTSPCameraManager) that only keeps the newest
+    frame. A fixed pool of INFERENCE_WORKERS threads serves the cameras round-robin,
+    each camera at most at its target FPS (or slower when its AdaptiveFrameSkipper
+    asks for a larger stride), and batches frames from different cameras into one
+    model call (up to INFERENCE_BATCH_SIZE). Frames the motion gate rejects skip
+    inference. Results go to the camera's on_result(frame, result, metrics) callback.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance.cameras = {}
+                    cls._instance.workers = []
+                    cls._instance.cursor = 0
+                    cls._instance.wakeup = threading.Event()
+        return cls._instance
+
+    def add_camera(self, camera_id, rtsp_url, on_result, target_fps=None):
+        """Start decoding a camera and schedule it for inference; False if it cannot be opened"""
+        if not rtsp_manager.get_stream(camera_id, rtsp_url):
+            return False
+
+        target_fps = target_fps or settings.CAMERA_TARGET_FPS
+        with self._lock:
+            self.cameras[camera_id] = {
+                'url': rtsp_url,
+                'on_result': on_result,
+                'target_fps': float(target_fps),
+                'next_due': 0.0,
+                'in_flight': False,
+                'frame_skipper': AdaptiveFrameSkipper(),
+                'last_seq': 0,
+                'taken': 0,
+                'processed': 0,
+                'errors': 0,
+                'lag_ms': 0.0,
+                'inference_ms': 0.0,
+                'added_at': time.monotonic(),
+            }
+            self._start_workers()
+        print(f"[INGEST] Camera {camera_id} added at {target_fps} FPS ({len(self.cameras)} camera(s))")
+        self.wakeup.set()
+        return True
+
+    def remove_camera(self, camera_id):
+        with self._lock:
+            self.cameras.pop(camera_id, None)
+        rtsp_manager.release_stream(camera_id)
+        print(f"[INGEST] Camera {camera_id} removed ({len(self.cameras)} camera(s))")
+
+    def stats(self):
+        """Per-camera counters: target/effective FPS, lag, inference time, dropped frames"""
+        now = time.monotonic()
+        stats = {}
+        with self._lock:
+            for camera_id, state in self.cameras.items():
+                capture = rtsp_manager.streams.get(camera_id)
+                decoded = capture.frames_decoded if capture else 0
+                uptime = max(now - state['added_at'], 1e-6)
+                stats[camera_id] = {
+                    'target_fps': state['target_fps'],
+                    'effective_fps': round(state['processed'] / uptime, 2),
+                    'frames_decoded': decoded,
+                    'frames_processed': state['processed'],
+                    # Decoded frames that were overwritten before the scheduler took them
+                    'frames_dropped': max(0, decoded - state['taken']),
+                    'lag_ms': round(state['lag_ms'], 1),
+                    'inference_ms': round(state['inference_ms'], 1),
+                    'errors': state['errors'],
+                    'reconnects': capture.reconnects if capture else 0,
+                    'frame_skip': state['frame_skipper'].metrics(),
+                }
+        return {
+            'workers': len(self.workers),
+            'batch_size': settings.INFERENCE_BATCH_SIZE,
+            'cameras': stats,
+        }
+
+    def _start_workers(self):
+        # Called with self._lock held
+        if self.workers:
+            return
+        for idx in range(max(1, settings.INFERENCE_WORKERS)):
+            thread = threading.Thread(target=self._worker_loop, name=f'inference-worker-{idx}', daemon=True)
+            thread.start()
+            self.workers.append(thread)
+
+    def _claim_batch(self):
+        """Take the newest frame from up to INFERENCE_BATCH_SIZE due cameras, round-robin.
+
+        Returns (batch, seconds until the next camera is due).
+        """
+        now = time.monotonic()
+        batch = []
+        next_wait = 0.05
+
+        with self._lock:
+            camera_ids = list(self.cameras)
+            count = len(camera_ids)
+            scanned = 0
+            for offset in range(count):
+                scanned = offset + 1
+                camera_id = camera_ids[(self.cursor + offset) % count]
+                state = self.cameras[camera_id]
+                if state['in_flight']:
+                    continue
+                if now < state['next_due']:
+                    next_wait = min(next_wait, state['next_due'] - now)
+                    continue
+
+                item = rtsp_manager.take_latest_frame(camera_id, after_seq=state['last_seq'])
+                if item is None:
+                    continue
+
+                seq, captured_at, frame = item
+                frame_skipper = state['frame_skipper']
+                frame_skipper.observe_frames(seq - state['last_seq'])
+                state['last_seq'] = seq
+                state['in_flight'] = True
+                state['taken'] += 1
+                state['next_due'] = now + max(1.0 / state['target_fps'], frame_skipper.interval)
+                batch.append((camera_id, state, captured_at, frame))
+                if len(batch) >= settings.INFERENCE_BATCH_SIZE:
+                    break
+
+            # Next claim starts after the last camera we looked at
+            if count:
+                self.cursor = (self.cursor + scanned) % count
+
+        return batch, max(next_wait, 0.002)
+
+    def _motion_gate(self, batch):
+        """Drop claimed frames whose camera saw no motion since its last analysed frame"""
+        kept = []
+        for item in batch:
+            state = item[1]
+            if state['frame_skipper'].motion_gate(item[3]):
+                kept.append(item)
+            else:
+                with self._lock:
+                    state['in_flight'] = False
+        return kept
+
+    def _worker_loop(self):
+        detector = get_detector(settings.STREAM_DETECTOR_MODE)
+        while True:
+            batch, wait = self._claim_batch()
+            batch = self._motion_gate(batch)
+            if not batch:
+                self.wakeup.wait(wait)
+                self.wakeup.clear()
+                continue
+
+            start = time.time()
+            try:
+                results = detector.detect_frames([frame for _, _, _, frame in batch])
+            except Exception as e:
+                print(f"[INGEST] Inference error: {e}")
+                results = [None] * len(batch)
+            elapsed = time.time() - start
+
+            for (camera_id, state, captured_at, frame), result in zip(batch, results):
+                with self._lock:
+                    state['in_flight'] = False
+                    if result is None:
+                        state['errors'] += 1
+                        continue
+                    state['processed'] += 1
+                    state['inference_ms'] = elapsed * 1000
+                    state['lag_ms'] = (time.time() - captured_at) * 1000
+                    state['frame_skipper'].record(elapsed, end_to_end=state['lag_ms'] / 1000)
+
+                metrics = {
+                    **frame_metrics(result, elapsed),
+                    'camera_id': camera_id,
+                    'lag_ms': round(state['lag_ms'], 1),
+                    'batch_size': len(batch),
+                    **state['frame_skipper'].metrics(),
+                }
+                try:
+                    state['on_result'](frame, result, metrics)
+                except Exception as e:
+                    print(f"[INGEST] Camera {camera_id} publish error: {e}")
+
+
+camera_ingest = CameraIngestService()
@@ -0,0 +1,116 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction, close_old_connections
+from django.utils import timezone
+
+from .models import Detection
+from .services import run_detection, run_detection_batch
+
+
+class DetectionWorkerPool:
+    """Local worker threads that drain 'pending' Detection rows.
+
+    The detections table is the queue: workers claim the oldest pending row with
+    SELECT ... FOR UPDATE SKIP LOCKED, so several processes (gunicorn workers or the
+    run_detection_workers command) can share it without a broker.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance.threads = []
+                    cls._instance.wakeup = threading.Event()
+        return cls._instance
+
+    def start(self, concurrency=None):
+        """Start the worker threads once per process"""
+        concurrency = settings.DETECTION_WORKERS if concurrency is None else concurrency
+        with self._lock:
+            if self.threads or concurrency <= 0:
+                return
+
+            self.requeue_stale()
+            for idx in range(concurrency):
+                thread = threading.Thread(
+                    target=self._worker_loop,
+                    name=f'detection-worker-{idx}',
+                    daemon=True
+                )
+                thread.start()
+                self.threads.append(thread)
+            print(f"[JOBS] Started {concurrency} detection worker(s)")
+
+    def enqueue(self):
+        """Wake a worker after a pending detection was committed"""
+        self.start()
+        self.wakeup.set()
+
+    def requeue_stale(self):
+        """Put back detections left in 'processing' by a worker that died"""
+        cutoff = timezone.now() - timedelta(seconds=settings.DETECTION_JOB_TIMEOUT)
+        count = Detection.objects.filter(
+            status='processing', updated_at__lt=cutoff
+        ).update(status='pending')
+        if count:
+            print(f"[JOBS] Requeued {count} stale detection(s)")
+        return count
+
+    def claim_batch(self, limit=1):
+        """Atomically move up to `limit` of the oldest pending detections to 'processing'"""
+        with transaction.atomic():
+            detections = list(
+                Detection.objects.select_for_update(skip_locked=True)
+                .filter(status='pending')
+                .order_by('created_at')[:limit]
+            )
+            if not detections:
+                return []
+
+            Detection.objects.filter(pk__in=[d.pk for d in detections]).update(
+                status='processing', updated_at=timezone.now()
+            )
+            for detection in detections:
+                detection.status = 'processing'
+        return detections
+
+    def run_once(self):
+        """Process one batch of pending detections; returns False when the queue is empty"""
+        close_old_connections()
+        try:
+            detections = self.claim_batch(settings.DETECTION_BATCH_SIZE)
+            if not detections:
+                return False
+
+            start = time.time()
+            if len(detections) == 1:
+                try:
+                    run_detection(detections[0])
+                except Exception as e:
+                    print(f"[JOBS] Detection {detections[0].id} failed: {e}")
+            else:
+                run_detection_batch(detections)
+            print(f"[JOBS] {len(detections)} detection(s) processed in {time.time() - start:.2f}s")
+            return True
+        finally:
+            close_old_connections()
+
+    def _worker_loop(self):
+        while True:
+            try:
+                if self.run_once():
+                    continue
+            except Exception as e:
+                print(f"[JOBS] Worker error: {e}")
+
+            self.wakeup.wait(settings.DETECTION_JOB_POLL_INTERVAL)
+            self.wakeup.clear()
+
+
+detection_workers = DetectionWorkerPool()
@@ -0,0 +1,70 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ppe_detection.backends import (
+    compare_models, export_model, iter_images, load_inference_model, sample_image_paths
+)
+from ppe_detection.yolo_service import get_detector
+
+
+class Command(BaseCommand):
+    help = 'Export the detector weights for the ONNX Runtime / OpenVINO inference backends and check parity with PyTorch'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backend', choices=['onnx', 'openvino'], action='append',
+            help='Backend to export for (repeatable; default: INFERENCE_BACKEND, or onnx)'
+        )
+        parser.add_argument('--imgsz', type=int, default=640, help='Export image size (default: 640)')
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Compare the exported model against the PyTorch weights on sample images'
+        )
+        parser.add_argument(
+            '--images', default=os.path.join(settings.MEDIA_ROOT, 'uploads'),
+            help='Directory of sample images for --check (default: MEDIA_ROOT/uploads)'
+        )
+        parser.add_argument('--samples', type=int, default=50, help='Max sample images for --check')
+        parser.add_argument(
+            '--min-match', type=float, default=0.95,
+            help='Fail when fewer than this fraction of PyTorch boxes are reproduced (default: 0.95)'
+        )
+
+    def handle(self, *args, **options):
+        backends = options['backend'] or [
+            settings.INFERENCE_BACKEND if settings.INFERENCE_BACKEND != 'torch' else 'onnx'
+        ]
+        detector = get_detector()
+        weight_paths = list(dict.fromkeys([detector.image_model_path, detector.video_model_path]))
+
+        image_paths = []
+        if options['check']:
+            image_paths = sample_image_paths(options['images'], options['samples'])
+            if not image_paths:
+                raise CommandError(f"No sample images found in {options['images']}")
+
+        failed = []
+        for weight_path in weight_paths:
+            for backend in backends:
+                path = export_model(weight_path, backend, imgsz=options['imgsz'])
+                self.stdout.write(self.style.SUCCESS(f'Exported {os.path.basename(weight_path)} -> {path}'))
+                if not image_paths:
+                    continue
+
+                reference, _ = load_inference_model(weight_path, 'torch')
+                candidate, _ = load_inference_model(weight_path, backend)
+                for label, conf in (('image', settings.DETECTION_IMAGE_CONF), ('video', settings.DETECTION_FRAME_CONF)):
+                    report = compare_models(reference, candidate, iter_images(image_paths), conf=conf, iou=settings.DETECTION_IOU)
+                    self.stdout.write(
+                        f"  {backend} @ conf={conf} ({label}): {report['matched']}/{report['reference_boxes']} boxes matched "
+                        f"({report['match_rate']:.1%}), {report['candidate_boxes']} predicted, "
+                        f"max confidence delta {report['max_confidence_delta']:.3f}, "
+                        f"{report['reference_ms']}ms -> {report['candidate_ms']}ms ({report['speedup']}x)"
+                    )
+                    if report['match_rate'] < options['min_match']:
+                        failed.append(f'{os.path.basename(weight_path)} ({backend}, {label})')
+
+        if failed:
+            raise CommandError(f"Parity check failed for: {', '.join(failed)}")
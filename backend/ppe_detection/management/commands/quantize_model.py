@@ -0,0 +1,162 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ppe_detection.backends import (
+    OnnxRuntimeModel, compare_models, evaluate_labelled, export_model, exported_path,
+    iter_images, load_inference_model, quantize_model, sample_image_paths
+)
+from ppe_detection.yolo_service import get_detector
+
+
+class Command(BaseCommand):
+    help = (
+        'Build INT8 models (INFERENCE_BACKEND onnx_int8 / the "quantized" detector mode) by static '
+        'calibration on uploaded images, and only install them if violation recall does not drop'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--images', default=os.path.join(settings.MEDIA_ROOT, 'uploads'),
+            help='Directory of sample images (default: MEDIA_ROOT/uploads)'
+        )
+        parser.add_argument(
+            '--samples', type=int, default=400,
+            help='Sample images; half calibrate, the other half are held out for the FP32 comparison'
+        )
+        parser.add_argument(
+            '--data', help='Labelled YOLO dataset (e.g. PPEs-7/data.yaml) for mAP and per-class recall'
+        )
+        parser.add_argument('--imgsz', type=int, default=640)
+        parser.add_argument('--method', choices=['minmax', 'entropy', 'percentile'], default='minmax')
+        parser.add_argument(
+            '--max-recall-drop', type=float, default=0.0,
+            help='Allowed drop in labelled recall for QUANTIZATION_GATE_CLASSES (default: 0)'
+        )
+        parser.add_argument(
+            '--min-match', type=float, default=0.95,
+            help='Min fraction of FP32 gate-class boxes the INT8 model must reproduce on held-out uploads'
+        )
+
+    def handle(self, *args, **options):
+        paths = sample_image_paths(options['images'], options['samples'])
+        if len(paths) < 2:
+            raise CommandError(f"Need at least 2 sample images in {options['images']}")
+        calibration_paths, held_out_paths = paths[::2], paths[1::2]
+
+        detector = get_detector()
+        weight_paths = list(dict.fromkeys([detector.image_model_path, detector.video_model_path]))
+
+        failed = []
+        for weight_path in weight_paths:
+            name = os.path.basename(weight_path)
+            onnx_path = exported_path(weight_path, 'onnx')
+            if not os.path.exists(onnx_path):
+                export_model(weight_path, 'onnx', imgsz=options['imgsz'])
+
+            target_path = exported_path(weight_path, 'onnx_int8')
+            candidate_path = target_path.replace('.onnx', '.candidate.onnx')
+            self.stdout.write(f'{name}: calibrating on {len(calibration_paths)} image(s) ({options["method"]})')
+            quantize_model(
+                onnx_path, calibration_paths, candidate_path, imgsz=options['imgsz'], method=options['method']
+            )
+
+            report = self.evaluate(weight_path, candidate_path, held_out_paths, options)
+            report.update({
+                'weights': name,
+                'method': options['method'],
+                'calibration_images': len(calibration_paths),
+            })
+            report['regressions'] = self.gate(report, options)
+            with open(target_path.replace('.onnx', '.report.json'), 'w') as f:
+                json.dump(report, f, indent=2)
+            self.print_report(report)
+
+            if report['regressions']:
+                failed.append(name)
+                self.stdout.write(self.style.ERROR(
+                    f'{name}: INT8 model NOT installed, kept at {candidate_path} for inspection'
+                ))
+                continue
+
+            # Model registry picks the new file up through its mtime/hash check
+            os.replace(candidate_path, target_path)
+            self.stdout.write(self.style.SUCCESS(f'{name}: installed {target_path}'))
+
+        if failed:
+            raise CommandError(f"Violation recall regressed for: {', '.join(failed)}")
+
+    def evaluate(self, weight_path, candidate_path, held_out_paths, options):
+        """FP32 vs INT8: agreement on held-out uploads at the image threshold, plus labelled metrics"""
+        candidate = OnnxRuntimeModel(candidate_path)
+        reference, _ = load_inference_model(weight_path, 'torch')
+        agreement = compare_models(
+            reference, candidate, iter_images(held_out_paths),
+            conf=settings.DETECTION_IMAGE_CONF, iou=settings.DETECTION_IOU
+        )
+        agreement['per_class'] = {
+            candidate.names.get(class_id, str(class_id)): counts
+            for class_id, counts in agreement['per_class'].items()
+        }
+        agreement['held_out_images'] = len(held_out_paths)
+
+        report = {'agreement': agreement}
+        if options['data']:
+            report['fp32'] = evaluate_labelled(weight_path, options['data'], imgsz=options['imgsz'])
+            report['int8'] = evaluate_labelled(candidate_path, options['data'], imgsz=options['imgsz'])
+        return report
+
+    def gate(self, report, options):
+        """Reasons the INT8 model must not ship (empty list = pass).
+
+        A gate class the held-out uploads never show (no FP32 boxes) and that --data
+        does not label either is a failure: an unmeasured class is not a passing one.
+        """
+        regressions = []
+        for class_name in settings.QUANTIZATION_GATE_CLASSES:
+            counts = report['agreement']['per_class'].get(class_name)
+            has_reference = bool(counts and counts['reference'])
+            if has_reference and counts['matched'] / counts['reference'] < options['min_match']:
+                regressions.append(
+                    f"{class_name}: reproduced {counts['matched']}/{counts['reference']} FP32 boxes on held-out uploads"
+                )
+
+            fp32 = report['fp32']['per_class'].get(class_name) if 'fp32' in report else None
+            if fp32:
+                int8 = report['int8']['per_class'].get(class_name, {'recall': 0.0})
+                if int8['recall'] < fp32['recall'] - options['max_recall_drop']:
+                    regressions.append(f"{class_name}: recall {fp32['recall']:.3f} -> {int8['recall']:.3f}")
+
+            if not has_reference and not fp32:
+                regressions.append(
+                    f"{class_name}: no evidence (no FP32 boxes on held-out uploads"
+                    f"{' and not in the labelled set' if 'fp32' in report else '; pass --data to measure it'})"
+                )
+        return regressions
+
+    def print_report(self, report):
+        agreement = report['agreement']
+        self.stdout.write(
+            f"  held-out agreement: {agreement['matched']}/{agreement['reference_boxes']} FP32 boxes "
+            f"({agreement['match_rate']:.1%}), {agreement['reference_ms']}ms -> {agreement['candidate_ms']}ms "
+            f"({agreement['speedup']}x)"
+        )
+        for class_name, counts in sorted(agreement['per_class'].items()):
+            marker = ' *' if class_name in settings.QUANTIZATION_GATE_CLASSES else ''
+            self.stdout.write(f"    {class_name:<16} {counts['matched']}/{counts['reference']}{marker}")
+
+        if 'fp32' in report:
+            fp32, int8 = report['fp32'], report['int8']
+            self.stdout.write(
+                f"  mAP50 {fp32['map50']:.3f} -> {int8['map50']:.3f}, "
+                f"mAP50-95 {fp32['map50_95']:.3f} -> {int8['map50_95']:.3f}"
+            )
+            for class_name, metrics in sorted(fp32['per_class'].items()):
+                marker = ' *' if class_name in settings.QUANTIZATION_GATE_CLASSES else ''
+                recall = int8['per_class'].get(class_name, {'recall': 0.0})['recall']
+                self.stdout.write(f"    {class_name:<16} recall {metrics['recall']:.3f} -> {recall:.3f}{marker}")
+
+        for reason in report['regressions']:
+            self.stdout.write(self.style.WARNING(f'  regression: {reason}'))
@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ppe_detection.jobs import detection_workers
+
+
+class Command(BaseCommand):
+    help = 'Run detection job workers that process pending uploads from the database queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.DETECTION_WORKERS,
+            help='Number of worker threads (default: DETECTION_WORKERS)'
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        detection_workers.start(concurrency=concurrency)
+        self.stdout.write(self.style.SUCCESS(f'Detection workers running ({concurrency}). Press Ctrl+C to stop.'))
+
+        try:
+            while True:
+                time.sleep(60)
+                detection_workers.requeue_stale()
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping detection workers')
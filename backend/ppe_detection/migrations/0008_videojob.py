@@ -0,0 +1,40 @@
+# Generated by Django 5.1 on 2026-10-17 10:12
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ppe_detection', '0007_detection_model_used'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VideoJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('video', models.FileField(blank=True, upload_to='videos/%Y/%m/%d/')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('total_frames', models.IntegerField(default=0)),
+                ('fps', models.FloatField(default=0.0)),
+                ('chunks_total', models.IntegerField(default=0)),
+                ('chunks_done', models.IntegerField(default=0)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('processing_time', models.FloatField(default=0.0, help_text='Processing time in seconds')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='video_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'video_jobs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', '-created_at'], name='video_jobs_user_id_9a2eed_idx')],
+            },
+        ),
+    ]
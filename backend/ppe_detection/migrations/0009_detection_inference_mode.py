@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-17 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ppe_detection', '0008_videojob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detection',
+            name='inference_mode',
+            field=models.CharField(choices=[('full', 'Full Image'), ('sliced', 'Sliced (tiles + full image)')], default='full', max_length=10),
+        ),
+    ]
@@ -79,6 +79,11 @@ class Detection(models.Model):
         ('partial', 'Partially Compliant'),
         ('non_compliant', 'Non-Compliant'),
     ]
+    
+    INFERENCE_MODES = [
+        ('full', 'Full Image'),
+        ('sliced', 'Sliced (tiles + full image)'),
+    ]
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     model_used = models.CharField(max_length=100, default='YOLO11n', blank=True)
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -90,6 +95,7 @@ class Detection(models.Model):
     original_image = models.ImageField(upload_to='uploads/%Y/%m/%d/')
     annotated_image = models.ImageField(upload_to='results/%Y/%m/%d/', blank=True, null=True)
     is_video = models.BooleanField(default=False)
+    inference_mode = models.CharField(max_length=10, choices=INFERENCE_MODES, default='full')
     
     # Detection results
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
@@ -261,4 +267,49 @@ class Notification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+
+class VideoJob(models.Model):
+    """Background analysis of an uploaded video, split into chunks processed in parallel"""
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='video_jobs')
+    video = models.FileField(upload_to='videos/%Y/%m/%d/', blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    
+    # Progress
+    total_frames = models.IntegerField(default=0)
+    fps = models.FloatField(default=0.0)
+    chunks_total = models.IntegerField(default=0)
+    chunks_done = models.IntegerField(default=0)
+    
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    processing_time = models.FloatField(default=0.0, help_text='Processing time in seconds')
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'video_jobs'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+        ]
+    
+    def __str__(self):
+        return f"VideoJob {self.id} - {self.status}"
+    
+    @property
+    def progress(self):
+        """Fraction of chunks analysed (0-1)"""
+        if self.status == 'completed':
+            return 1.0
+        return self.chunks_done / self.chunks_total if self.chunks_total else 0.0
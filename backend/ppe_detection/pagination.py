@@ -0,0 +1,14 @@
+from rest_framework.pagination import CursorPagination
+
+
+class DetectionCursorPagination(CursorPagination):
+    """Keyset pagination over a user's detections, newest first.
+
+    Each page is one range scan on the (user, -created_at) index starting at the
+    cursor, so deep pages cost the same as the first and rows inserted meanwhile
+    do not shift the pages.
+    """
+    ordering = '-created_at'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+
+class DetectionResultCache:
+    """Content-addressed cache of image detection results.
+
+    Keys combine the SHA-256 of the uploaded bytes, the hash of the model file and
+    the detection parameters, so a re-uploaded image skips decode, inference, PPE
+    association and annotation. Entries hold the raw detection array, the persons
+    and the encoded annotation. A bounded in-memory LRU (RESULT_CACHE_SIZE entries,
+    RESULT_CACHE_MAX_MB) sits in front of an optional disk tier under
+    RESULT_CACHE_DIR, one subdirectory per model version. When the model registry
+    reloads weights, entries for versions that are no longer loaded are dropped. The
+    disk tier is shared between processes, so a process only removes the version
+    directories it served itself and has just replaced.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance.entries = OrderedDict()  # key -> (model version, entry, size)
+                    cls._instance.size = 0
+                    cls._instance.generation = None
+                    cls._instance.versions = set()  # model versions this process has served
+                    cls._instance.hits = 0
+                    cls._instance.misses = 0
+        return cls._instance
+
+    @staticmethod
+    def make_key(data, model_version, params):
+        """Cache key for image bytes, a model version and the parameters that affect the result"""
+        digest = hashlib.sha256(data).hexdigest()
+        return hashlib.sha256(f'{digest}:{model_version}:{json.dumps(params, sort_keys=True)}'.encode()).hexdigest()
+
+    def get(self, key, model_version):
+        """Cached result dict or None"""
+        with self._lock:
+            item = self.entries.get(key)
+            if item is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return item[1]
+
+        entry = self._read_disk(key, model_version)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.versions.add(model_version)
+            self._remember(key, model_version, entry)
+        return entry
+
+    def put(self, key, model_version, output):
+        """Store a detect() result (everything except its timing)"""
+        entry = {name: value for name, value in output.items() if name != 'processing_time'}
+        with self._lock:
+            self.versions.add(model_version)
+            self._remember(key, model_version, entry)
+        self._write_disk(key, model_version, entry)
+
+    def sync(self, registry):
+        """Drop entries of model versions the registry no longer serves after a reload"""
+        if registry.generation == self.generation:
+            return
+        generation, live_versions = registry.loaded_versions()
+        with self._lock:
+            if generation == self.generation:
+                return
+            for key in [key for key, item in self.entries.items() if item[0] not in live_versions]:
+                self.size -= self.entries.pop(key)[2]
+            self.generation = generation
+            replaced = self.versions - live_versions
+            self.versions -= replaced
+
+        # Other processes (or ones still on older weights) may be using the rest of the directory
+        if settings.RESULT_CACHE_DIR:
+            for version in replaced:
+                shutil.rmtree(os.path.join(settings.RESULT_CACHE_DIR, version), ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self.entries),
+                'size_mb': round(self.size / (1024 * 1024), 1),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def _remember(self, key, model_version, entry):
+        # Called with self._lock held
+        if settings.RESULT_CACHE_SIZE <= 0:
+            return
+        size = len(entry.get('annotated_image') or b'') + entry['detections'].nbytes + 1024
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.size -= previous[2]
+        self.entries[key] = (model_version, entry, size)
+        self.size += size
+
+        max_bytes = settings.RESULT_CACHE_MAX_MB * 1024 * 1024
+        while self.entries and (len(self.entries) > settings.RESULT_CACHE_SIZE or self.size > max_bytes):
+            self.size -= self.entries.popitem(last=False)[1][2]
+
+    def _disk_path(self, key, model_version):
+        return os.path.join(settings.RESULT_CACHE_DIR, model_version, f'{key}.npz')
+
+    def _read_disk(self, key, model_version):
+        if not settings.RESULT_CACHE_DIR:
+            return None
+        try:
+            with np.load(self._disk_path(key, model_version), allow_pickle=False) as data:
+                entry = json.loads(str(data['meta']))
+                entry['detections'] = data['detections']
+                entry['annotated_image'] = data['annotated_image'].tobytes() or None
+        except (OSError, KeyError, ValueError):
+            return None
+        return entry
+
+    def _write_disk(self, key, model_version, entry):
+        if not settings.RESULT_CACHE_DIR:
+            return
+        path = self._disk_path(key, model_version)
+        meta = {name: value for name, value in entry.items() if name not in ('detections', 'annotated_image')}
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so readers never see a partial file
+            tmp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.savez(
+                    f,
+                    detections=entry['detections'],
+                    annotated_image=np.frombuffer(entry.get('annotated_image') or b'', dtype=np.uint8),
+                    meta=np.array(json.dumps(meta, default=lambda value: value.tolist())),
+                )
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[CACHE] Could not write {path}: {e}")
+
+
+result_cache = DetectionResultCache()
@@ -79,7 +79,7 @@ class DetectionSerializer(serializers.ModelSerializer):
         model = Detection
         fields = [
             'id', 'user', 'site', 'site_name', 'policy', 'policy_name',
-            'original_image', 'annotated_image', 'status', 'compliance_status',
+            'original_image', 'annotated_image', 'status', 'compliance_status', 'inference_mode',
             'total_persons_detected', 'compliant_persons', 'non_compliant_persons',
             'confidence_score', 'processing_time', 'notes',
             'location_lat', 'location_lng', 
@@ -189,31 +189,33 @@ class DetectionCreateSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Detection
-        fields = ['original_image', 'site', 'policy', 'location_lat', 'location_lng', 'notes']
+        fields = ['original_image', 'site', 'policy', 'location_lat', 'location_lng', 'notes', 'inference_mode']
         extra_kwargs = {
             'site': {'required': False, 'allow_null': True},
             'policy': {'required': False, 'allow_null': True},
             'location_lat': {'required': False, 'allow_null': True},
             'location_lng': {'required': False, 'allow_null': True},
             'notes': {'required': False, 'allow_blank': True, 'allow_null': True},
+            'inference_mode': {'required': False},
         }
 
 class DetectionListSerializer(serializers.ModelSerializer):
-    """Lightweight serializer for detection list view"""
+    """Lightweight serializer for detection list view (no nested persons/violations).
+
+    Expects the queryset to annotate num_violations (see DetectionViewSet.get_queryset).
+    """
+    site_name = serializers.CharField(source='site.name', read_only=True, allow_null=True)
     detected_at = serializers.DateTimeField(source='created_at', read_only=True)
-    num_violations = serializers.SerializerMethodField()
+    num_violations = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Detection
         fields = [
-            'id', 'original_image', 'annotated_image', 'detected_at',
-            'total_persons_detected', 'num_violations', 'confidence_score',
-            'processing_time', 'status', 'compliance_status'
+            'id', 'site', 'site_name', 'original_image', 'annotated_image', 'detected_at', 'created_at',
+            'total_persons_detected', 'compliant_persons', 'non_compliant_persons',
+            'num_violations', 'confidence_score', 'processing_time',
+            'status', 'compliance_status', 'inference_mode'
         ]
-    
-    def get_num_violations(self, obj):
-        """Return count of violations"""
-        return obj.violations.count()
 
 
 class DetectionDetailSerializer(serializers.ModelSerializer):
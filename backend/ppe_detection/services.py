@@ -0,0 +1,247 @@
+import os
+import traceback
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+
+from analytics import rollups
+
+from .models import Detection, PersonDetection, Violation, Notification
+from .yolo_service import get_detector
+
+
+def run_detection(detection, data=None):
+    """Run inference for a Detection row and store persons, violations and the notification.
+
+    `data` is the uploaded image's bytes if the caller still has them in memory.
+    Marks the detection 'failed' (with the error in notes) and re-raises if anything goes wrong.
+    """
+    try:
+        detector = get_detector(settings.IMAGE_DETECTOR_MODE)
+        image_path = detection.original_image.path
+        print(f"[DETECTION] Processing image: {image_path}")
+
+        results = detector.detect(image_path, sliced=detection.inference_mode == 'sliced', data=data)
+        print(f"[DETECTION] Detection results: {results.get('num_persons')} persons found")
+
+        save_detection_results(detection, results)
+        return detection
+
+    except Exception as e:
+        print(f"Detection error: {traceback.format_exc()}")
+
+        mark_failed(detection, e)
+        raise
+
+
+def mark_failed(detection, error):
+    """Mark a detection 'failed' unless another worker has already finished it"""
+    detection.status = 'failed'
+    detection.notes = str(error)
+    Detection.objects.filter(pk=detection.pk, status__in=['pending', 'processing']).update(
+        status='failed', notes=detection.notes, updated_at=timezone.now()
+    )
+
+
+def run_detection_batch(detections):
+    """Run batched inference for several Detection rows and store each result.
+
+    Images that fail are marked 'failed' individually; returns the detections.
+    Sliced detections run one at a time, each batching its own tiles.
+    """
+    for detection in detections:
+        if detection.inference_mode == 'sliced':
+            try:
+                run_detection(detection)
+            except Exception as e:
+                print(f"[DETECTION] {detection.id} failed: {e}")
+    full = [detection for detection in detections if detection.inference_mode != 'sliced']
+    if not full:
+        return detections
+
+    detector = get_detector(settings.IMAGE_DETECTOR_MODE)
+    try:
+        batch_results = detector.detect_batch([d.original_image.path for d in full])
+    except Exception as e:
+        print(f"Batch detection error: {traceback.format_exc()}")
+        for detection in full:
+            mark_failed(detection, e)
+        return detections
+
+    for detection, results in zip(full, batch_results):
+        try:
+            if 'error' in results:
+                raise ValueError(results['error'])
+            save_detection_results(detection, results)
+        except Exception as e:
+            print(f"[DETECTION] {detection.id} failed: {e}")
+            mark_failed(detection, e)
+
+    return detections
+
+
+def build_violation(person_id, missing_items):
+    """Violation fields (type, severity, text, OSHA reference) for a person's missing PPE"""
+    titles = ', '.join(item.replace('_', ' ').title() for item in missing_items)
+
+    # Severity based on what's missing
+    severity = 'medium'
+    if 'helmet' in missing_items:
+        severity = 'critical'
+    elif 'safety_vest' in missing_items:
+        severity = 'high'
+
+    osha_standard = "29 CFR 1910.132"
+    if 'helmet' in missing_items:
+        osha_standard = "29 CFR 1910.135"
+
+    return {
+        'violation_type': f"Missing PPE: {titles}",
+        'severity': severity,
+        'description': f"Person {person_id} is missing: {titles}",
+        'recommendation': f"Worker must wear {', '.join(item.replace('_', ' ') for item in missing_items)} before entering work area",
+        'osha_standard': osha_standard,
+    }
+
+
+def build_notification(detection):
+    """Notification fields summarising a completed detection"""
+    if detection.compliance_status == 'compliant':
+        return {
+            'type': 'success',
+            'title': '✓ Full Compliance',
+            'message': f'All {detection.total_persons_detected} persons are compliant',
+        }
+    if detection.compliance_status == 'non_compliant':
+        return {
+            'type': 'danger',
+            'title': '✗ Non-Compliant',
+            'message': f'{detection.non_compliant_persons} out of {detection.total_persons_detected} persons have violations',
+        }
+    return {
+        'type': 'warning',
+        'title': '⚠ Partial Compliance',
+        'message': f'{detection.compliant_persons} compliant, {detection.non_compliant_persons} non-compliant',
+    }
+
+
+def save_detection_results(detection, results):
+    """Persist detector output onto a Detection and create its child rows.
+
+    Rows are built in memory first; the detection update, both bulk inserts, the
+    daily rollup increments and the notification then go through one short transaction.
+    A worker whose job was requeued (DETECTION_JOB_TIMEOUT) may finish the same
+    detection as the worker that took it over, so the transaction first moves the
+    row to 'completed' conditionally and only the worker that wins writes anything.
+    """
+    # Hand the in-memory annotation to the storage backend once
+    if results.get('annotated_image'):
+        stem = os.path.splitext(os.path.basename(detection.original_image.name))[0]
+        detection.annotated_image.save(
+            f"annotated_{stem}.{results.get('annotated_image_ext', 'jpg')}",
+            ContentFile(results['annotated_image']),
+            save=False
+        )
+
+    detection.total_persons_detected = results.get('num_persons', 0)
+    detection.confidence_score = results.get('avg_confidence', 0)
+    detection.processing_time = results.get('processing_time', 0)
+    detection.status = 'completed'
+
+    person_rows = []
+    violation_rows = []  # (PersonDetection, fields)
+
+    # SIMPLIFIED: Always check Helmet, Vest, Mask (no policy)
+    for idx, person in enumerate(results.get('persons', [])):
+        bbox = person.get('bbox', [0, 0, 0, 0])
+        ppe = person.get('ppe', {})
+
+        # Check ONLY these 3 items
+        has_helmet = ppe.get('helmet', {}).get('detected', False)
+        has_vest = ppe.get('safety_vest', {}).get('detected', False)
+        has_mask = ppe.get('face_mask', {}).get('detected', False)
+
+        missing_items = []
+        if not has_helmet:
+            missing_items.append('helmet')
+        if not has_vest:
+            missing_items.append('safety_vest')
+        if not has_mask:
+            missing_items.append('face_mask')
+
+        person_detection = PersonDetection(
+            detection=detection,
+            person_id=idx + 1,
+            bbox_x1=float(bbox[0]),
+            bbox_y1=float(bbox[1]),
+            bbox_x2=float(bbox[2]),
+            bbox_y2=float(bbox[3]),
+            confidence=float(person.get('confidence', 0)),
+            helmet_detected=has_helmet,
+            helmet_confidence=float(ppe.get('helmet', {}).get('confidence', 0)),
+            vest_detected=has_vest,
+            vest_confidence=float(ppe.get('safety_vest', {}).get('confidence', 0)),
+            boots_detected=ppe.get('safety_boots', {}).get('detected', False),
+            boots_confidence=float(ppe.get('safety_boots', {}).get('confidence', 0)),
+            gloves_detected=ppe.get('gloves', {}).get('detected', False),
+            gloves_confidence=float(ppe.get('gloves', {}).get('confidence', 0)),
+            glasses_detected=ppe.get('safety_glasses', {}).get('detected', False),
+            glasses_confidence=float(ppe.get('safety_glasses', {}).get('confidence', 0)),
+            mask_detected=has_mask,
+            mask_confidence=float(ppe.get('face_mask', {}).get('confidence', 0)),
+            harness_detected=ppe.get('harness', {}).get('detected', False),
+            harness_confidence=float(ppe.get('harness', {}).get('confidence', 0)),
+            is_compliant=not missing_items,
+            missing_ppe=missing_items
+        )
+        person_rows.append(person_detection)
+
+        if missing_items:
+            violation_rows.append((person_detection, build_violation(idx + 1, missing_items)))
+
+    detection.compliant_persons = len(person_rows) - len(violation_rows)
+    detection.non_compliant_persons = len(violation_rows)
+
+    # Overall compliance
+    if detection.total_persons_detected == 0:
+        detection.compliance_status = 'compliant'
+    elif detection.compliant_persons == detection.total_persons_detected:
+        detection.compliance_status = 'compliant'
+    elif detection.non_compliant_persons == detection.total_persons_detected:
+        detection.compliance_status = 'non_compliant'
+    else:
+        detection.compliance_status = 'partial'
+
+    with transaction.atomic():
+        claimed = Detection.objects.filter(
+            pk=detection.pk, status__in=['pending', 'processing']
+        ).update(status='completed', updated_at=timezone.now())
+        if not claimed:
+            print(f"[DETECTION] {detection.id} was already finished by another worker; dropping these results")
+            if detection.annotated_image:
+                detection.annotated_image.delete(save=False)
+            detection.refresh_from_db()
+            return detection
+
+        detection.save()
+        # bulk_create sets primary keys (PostgreSQL/SQLite), so violations can link to their persons
+        PersonDetection.objects.bulk_create(person_rows)
+        violations = Violation.objects.bulk_create([
+            Violation(
+                detection=detection,
+                person_detection=person_detection,
+                status='open',
+                **fields
+            )
+            for person_detection, fields in violation_rows
+        ])
+        rollups.record_detection(detection, person_rows, violations)
+        Notification.objects.create(
+            user=detection.user,
+            detection=detection,
+            **build_notification(detection)
+        )
+
+    return detection
@@ -0,0 +1,621 @@
+import io
+import threading
+import time
+import weakref
+
+import cv2
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+try:
+    import simplejpeg
+except ImportError:  # optional libjpeg-turbo encoder, faster than cv2.imencode
+    simplejpeg = None
+
+from .frame_skip import AdaptiveFrameSkipper
+from .yolo_service import get_detector
+
+
+MJPEG_CONTENT_TYPE = 'multipart/x-mixed-replace; boundary=frame'
+
+# RTSP reconnect policy: consecutive failed reads before reopening, and backoff bounds (seconds)
+RECONNECT_AFTER_FAILS = 50
+RECONNECT_BACKOFF_MIN = 0.5
+RECONNECT_BACKOFF_MAX = 10.0
+
+
+class LatestFrameCapture:
+    """Background reader that only keeps the newest frame of a cv2 capture.
+    
+    Frames are decoded with cap.read(image=...) into a preallocated ring of
+    FRAME_RING_SIZE buffers, so steady-state reading allocates nothing. The newest
+    frame is published as one (seq, captured_at, frame) tuple; replacing an
+    attribute is atomic, so readers take no lock and use seq to tell a new frame
+    from a repeated one.
+    
+    Frames are handed out zero-copy as views of ring buffers. A buffer is only
+    reused once its view has been dropped, so a consumer may keep a frame (e.g.
+    through inference) as long as it holds the returned array itself.
+    """
+    
+    def __init__(self, name, open_capture, ring_size=None):
+        self.name = name
+        self.open_capture = open_capture  # () -> cv2.VideoCapture, also used to reconnect
+        self.capture = None
+        self.active = False
+        self.latest = None  # (seq, captured_at, frame)
+        self.frames_decoded = 0
+        self.reconnects = 0
+        self.buffer_allocations = 0
+        self._ring = [[None, None] for _ in range(max(2, ring_size or settings.FRAME_RING_SIZE))]
+        self._ring_index = -1
+        self._condition = threading.Condition()
+        self._thread = None
+    
+    def start(self):
+        """Open the source and start decoding; False if it cannot be opened"""
+        capture = self.open_capture()
+        if not capture.isOpened():
+            print(f"[ERROR] {self.name}: failed to open capture")
+            capture.release()
+            return False
+        
+        self.capture = capture
+        self.active = True
+        self._thread = threading.Thread(target=self._read_frames, name=f'capture-{self.name}', daemon=True)
+        self._thread.start()
+        return True
+    
+    def stop(self):
+        """Stop decoding; the reader thread releases the capture when it exits"""
+        self.active = False
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+    
+    @property
+    def fps(self):
+        capture = self.capture
+        return capture.get(cv2.CAP_PROP_FPS) if capture is not None else 0.0
+    
+    def take_latest(self, after_seq=0):
+        """Non-blocking: (seq, captured_at, frame) if a frame newer than after_seq exists, else None"""
+        latest = self.latest
+        return latest if latest is not None and latest[0] > after_seq else None
+    
+    def wait_for_frame(self, after_seq=0, timeout=1.0):
+        """Like take_latest(), waiting up to `timeout` seconds for a newer frame"""
+        latest = self.take_latest(after_seq)
+        if latest is not None:
+            return latest
+        with self._condition:
+            self._condition.wait_for(
+                lambda: not self.active or self.take_latest(after_seq) is not None,
+                timeout=timeout
+            )
+        return self.take_latest(after_seq)
+    
+    def _next_slot(self):
+        """Ring slot to decode into: one whose last handed-out frame is no longer referenced"""
+        for _ in range(len(self._ring)):
+            self._ring_index = (self._ring_index + 1) % len(self._ring)
+            handed_out = self._ring[self._ring_index][1]
+            if handed_out is None or handed_out() is None:
+                return self._ring[self._ring_index]
+        return None
+    
+    def _read(self, cap):
+        slot = self._next_slot()
+        if slot is None:
+            # Every buffer is still held by a consumer: fall back to a fresh allocation
+            self.buffer_allocations += 1
+            ret, frame = cap.read()
+            return frame if ret else None
+        
+        buffer = slot[0]
+        ret, frame = cap.read(image=buffer) if buffer is not None else cap.read()
+        if not ret:
+            return None
+        if frame is not buffer:
+            # First frame or resolution change: this array becomes the slot's buffer
+            self.buffer_allocations += 1
+            slot[0] = frame
+        
+        view = frame.view()
+        slot[1] = weakref.ref(view)
+        return view
+    
+    def _read_frames(self):
+        """Continuously decode frames, reconnecting with backoff when the source drops"""
+        cap = self.capture
+        fail_count = 0
+        backoff = RECONNECT_BACKOFF_MIN
+        
+        try:
+            while self.active:
+                frame = self._read(cap)
+                if frame is None:
+                    fail_count += 1
+                    if fail_count < RECONNECT_AFTER_FAILS:
+                        time.sleep(0.02)
+                        continue
+                    
+                    # Source dropped: reopen instead of spinning on a dead capture
+                    print(f"[WARN] {self.name} lost, reconnecting in {backoff:.1f}s")
+                    cap.release()
+                    time.sleep(backoff)
+                    if not self.active:
+                        break
+                    cap = self.open_capture()
+                    self.capture = cap
+                    self.reconnects += 1
+                    fail_count = 0
+                    backoff = min(backoff * 2, RECONNECT_BACKOFF_MAX)
+                    continue
+                
+                fail_count = 0
+                backoff = RECONNECT_BACKOFF_MIN
+                self.frames_decoded += 1
+                self.latest = (self.frames_decoded, time.time(), frame)
+                with self._condition:
+                    self._condition.notify_all()
+        finally:
+            self.active = False
+            cap.release()
+            with self._condition:
+                self._condition.notify_all()
+
+
+def _open_rtsp(rtsp_url):
+    cap = cv2.VideoCapture(rtsp_url)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Reduce latency
+    return cap
+
+
+def _open_webcam():
+    cap = cv2.VideoCapture(0)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    cap.set(cv2.CAP_PROP_FPS, 30)
+    return cap
+
+
+class RTSPCameraManager:
+    _instance = None
+    _lock = threading.Lock()
+    
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance.streams = {}  # camera_id -> LatestFrameCapture
+        return cls._instance
+    
+    def get_stream(self, camera_id, rtsp_url):
+        """Get or start the LatestFrameCapture for a camera (None if it cannot be opened)"""
+        with self._lock:
+            capture = self.streams.get(camera_id)
+            if capture is None or not capture.active:
+                print(f"[RTSP] Opening stream for camera {camera_id}: {rtsp_url}")
+                capture = LatestFrameCapture(f'rtsp:{camera_id}', lambda: _open_rtsp(rtsp_url))
+                if not capture.start():
+                    print(f"[ERROR] Failed to open RTSP stream: {rtsp_url}")
+                    return None
+                self.streams[camera_id] = capture
+            return capture
+    
+    def take_latest_frame(self, camera_id, after_seq=0):
+        """Non-blocking: newest (seq, captured_at, frame) for a camera, or None if nothing new"""
+        capture = self.streams.get(camera_id)
+        if capture is None:
+            return None
+        return capture.take_latest(after_seq)
+    
+    def release_stream(self, camera_id):
+        """Release specific camera stream"""
+        with self._lock:
+            capture = self.streams.pop(camera_id, None)
+        if capture is not None:
+            print(f"[RTSP] Releasing stream for camera {camera_id}")
+            capture.stop()
+
+rtsp_manager = RTSPCameraManager()
+
+
+class CameraManager:
+    _instance = None
+    _lock = threading.Lock()
+    
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance.camera = None  # LatestFrameCapture of the local webcam
+                    cls._instance.active_streams = 0
+        return cls._instance
+    
+    def get_camera(self):
+        """Get or start the webcam's LatestFrameCapture"""
+        with self._lock:
+            if self.camera is None or not self.camera.active:
+                print("[CAMERA] Opening new camera instance")
+                camera = LatestFrameCapture('webcam', _open_webcam)
+                if not camera.start():
+                    print("[ERROR] Failed to open camera")
+                    return None
+                self.camera = camera
+            self.active_streams += 1
+            print(f"[CAMERA] Active streams: {self.active_streams}")
+            return self.camera
+    
+    def release_camera(self):
+        """Release camera if no active streams"""
+        with self._lock:
+            self.active_streams = max(0, self.active_streams - 1)
+            print(f"[CAMERA] Active streams: {self.active_streams}")
+            
+            if self.active_streams == 0 and self.camera is not None:
+                print("[CAMERA] Releasing camera (no active streams)")
+                self.camera.stop()
+                self.camera = None
+                print("[CAMERA] ✅ Camera released successfully")
+    
+    def force_release(self):
+        """Release the camera regardless of active streams"""
+        with self._lock:
+            self.active_streams = 0
+            if self.camera is not None:
+                self.camera.stop()
+                self.camera = None
+
+# Global camera manager instance
+camera_manager = CameraManager()
+
+
+def frame_metrics(result, processing_time):
+    """Real-time metrics for one detect_frame() result"""
+    violation_count = 0
+    compliant_count = 0
+    
+    for person in result.get('persons', []):
+        ppe = person.get('ppe', {})
+        is_compliant = (
+            ppe.get('helmet', {}).get('detected', False) and
+            ppe.get('safety_vest', {}).get('detected', False) and
+            ppe.get('face_mask', {}).get('detected', False)
+        )
+        
+        if is_compliant:
+            compliant_count += 1
+        else:
+            violation_count += 1
+    
+    return {
+        'processing_time_ms': round(processing_time * 1000, 2),
+        'objects_detected': result.get('num_persons', 0),
+        'violations': violation_count,
+        'compliant': compliant_count,
+        'fps': round(1 / processing_time, 2) if processing_time > 0 else 0,
+    }
+
+
+def mjpeg_chunk(jpeg_bytes):
+    """One multipart/x-mixed-replace part for an encoded JPEG"""
+    return b''.join((
+        b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: ',
+        str(len(jpeg_bytes)).encode(),
+        b'\r\n\r\n',
+        jpeg_bytes,
+        b'\r\n',
+    ))
+
+
+def encode_jpeg(image, quality):
+    """JPEG-encode a BGR frame with MJPEG_ENCODER ('auto' prefers simplejpeg when installed)"""
+    encoder = settings.MJPEG_ENCODER
+    if encoder in ('auto', 'simplejpeg') and simplejpeg is not None:
+        return simplejpeg.encode_jpeg(np.ascontiguousarray(image), quality=quality, colorspace='BGR')
+    
+    if encoder == 'pil':
+        # Pillow reads BGR rows directly; no colour conversion copy
+        height, width = image.shape[:2]
+        pil_image = Image.frombuffer('RGB', (width, height), np.ascontiguousarray(image), 'raw', 'BGR', 0, 1)
+        buffer = io.BytesIO()
+        pil_image.save(buffer, format='JPEG', quality=quality)
+        return buffer.getvalue()
+    
+    success, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not success:
+        raise ValueError("JPEG encoding failed")
+    return buffer.tobytes()
+
+
+def render_mjpeg_tiers(image, tiers):
+    """Encode a frame once per tier (MJPEG_TIERS) into ready-to-send multipart chunks: {tier: chunk}"""
+    chunks = {}
+    for tier in tiers:
+        config = settings.MJPEG_TIERS[tier]
+        frame = image
+        max_width = config.get('max_width')
+        if max_width and image.shape[1] > max_width:
+            height = round(image.shape[0] * max_width / image.shape[1])
+            frame = cv2.resize(image, (max_width, height), interpolation=cv2.INTER_AREA)
+        chunks[tier] = mjpeg_chunk(encode_jpeg(frame, config['quality']))
+    return chunks
+
+
+class FrameBroker:
+    """Runs detection once per source frame and fans the result out to any number of viewers.
+    
+    A single background thread takes each new frame from a LatestFrameCapture, runs
+    inference on the frames the AdaptiveFrameSkipper selects, and encodes the
+    annotated frame once per MJPEG tier that has viewers (e.g. full and thumbnail).
+    The ready-made multipart chunks are published as (seq, {tier: chunk}, metrics);
+    viewers only write bytes, and always take the newest published frame, so a slow
+    viewer skips frames instead of stalling the producer or the other viewers.
+    
+    `annotate(frame, infer)` returns (annotated_frame, metrics); metrics may be None
+    when infer is False. The default runs detect_frame() and draws its boxes.
+    
+    With capture=None the broker is passive: results are pushed in through
+    publish_result() (e.g. by the camera ingest scheduler) and it shuts down when
+    the last subscriber leaves.
+    """
+    
+    def __init__(self, key, capture, release, frame_skipper=None, reuse_last_annotation=False,
+                 annotate=None, max_fails=10, on_close=None):
+        self.key = key
+        self.capture = capture
+        self.release = release
+        self.frame_skipper = frame_skipper or AdaptiveFrameSkipper()
+        self.reuse_last_annotation = reuse_last_annotation
+        self.annotate = annotate or self._annotate_detections
+        self.max_fails = max_fails
+        self.on_close = on_close
+        
+        self.subscribers = 0
+        self.tier_subscribers = {}
+        self.closed = False
+        self.latest = None  # (seq, {tier: chunk}, metrics)
+        self.metrics = {}
+        self._seq = 0
+        self._last_annotated = None
+        self._lock = threading.Lock()
+        self._condition = threading.Condition()
+        self._thread = None
+    
+    def add_subscriber(self, tier='full'):
+        """Register a viewer of one tier; returns False if the broker already shut down"""
+        with self._lock:
+            if self.closed:
+                return False
+            self.subscribers += 1
+            self.tier_subscribers[tier] = self.tier_subscribers.get(tier, 0) + 1
+            if self._thread is None and self.capture is not None:
+                self._thread = threading.Thread(target=self._run, name=f'broker-{self.key}', daemon=True)
+                self._thread.start()
+            print(f"[BROKER] {self.key}: {self.subscribers} subscriber(s)")
+            return True
+    
+    def remove_subscriber(self, tier='full'):
+        with self._lock:
+            self.subscribers = max(0, self.subscribers - 1)
+            self.tier_subscribers[tier] = max(0, self.tier_subscribers.get(tier, 0) - 1)
+            print(f"[BROKER] {self.key}: {self.subscribers} subscriber(s)")
+            shutdown = self.capture is None and self.subscribers == 0 and not self.closed
+            if shutdown:
+                self.closed = True
+        if shutdown:
+            self._shutdown()
+    
+    def publish_result(self, frame, result, metrics):
+        """Passive mode: encode and publish a frame that was already run through detection"""
+        if self.closed:
+            return
+        self.metrics = metrics
+        chunks = self._render(result['results'].plot())
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+        self._publish(seq, chunks, metrics)
+    
+    def _shutdown(self):
+        with self._condition:
+            self._condition.notify_all()
+        self.release()
+        if self.on_close:
+            self.on_close(self)
+        print(f"[BROKER] {self.key}: stopped")
+    
+    def stream(self, tier='full'):
+        """Iterator of MJPEG chunks of one tier for one (already registered) subscriber"""
+        return BrokerStream(self, tier)
+    
+    def _frames(self, tier):
+        last_seq = 0
+        try:
+            while True:
+                with self._condition:
+                    self._condition.wait_for(
+                        lambda: self.closed or (self.latest is not None and self.latest[0] > last_seq),
+                        timeout=5
+                    )
+                    latest = self.latest
+                    closed = self.closed
+                
+                if latest is not None and latest[0] > last_seq:
+                    last_seq = latest[0]
+                    # Missing only for a frame rendered before this tier's first viewer joined
+                    chunk = latest[1].get(tier)
+                    if chunk is not None:
+                        yield chunk
+                elif closed:
+                    break
+        except GeneratorExit:
+            print(f"[BROKER] {self.key}: client disconnected")
+        finally:
+            self.remove_subscriber(tier)
+    
+    def _render(self, annotated_frame):
+        with self._lock:
+            tiers = [tier for tier, count in self.tier_subscribers.items() if count]
+        return render_mjpeg_tiers(annotated_frame, tiers)
+    
+    def _publish(self, seq, chunks, metrics):
+        with self._condition:
+            self.latest = (seq, chunks, metrics)
+            self._condition.notify_all()
+    
+    def _annotate_detections(self, frame, infer):
+        if infer:
+            start = time.time()
+            result = get_detector(settings.STREAM_DETECTOR_MODE).detect_frame(frame, use_fast_model=True)
+            metrics = frame_metrics(result, time.time() - start)
+            self._last_annotated = result['results'].plot()
+            return self._last_annotated, metrics
+        if self.reuse_last_annotation and self._last_annotated is not None:
+            return self._last_annotated, None
+        return frame, None
+    
+    def _run(self):
+        last_seq = 0
+        fail_count = 0
+        last_rendered = None
+        
+        try:
+            while True:
+                with self._lock:
+                    if self.subscribers == 0:
+                        self.closed = True
+                        break
+                
+                item = self.capture.wait_for_frame(last_seq, timeout=1.0)
+                if item is None:
+                    fail_count += 1
+                    if fail_count >= self.max_fails or not self.capture.active:
+                        print(f"[BROKER] {self.key}: no frames from capture")
+                        break
+                    continue
+                
+                fail_count = 0
+                seq, captured_at, frame = item
+                # Frames decoded since the last one we saw (the capture drops the rest)
+                new_frames = seq - last_seq
+                last_seq = seq
+                
+                try:
+                    if self.frame_skipper.should_process(frame, frames=new_frames):
+                        start = time.time()
+                        annotated_frame, metrics = self.annotate(frame, True)
+                        now = time.time()
+                        self.frame_skipper.record(now - start, end_to_end=now - captured_at)
+                        self.metrics = {
+                            **(metrics or {}),
+                            'frame': seq,
+                            **self.frame_skipper.metrics(),
+                        }
+                    else:
+                        annotated_frame, _ = self.annotate(frame, False)
+                    
+                    # A reused annotation was already rendered and published
+                    if annotated_frame is last_rendered:
+                        continue
+                    last_rendered = annotated_frame
+                    
+                    self._publish(seq, self._render(annotated_frame), self.metrics)
+                
+                except Exception as e:
+                    print(f"[ERROR] {self.key} frame processing: {e}")
+                    continue
+        
+        except Exception as e:
+            print(f"[ERROR] {self.key} broker error: {e}")
+        finally:
+            with self._lock:
+                self.closed = True
+            self._shutdown()
+
+
+class BrokerStream:
+    """A subscriber's MJPEG iterator; closing it unregisters the subscriber.
+    
+    The subscriber is registered before the response starts, and a generator that
+    was never iterated does not run its `finally` on close(). The response closes
+    this (StreamingHttpResponse.close) even when it was never sent, so the tier
+    encoder and the broker are released either way.
+    """
+    
+    def __init__(self, broker, tier):
+        self.broker = broker
+        self.tier = tier
+        self._frames = broker._frames(tier)
+        self._started = False
+        self._closed = False
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        self._started = True
+        return next(self._frames)
+    
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._started:
+            # The generator's finally unregisters it (unless it already ran)
+            self._frames.close()
+        else:
+            self.broker.remove_subscriber(self.tier)
+
+
+class FrameBrokerRegistry:
+    """One FrameBroker per camera source, shared by every viewer of that source"""
+    _instance = None
+    _lock = threading.Lock()
+    
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance.brokers = {}
+        return cls._instance
+    
+    def subscribe(self, key, factory, tier='full'):
+        """Attach a viewer to the broker for `key`, creating it with factory(on_close) if needed.
+        
+        Returns the viewer's MJPEG iterator for `tier` (see MJPEG_TIERS), or None if
+        the source could not be opened.
+        """
+        with self._lock:
+            broker = self.brokers.get(key)
+            if broker is None or not broker.add_subscriber(tier):
+                broker = factory(self._discard)
+                if broker is None:
+                    return None
+                self.brokers[key] = broker
+                broker.add_subscriber(tier)
+        return broker.stream(tier)
+    
+    def latest_metrics(self, key):
+        broker = self.brokers.get(key)
+        if broker is None:
+            return None
+        return {
+            **broker.metrics,
+            'subscribers': broker.subscribers,
+            'tier_subscribers': dict(broker.tier_subscribers),
+        }
+    
+    def _discard(self, broker):
+        with self._lock:
+            if self.brokers.get(broker.key) is broker:
+                del self.brokers[broker.key]
+
+
+frame_brokers = FrameBrokerRegistry()
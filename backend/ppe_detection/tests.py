@@ -1,3 +1,484 @@
-from django.test import TestCase
+import math
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+
+from .result_cache import DetectionResultCache
+from .streaming import FrameBroker, FrameBrokerRegistry
+from .video_jobs import run_video_job
+from .yolo_service import DETECTION_DTYPE, YOLOPPEDetector
+
+
+CLASS_NAMES = ['Hardhat', 'Mask', 'NO-Hardhat', 'NO-Mask', 'NO-Safety Vest',
+               'Person', 'Safety Cone', 'Safety Vest', 'machinery', 'vehicle']
+
+# Scenes as (class, [x1, y1, x2, y2], confidence) in detection order. None of them
+# has a PPE box that two persons could both claim, so the pre-vectorization
+# per-person loop and the global matching must agree on every one.
+ASSOCIATION_FIXTURES = {
+    'single_worker_full_ppe': [
+        ('Person', [400, 200, 520, 600], 0.91),
+        ('Hardhat', [420, 170, 500, 230], 0.88),
+        ('Safety Vest', [400, 300, 520, 420], 0.83),
+        ('Mask', [440, 240, 480, 270], 0.77),
+    ],
+    'two_workers_apart': [
+        ('Person', [100, 200, 220, 600], 0.90),
+        ('Person', [900, 220, 1020, 620], 0.86),
+        ('Hardhat', [120, 170, 200, 230], 0.84),
+        ('NO-Hardhat', [920, 190, 1000, 250], 0.72),
+        ('Safety Vest', [100, 300, 220, 420], 0.80),
+        ('NO-Safety Vest', [900, 320, 1020, 440], 0.66),
+        ('Mask', [140, 240, 180, 270], 0.61),
+        ('NO-Mask', [940, 260, 980, 290], 0.81),
+    ],
+    'two_helmets_one_worker': [
+        ('Person', [400, 200, 520, 600], 0.91),
+        ('Hardhat', [420, 170, 500, 230], 0.62),
+        ('NO-Hardhat', [430, 175, 505, 235], 0.79),
+        ('Hardhat', [425, 168, 498, 228], 0.79),
+    ],
+    'low_confidence_no_mask': [
+        ('Person', [400, 200, 520, 600], 0.91),
+        ('NO-Mask', [440, 240, 480, 270], 0.55),
+        ('Safety Cone', [600, 500, 640, 600], 0.90),
+        ('vehicle', [0, 0, 300, 200], 0.95),
+    ],
+    'crowd_row': [
+        ('Person', [100 + 400 * i, 200, 220 + 400 * i, 600], 0.80 + 0.02 * i) for i in range(4)
+    ] + [
+        ('Hardhat' if i % 2 else 'NO-Hardhat', [120 + 400 * i, 170, 200 + 400 * i, 230], 0.70 + 0.03 * i)
+        for i in range(4)
+    ] + [
+        ('Safety Vest', [100 + 400 * i, 300, 220 + 400 * i, 420], 0.75) for i in range(0, 4, 2)
+    ],
+}
+
+
+def make_detector():
+    """YOLOPPEDetector with its lookup tables but no models loaded"""
+    detector = YOLOPPEDetector.__new__(YOLOPPEDetector)
+    detector.classNames = list(CLASS_NAMES)
+    detector._build_lookup_tables()
+    return detector
+
+
+def detection_array(scene):
+    detections = np.zeros(len(scene), dtype=DETECTION_DTYPE)
+    for idx, (class_name, bbox, confidence) in enumerate(scene):
+        detections[idx] = (bbox, confidence, CLASS_NAMES.index(class_name))
+    return detections
+
+
+def _legacy_overlap(box1, box2):
+    inter_x_min, inter_y_min = max(box1[0], box2[0]), max(box1[1], box2[1])
+    inter_x_max, inter_y_max = min(box1[2], box2[2]), min(box1[3], box2[3])
+    if inter_x_max < inter_x_min or inter_y_max < inter_y_min:
+        return 0.0
+    intersection = (inter_x_max - inter_x_min) * (inter_y_max - inter_y_min)
+    union = (
+        (box1[2] - box1[0]) * (box1[3] - box1[1]) + (box2[2] - box2[0]) * (box2[3] - box2[1]) - intersection
+    )
+    return intersection / union if union > 0 else 0.0
+
+
+def legacy_person_flags(scene):
+    """The per-person, per-item Python loop the vectorized association replaced.
+
+    Returns [(bbox, helmet, vest, mask, helmet_conf, vest_conf, mask_conf)] for the
+    persons in the scene (the no-person fallback is not part of it).
+    """
+    persons = [(bbox, conf) for class_name, bbox, conf in scene if class_name == 'Person']
+    items = [
+        (class_name, bbox, conf) for class_name, bbox, conf in scene
+        if class_name not in ('Person', 'Safety Cone', 'machinery', 'vehicle')
+    ]
+    assigned = set()
+    flags = []
+    for (px1, py1, px2, py2), _ in persons:
+        h = py2 - py1
+        head = [px1 - 80, py1 - 100, px2 + 80, py1 + h * 0.4]
+        face = [px1 - 60, py1 - 50, px2 + 60, py1 + h * 0.25]
+        body = [px1 - 70, py1 + h * 0.15, px2 + 70, py1 + h * 0.7]
+        full = [px1 - 120, py1 - 120, px2 + 120, py2 + 120]
+
+        best = {'helmet': (None, 0.0, None), 'vest': (None, 0.0, None)}
+        masks = []
+        for item_idx, (class_name, bbox, conf) in enumerate(items):
+            if item_idx in assigned:
+                continue
+            if class_name in ('Hardhat', 'NO-Hardhat'):
+                score = _legacy_overlap(head, bbox) * 2.0 + _legacy_overlap(full, bbox) * 0.5
+                if score > 0.05 and conf > best['helmet'][1]:
+                    best['helmet'] = (class_name, conf, item_idx)
+            elif class_name in ('Safety Vest', 'NO-Safety Vest'):
+                score = _legacy_overlap(body, bbox) * 2.0 + _legacy_overlap(full, bbox) * 0.5
+                if score > 0.05 and conf > best['vest'][1]:
+                    best['vest'] = (class_name, conf, item_idx)
+            elif class_name in ('Mask', 'NO-Mask'):
+                score = max(
+                    _legacy_overlap(face, bbox) * 3.0, _legacy_overlap(head, bbox) * 2.0, _legacy_overlap(full, bbox) * 0.8
+                )
+                if score > 0.02:
+                    masks.append((score, conf, class_name, item_idx))
+        masks.sort(key=lambda mask: (mask[0], mask[1]), reverse=True)
+        best['mask'] = (masks[0][2], masks[0][1], masks[0][3]) if masks else (None, 0.0, None)
+        assigned.update(item_idx for _, _, item_idx in best.values() if item_idx is not None)
+
+        has_mask = best['mask'][0] == 'Mask' or (best['mask'][0] == 'NO-Mask' and best['mask'][1] < 0.7)
+        flags.append((
+            [float(px1), float(py1), float(px2), float(py2)],
+            best['helmet'][0] == 'Hardhat', best['vest'][0] == 'Safety Vest', has_mask,
+            round(best['helmet'][1], 2), round(best['vest'][1], 2),
+            round(best['mask'][1], 2) if best['mask'][1] > 0 else 0.5,
+        ))
+    return flags
+
+
+def person_flags(persons):
+    return [
+        (
+            person['bbox'],
+            person['ppe']['helmet']['detected'], person['ppe']['safety_vest']['detected'],
+            person['ppe']['face_mask']['detected'],
+            person['ppe']['helmet']['confidence'], person['ppe']['safety_vest']['confidence'],
+            person['ppe']['face_mask']['confidence'],
+        )
+        for person in persons
+    ]
+
+
+class PersonAssociationTests(SimpleTestCase):
+    def setUp(self):
+        self.detector = make_detector()
+
+    def associate(self, scene):
+        return self.detector._build_person_data_optimized(detection_array(scene), 1920, 1080, verbose=False)
+
+    def test_matches_per_person_loop_on_fixtures(self):
+        for name, scene in ASSOCIATION_FIXTURES.items():
+            with self.subTest(scene=name):
+                self.assertEqual(person_flags(self.associate(scene)), legacy_person_flags(scene))
+
+    def test_contested_helmet_goes_to_best_fit(self):
+        # Both persons' head regions reach the helmet, which sits on the second one's head
+        # and only partly inside the first one's
+        scene = [
+            ('Person', [100, 200, 220, 600], 0.90),
+            ('Person', [200, 210, 320, 610], 0.88),
+            ('Hardhat', [260, 175, 340, 235], 0.85),
+        ]
+        first, second = self.associate(scene)
+        self.assertFalse(first['ppe']['helmet']['detected'])
+        self.assertTrue(second['ppe']['helmet']['detected'])
+        self.assertEqual(second['ppe']['helmet']['confidence'], 0.85)
+
+        # The per-person loop handed it to whoever came first
+        legacy_first, legacy_second = legacy_person_flags(scene)
+        self.assertTrue(legacy_first[1])
+        self.assertFalse(legacy_second[1])
+
+    def test_contested_helmet_leaves_other_helmet_for_loser(self):
+        scene = [
+            ('Person', [100, 200, 220, 600], 0.90),
+            ('Person', [200, 210, 320, 610], 0.88),
+            ('Hardhat', [260, 175, 340, 235], 0.85),
+            ('NO-Hardhat', [115, 170, 190, 225], 0.60),
+        ]
+        first, second = self.associate(scene)
+        self.assertEqual(first['ppe']['helmet'], {'detected': False, 'confidence': 0.6})
+        self.assertEqual(second['ppe']['helmet'], {'detected': True, 'confidence': 0.85})
+
+    def test_each_item_assigned_once(self):
+        scene = [('Person', [100 + 30 * i, 200, 220 + 30 * i, 600], 0.9) for i in range(5)]
+        scene.append(('Hardhat', [150, 170, 230, 230], 0.8))
+        persons = self.associate(scene)
+        self.assertEqual(sum(person['ppe']['helmet']['detected'] for person in persons), 1)
+
+
+# Raw model output as boxes.data rows: x1, y1, x2, y2, conf, cls (float32, like the tensor)
+RAW_OUTPUT_FIXTURES = {
+    'workers_and_scenery': [
+        [100.7, 200.2, 220.9, 600.5, 0.904, 5],
+        [900.1, 220.8, 1020.3, 620.0, 0.861, 5],
+        [120.4, 170.6, 200.2, 230.9, 0.8349, 0],
+        [920.5, 190.5, 1000.5, 250.5, 0.7201, 2],
+        [100.0, 300.0, 220.0, 420.0, 0.80, 7],
+        [900.9, 320.1, 1020.2, 440.7, 0.655, 4],
+        [140.0, 240.0, 180.0, 270.0, 0.611, 1],
+        [940.0, 260.0, 980.0, 290.0, 0.512, 3],
+        [600.0, 500.0, 640.0, 600.0, 0.93, 6],
+        [0.0, 0.0, 300.0, 200.0, 0.97, 9],
+    ],
+    'below_threshold_and_unknown_class': [
+        [400.0, 200.0, 520.0, 600.0, 0.91, 5],
+        [420.0, 170.0, 500.0, 230.0, 0.399, 0],
+        [400.0, 300.0, 520.0, 420.0, 0.4, 7],
+        [440.0, 240.0, 480.0, 270.0, 0.401, 1],
+        [430.0, 250.0, 470.0, 280.0, 0.88, 14],
+    ],
+    'zero_area_boxes': [
+        [400.0, 200.0, 520.0, 600.0, 0.91, 5],
+        [300.0, 300.0, 300.0, 300.0, 0.75, 5],
+        [460.0, 170.0, 460.0, 230.0, 0.88, 0],
+        [420.0, 200.0, 500.0, 200.0, 0.77, 0],
+        [400.0, 300.0, 520.0, 420.0, 0.83, 7],
+        [450.0, 250.0, 450.0, 250.0, 0.66, 3],
+    ],
+    'ppe_without_persons': [
+        [420.0, 170.0, 500.0, 230.0, 0.88, 0],
+        [400.0, 300.0, 520.0, 420.0, 0.83, 7],
+        [440.0, 240.0, 480.0, 270.0, 0.52, 3],
+        [10.0, 10.0, 10.0, 10.0, 0.9, 8],
+    ],
+    'zero_area_ppe_without_persons': [
+        [460.0, 170.0, 460.0, 230.0, 0.88, 0],
+        [400.0, 300.0, 400.0, 300.0, 0.83, 4],
+    ],
+    'scenery_only': [
+        [600.0, 500.0, 640.0, 600.0, 0.93, 6],
+        [0.0, 0.0, 300.0, 200.0, 0.97, 9],
+    ],
+    'below_threshold_only': [
+        [400.0, 200.0, 520.0, 600.0, 0.35, 5],
+        [420.0, 170.0, 500.0, 230.0, 0.2, 0],
+    ],
+    'empty': [],
+}
+
+
+class _FakeTensor:
+    def __init__(self, array):
+        self.array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+
+def fake_result(rows):
+    data = np.array(rows, dtype=np.float32).reshape(-1, 6)
+    return type('Results', (), {'boxes': type('Boxes', (), {'data': _FakeTensor(data)})()})()
+
+
+def legacy_image_scene(rows):
+    """The per-box loop detect() ran before detections became an array: the scene it associated"""
+    scene = []
+    for x1, y1, x2, y2, conf, cls in np.array(rows, dtype=np.float32).reshape(-1, 6):
+        cls = int(cls)
+        class_name = CLASS_NAMES[cls] if cls < len(CLASS_NAMES) else 'Unknown'
+        conf = math.ceil(conf * np.float32(100)) / 100
+        if conf > 0.4:
+            scene.append((class_name, [int(x1), int(y1), int(x2), int(y2)], conf))
+    return scene
+
+
+def legacy_image_flags(rows):
+    scene = legacy_image_scene(rows)
+    if any(class_name == 'Person' for class_name, _, _ in scene):
+        return legacy_person_flags(scene)
+
+    items = [item for item in scene if item[0] not in ('Safety Cone', 'machinery', 'vehicle')]
+    if not items:
+        return []
+    present = {class_name for class_name, _, _ in items}
+    has_helmet = 'Hardhat' in present and 'NO-Hardhat' not in present
+    has_vest = 'Safety Vest' in present and 'NO-Safety Vest' not in present
+    has_mask = 'Mask' in present and 'NO-Mask' not in present
+    return [(
+        [float(min(bbox[0] for _, bbox, _ in items)), float(min(bbox[1] for _, bbox, _ in items)),
+         float(max(bbox[2] for _, bbox, _ in items)), float(max(bbox[3] for _, bbox, _ in items))],
+        has_helmet, has_vest, has_mask,
+        0.85 if has_helmet else 0.0, 0.85 if has_vest else 0.0, 0.85 if has_mask else 0.0,
+    )]
+
+
+def legacy_frame_persons(rows):
+    """The per-box loop detect_frame() ran before detections became an array"""
+    persons = []
+    for x1, y1, x2, y2, conf, cls in np.array(rows, dtype=np.float32).reshape(-1, 6):
+        cls = int(cls)
+        class_lower = (CLASS_NAMES[cls] if cls < len(CLASS_NAMES) else 'Unknown').lower()
+        confidence = float(conf)
+        ppe = {name: {'detected': False, 'confidence': 0} for name in ('helmet', 'safety_vest', 'face_mask')}
+        if 'helmet' in class_lower or 'hardhat' in class_lower:
+            ppe['helmet'] = {'detected': 'no' not in class_lower, 'confidence': confidence}
+        if 'vest' in class_lower or 'jacket' in class_lower:
+            ppe['safety_vest'] = {'detected': 'no' not in class_lower, 'confidence': confidence}
+        if 'mask' in class_lower:
+            ppe['face_mask'] = {'detected': 'no' not in class_lower, 'confidence': confidence}
+        persons.append({'bbox': [float(x1), float(y1), float(x2), float(y2)], 'confidence': confidence, 'ppe': ppe})
+    return persons
+
+
+class DetectionArrayTests(SimpleTestCase):
+    def setUp(self):
+        self.detector = make_detector()
+
+    def image_result(self, rows):
+        detections = self.detector._to_detection_array(fake_result(rows))
+        image = np.zeros((1080, 1920, 3), dtype=np.uint8)
+        with mock.patch.object(self.detector, '_encode_annotated_image', return_value=(b'', 'jpg')):
+            return self.detector._postprocess_image(image, detections)
+
+    def test_image_persons_match_per_box_path(self):
+        for name, rows in RAW_OUTPUT_FIXTURES.items():
+            with self.subTest(fixture=name):
+                result = self.image_result(rows)
+                self.assertEqual(person_flags(result['persons']), legacy_image_flags(rows))
+                self.assertEqual(result['num_persons'], len(result['persons']))
+
+    def test_image_detections_match_per_box_path(self):
+        for name, rows in RAW_OUTPUT_FIXTURES.items():
+            with self.subTest(fixture=name):
+                detections = self.image_result(rows)['detections']
+                self.assertEqual(
+                    [
+                        (class_name, [int(value) for value in bbox], confidence)
+                        for class_name, bbox, confidence in zip(
+                            self.detector.class_name_lut[detections['class_id']].tolist(),
+                            detections['bbox'].tolist(),
+                            detections['confidence'].tolist(),
+                        )
+                    ],
+                    legacy_image_scene(rows)
+                )
+
+    def test_no_persons(self):
+        self.assertEqual(self.image_result(RAW_OUTPUT_FIXTURES['empty'])['persons'], [])
+        self.assertEqual(self.image_result(RAW_OUTPUT_FIXTURES['scenery_only'])['persons'], [])
+        self.assertFalse(self.image_result(RAW_OUTPUT_FIXTURES['below_threshold_only'])['is_compliant'])
+
+        fallback, = self.image_result(RAW_OUTPUT_FIXTURES['ppe_without_persons'])['persons']
+        self.assertEqual(fallback['bbox'], [400.0, 170.0, 520.0, 420.0])
+        self.assertTrue(fallback['ppe']['helmet']['detected'])
+        self.assertFalse(fallback['ppe']['face_mask']['detected'])
+
+    def test_frame_persons_match_per_box_path(self):
+        for name, rows in RAW_OUTPUT_FIXTURES.items():
+            with self.subTest(fixture=name):
+                result = self.detector._frame_result(fake_result(rows))
+                self.assertEqual(result['persons'], legacy_frame_persons(rows))
+                self.assertEqual(result['num_persons'], len(rows))
+
+
+class RunVideoJobTests(SimpleTestCase):
+    def test_failed_chunk_cancels_the_rest(self):
+        release = threading.Event()
+        started = []
+
+        def analyse_chunk(video_path, start, end, stride, fps):
+            started.append(start)
+            if start == 0:
+                raise ValueError('corrupt chunk')
+            release.wait(5)
+
+        pool = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(pool.shutdown)
+        self.addCleanup(release.set)
+        job = mock.Mock(status='pending')
+        with mock.patch('ppe_detection.video_jobs.probe_video', return_value=(400, 25.0)), \
+                mock.patch('ppe_detection.video_jobs.plan_chunks', return_value=[(0, 100), (100, 200), (200, 300), (300, 400)]), \
+                mock.patch('ppe_detection.video_jobs.analyse_chunk', analyse_chunk), \
+                mock.patch('ppe_detection.video_jobs.VideoJob'):
+            run_video_job(job, pool)
+
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.error, 'corrupt chunk')
+        # At most the chunk taken up while the first one failed still ran
+        release.set()
+        pool.shutdown()
+        self.assertEqual(started[0], 0)
+        self.assertNotIn(200, started)
+        self.assertNotIn(300, started)
+
+
+class FakeRegistry:
+    def __init__(self, *versions):
+        self.generation, self.versions = 0, set(versions)
+
+    def reload(self, *versions):
+        self.generation += 1
+        self.versions = set(versions)
+
+    def loaded_versions(self):
+        return self.generation, set(self.versions)
+
+
+class ResultCacheSyncTests(SimpleTestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        cache_settings = override_settings(RESULT_CACHE_DIR=self.cache_dir, RESULT_CACHE_SIZE=8, RESULT_CACHE_MAX_MB=1)
+        cache_settings.enable()
+        self.addCleanup(cache_settings.disable)
+        # A fresh instance instead of the process-wide one
+        with mock.patch.object(DetectionResultCache, '_instance', None):
+            self.cache = DetectionResultCache()
+
+    def put(self, key, version):
+        self.cache.put(key, version, {'detections': np.zeros(0, dtype=DETECTION_DTYPE), 'persons': []})
+
+    def test_only_replaced_versions_this_process_served_are_pruned(self):
+        registry = FakeRegistry('image-v1', 'video-v1')
+        self.cache.sync(registry)
+        self.put('a', 'image-v1')
+        # Written by another process that loaded weights this one never served
+        os.makedirs(os.path.join(self.cache_dir, 'video-v1'))
+
+        registry.reload('image-v2', 'video-v2')
+        self.cache.sync(registry)
+
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), ['video-v1'])
+        self.assertIsNone(self.cache.get('a', 'image-v1'))
+        self.assertEqual(self.cache.versions, set())
+
+        self.put('b', 'image-v2')
+        registry.reload('image-v2', 'video-v3')
+        self.cache.sync(registry)
+        self.assertIn('image-v2', os.listdir(self.cache_dir))
+        self.assertEqual(self.cache.versions, {'image-v2'})
+
+
+class BrokerStreamTests(SimpleTestCase):
+    def setUp(self):
+        with mock.patch.object(FrameBrokerRegistry, '_instance', None):
+            self.registry = FrameBrokerRegistry()
+        self.release = mock.Mock()
+
+    def subscribe(self, tier='full'):
+        return self.registry.subscribe(
+            'camera', lambda on_close: FrameBroker('camera', None, self.release, on_close=on_close), tier=tier
+        )
+
+    def test_response_closed_before_it_was_iterated(self):
+        full, thumb = self.subscribe(), self.subscribe('thumb')
+        broker = self.registry.brokers['camera']
+        self.assertEqual(broker.tier_subscribers, {'full': 1, 'thumb': 1})
+
+        full.close()
+        full.close()
+        self.assertEqual(broker.tier_subscribers, {'full': 0, 'thumb': 1})
+        self.release.assert_not_called()
+
+        thumb.close()
+        self.release.assert_called_once()
+        self.assertNotIn('camera', self.registry.brokers)
+
+    def test_response_closed_while_streaming(self):
+        frames = self.subscribe()
+        broker = self.registry.brokers['camera']
+        broker._publish(1, {'full': b'frame'}, {})
+        self.assertEqual(next(frames), b'frame')
+
+        frames.close()
+        self.assertEqual(broker.subscribers, 0)
+        self.release.assert_called_once()
@@ -14,17 +14,19 @@ urlpatterns = [
     path('test-db/', views.test_db, name='test-db'),
     path('live-feed/', views.live_camera_feed, name='live-camera-feed'),
     path('process-frame-metrics/', views.process_frame_metrics, name='process-frame-metrics'),
-    path('export-violations/', views.export_violations_csv, name='export-violations'),
+    path('export-violations/', views.export_violations, name='export-violations'),
     path('rtsp-camera-stream/', views.rtsp_camera_stream, name='rtsp-camera-stream'),
+    path('camera-stream-metrics/', views.camera_stream_metrics, name='camera-stream-metrics'),
+    path('cameras/stats/', views.camera_ingest_stats, name='camera-ingest-stats'),
     # NEW: Video processing endpoints
     path('video/upload/', views.process_video, name='video-upload'),
+    path('video/jobs/<uuid:job_id>/', views.video_job_status, name='video-job-status'),
     path('video/webcam/', views.webcam_stream, name='webcam-stream'),
     path('notifications/', views.get_notifications, name='get-notifications'),
     path('notifications/mark-read/<str:notification_id>/', views.mark_notification_read, name='mark-notification-read'),
     path('notifications/mark-all-read/', views.mark_all_notifications_read, name='mark-all-notifications-read'),
     path('process-frame/', views.process_frame_metrics, name='process-frame'),
     path('violation-stats/', views.violation_statistics, name='violation-stats'),
-    path('export-violations/', views.export_violations_csv, name='export-violations'),
     path('live-feed/', views.live_camera_feed, name='live-feed'),
     path('process-frame-annotated/', views.process_frame_with_annotation, name='process-frame-annotated'),
     path('live-webcam-stream/', views.live_webcam_stream, name='live-webcam-stream'),   
@@ -0,0 +1,247 @@
+import multiprocessing
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from .models import VideoJob
+from .video_workers import analyse_chunk, init_worker
+from .yolo_service import YOLOPPEDetector
+
+
+def probe_video(video_path):
+    """(total_frames, fps) from the container metadata"""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError("Could not open video")
+    try:
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    finally:
+        cap.release()
+    if total_frames <= 0:
+        raise ValueError("Video has no frames")
+    return total_frames, fps
+
+
+def plan_chunks(total_frames, fps, chunk_seconds):
+    """Split [0, total_frames) into consecutive (start, end) frame ranges of ~chunk_seconds"""
+    chunk_frames = max(1, int(round(chunk_seconds * fps)))
+    return [(start, min(start + chunk_frames, total_frames)) for start in range(0, total_frames, chunk_frames)]
+
+
+
+def merge_chunks(chunks, total_frames, fps, iou_threshold=0.3):
+    """Merge chunk results into one timeline.
+
+    Tracks that end on a chunk's last analysed frame are stitched to tracks that
+    start on the next chunk's first analysed frame by box IoU, so a worker who
+    crosses a chunk boundary is counted once.
+    """
+    chunks = sorted(chunks, key=lambda chunk: chunk['start_frame'])
+    timeline = []
+    tracks = {}
+    open_tracks = []  # (global id, last bbox) alive at the end of the previous chunk
+    inference_frames = 0
+    motion_skipped = 0
+    strides = []
+
+    for chunk in chunks:
+        frames = chunk['frames']
+        timeline.extend(frames)
+        inference_frames += chunk['inference_frames']
+        motion_skipped += chunk['frame_skip']['motion_skipped']
+        strides.append(chunk['frame_skip']['stride'])
+        if not frames:
+            open_tracks = []
+            continue
+
+        first_frame, last_frame = frames[0]['frame'], frames[-1]['frame']
+        local_ids = list(chunk['tracks'])
+        mapping = {}
+
+        head = [lid for lid in local_ids if chunk['tracks'][lid]['first_frame'] == first_frame]
+        if open_tracks and head:
+            iou = YOLOPPEDetector._iou_matrix(
+                np.array([bbox for _, bbox in open_tracks]),
+                np.array([chunk['tracks'][lid]['first_bbox'] for lid in head])
+            )
+            for flat_idx in np.argsort(-iou, axis=None).tolist():
+                open_idx, head_idx = divmod(flat_idx, len(head))
+                if iou[open_idx, head_idx] < iou_threshold:
+                    break
+                global_id = open_tracks[open_idx][0]
+                if global_id in mapping.values() or head[head_idx] in mapping:
+                    continue
+                mapping[head[head_idx]] = global_id
+
+        for lid in local_ids:
+            local = chunk['tracks'][lid]
+            global_id = mapping.get(lid)
+            if global_id is None:
+                global_id = len(tracks) + 1
+                tracks[global_id] = {
+                    'track_id': global_id,
+                    'first_frame': local['first_frame'],
+                    'violation': False,
+                    'missing_ppe': [],
+                }
+            track = tracks[global_id]
+            track['last_frame'] = local['last_frame']
+            if local['violation']:
+                track['violation'] = True
+                track['missing_ppe'] = local['missing_ppe']
+            local['global_id'] = global_id
+
+        open_tracks = [
+            (local['global_id'], local['last_bbox'])
+            for local in chunk['tracks'].values() if local['last_frame'] == last_frame
+        ]
+
+    for track in tracks.values():
+        track['first_time'] = round(track['first_frame'] / fps, 2)
+        track['last_time'] = round(track['last_frame'] / fps, 2)
+
+    return {
+        'total_frames': total_frames,
+        'fps': round(fps, 2),
+        'processed_frames': len(timeline),
+        'summary': {
+            'avg_persons': sum(r['stats']['total'] for r in timeline) / len(timeline) if timeline else 0,
+            'avg_violations': sum(r['stats']['violations'] for r in timeline) / len(timeline) if timeline else 0,
+            'inference_frames': inference_frames,
+            'motion_skipped_frames': motion_skipped,
+            'max_stride': max(strides, default=0),
+            'tracked_persons': len(tracks),
+            'violating_persons': sum(1 for track in tracks.values() if track['violation']),
+        },
+        'tracks': list(tracks.values()),
+        'frame_results': timeline,
+    }
+
+
+def run_video_job(job, pool):
+    """Analyse a VideoJob's video chunk by chunk on `pool`, updating progress as chunks finish"""
+    start = time.time()
+    try:
+        video_path = job.video.path
+        total_frames, fps = probe_video(video_path)
+        chunks = plan_chunks(total_frames, fps, settings.VIDEO_CHUNK_SECONDS)
+        VideoJob.objects.filter(pk=job.pk).update(
+            status='processing', total_frames=total_frames, fps=fps,
+            chunks_total=len(chunks), chunks_done=0, updated_at=timezone.now()
+        )
+        print(f"[VIDEO JOB] {job.id}: {total_frames} frames @ {fps:.1f} FPS in {len(chunks)} chunk(s)")
+
+        futures = [
+            pool.submit(analyse_chunk, video_path, chunk_start, chunk_end, settings.VIDEO_FRAME_STRIDE, fps)
+            for chunk_start, chunk_end in chunks
+        ]
+        results = []
+        try:
+            for future in as_completed(futures):
+                results.append(future.result())
+                VideoJob.objects.filter(pk=job.pk).update(
+                    chunks_done=F('chunks_done') + 1, updated_at=timezone.now()
+                )
+        except Exception:
+            # The job has failed; free the process pool of its chunks that have not started
+            for future in futures:
+                future.cancel()
+            raise
+
+        job.refresh_from_db()
+        job.result = merge_chunks(results, total_frames, fps)
+        job.status = 'completed'
+    except Exception as e:
+        print(f"Video job error: {traceback.format_exc()}")
+        job.refresh_from_db()
+        job.status = 'failed'
+        job.error = str(e)
+
+    job.processing_time = round(time.time() - start, 2)
+    # The upload is only needed for analysis
+    if job.video:
+        job.video.delete(save=False)
+    job.save()
+    print(f"[VIDEO JOB] {job.id}: {job.status} in {job.processing_time:.2f}s")
+    return job
+
+
+class VideoJobRunner:
+    """Runs VideoJobs in the background of this process.
+
+    A small thread pool drives the jobs; the chunks of every job share one process
+    pool (VIDEO_PROCESS_WORKERS processes, each loading the video model once).
+    The queue lives in memory, so the first submit after a restart also queues
+    the jobs a previous process left unfinished.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance.executor = None
+                    cls._instance.process_pool = None
+        return cls._instance
+
+    def start(self):
+        """Create the pools once per process and queue the jobs left pending"""
+        with self._lock:
+            if self.executor is not None:
+                return
+            self.process_pool = ProcessPoolExecutor(
+                max_workers=settings.VIDEO_PROCESS_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker,
+            )
+            self.executor = ThreadPoolExecutor(
+                max_workers=settings.VIDEO_JOB_CONCURRENCY, thread_name_prefix='video-job'
+            )
+            for job_id in self.requeue_stale():
+                self.executor.submit(self._run, job_id)
+
+    def submit(self, job_id):
+        """Queue a committed VideoJob for processing"""
+        self.start()
+        self.executor.submit(self._run, job_id)
+
+    def requeue_stale(self):
+        """Put back jobs with no progress for VIDEO_JOB_TIMEOUT; returns the ids of all pending jobs"""
+        cutoff = timezone.now() - timedelta(seconds=settings.VIDEO_JOB_TIMEOUT)
+        count = VideoJob.objects.filter(status='processing', updated_at__lt=cutoff).update(
+            status='pending', updated_at=timezone.now()
+        )
+        if count:
+            print(f"[VIDEO JOB] Requeued {count} stale job(s)")
+        return list(VideoJob.objects.filter(status='pending').values_list('pk', flat=True))
+
+    def _run(self, job_id):
+        close_old_connections()
+        try:
+            # A job can be queued twice (recovery, or by two processes); only one run takes it
+            claimed = VideoJob.objects.filter(pk=job_id, status='pending').update(
+                status='processing', updated_at=timezone.now()
+            )
+            if not claimed:
+                print(f"[VIDEO JOB] {job_id} is no longer pending; skipped")
+                return
+            run_video_job(VideoJob.objects.get(pk=job_id), self.process_pool)
+        except Exception as e:
+            print(f"[VIDEO JOB] {job_id} could not run: {e}")
+        finally:
+            close_old_connections()
+
+
+video_jobs = VideoJobRunner()
@@ -0,0 +1,252 @@
+import itertools
+
+import numpy as np
+from django.conf import settings
+
+from .yolo_service import get_detector, YOLOPPEDetector, PPE_FRAME_KEYS
+
+
+# Constant-velocity model over (cx, cy, w, h, vx, vy, vw, vh)
+_TRANSITION = np.eye(8)
+_TRANSITION[:4, 4:] = np.eye(4)
+_MEASUREMENT = np.eye(4, 8)
+
+
+class KalmanBoxTracker:
+    """Kalman filter for one person box; noise scales with the box height"""
+
+    def __init__(self, bbox):
+        x1, y1, x2, y2 = bbox
+        self.state = np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1, 0, 0, 0, 0], dtype=np.float64)
+        pos, vel = self._noise()
+        self.covariance = np.diag([pos * 4] * 4 + [vel * 100] * 4)
+
+    def _noise(self):
+        height = max(self.state[3], 1.0)
+        return (height / 20) ** 2, (height / 160) ** 2
+
+    def predict(self):
+        pos, vel = self._noise()
+        self.state = _TRANSITION @ self.state
+        self.state[2:4] = np.maximum(self.state[2:4], 1.0)
+        self.covariance = _TRANSITION @ self.covariance @ _TRANSITION.T + np.diag([pos] * 4 + [vel] * 4)
+
+    def update(self, bbox):
+        x1, y1, x2, y2 = bbox
+        measurement = np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1])
+        pos, _ = self._noise()
+
+        innovation = measurement - _MEASUREMENT @ self.state
+        innovation_cov = _MEASUREMENT @ self.covariance @ _MEASUREMENT.T + np.eye(4) * pos
+        gain = self.covariance @ _MEASUREMENT.T @ np.linalg.inv(innovation_cov)
+        self.state = self.state + gain @ innovation
+        self.covariance = (np.eye(8) - gain @ _MEASUREMENT) @ self.covariance
+
+    @property
+    def bbox(self):
+        cx, cy, w, h = self.state[:4]
+        return [float(cx - w / 2), float(cy - h / 2), float(cx + w / 2), float(cy + h / 2)]
+
+
+class PersonTrack:
+    """One worker across frames: Kalman box plus smoothed PPE state and cached compliance"""
+
+    # Hysteresis on the smoothed score so one noisy frame cannot flip an item
+    ON_THRESHOLD = 0.65
+    OFF_THRESHOLD = 0.35
+
+    def __init__(self, track_id, person, smoothing):
+        self.track_id = track_id
+        self.kalman = KalmanBoxTracker(person['bbox'])
+        self.smoothing = smoothing
+        self.confidence = person['confidence']
+        self.hits = 1
+        self.misses = 0
+        self.stable_updates = 0
+        self.ppe_score = {key: float(person['ppe'][key]['detected']) for key in PPE_FRAME_KEYS}
+        self.ppe_confidence = {key: person['ppe'][key]['confidence'] for key in PPE_FRAME_KEYS}
+        self.ppe_detected = {key: score >= 0.5 for key, score in self.ppe_score.items()}
+        self.is_compliant = None  # set once the track is confirmed, refreshed only when PPE state flips
+
+    def update(self, person):
+        self.kalman.update(person['bbox'])
+        self.confidence = person['confidence']
+        self.hits += 1
+        self.misses = 0
+
+        changed = False
+        for key in PPE_FRAME_KEYS:
+            observed = person['ppe'][key]
+            self.ppe_score[key] = (1 - self.smoothing) * self.ppe_score[key] + self.smoothing * float(observed['detected'])
+            self.ppe_confidence[key] = (1 - self.smoothing) * self.ppe_confidence[key] + self.smoothing * observed['confidence']
+
+            if self.ppe_detected[key] and self.ppe_score[key] < self.OFF_THRESHOLD:
+                self.ppe_detected[key] = False
+                changed = True
+            elif not self.ppe_detected[key] and self.ppe_score[key] > self.ON_THRESHOLD:
+                self.ppe_detected[key] = True
+                changed = True
+
+        self.stable_updates = 0 if changed else self.stable_updates + 1
+        return changed
+
+    @property
+    def missing_ppe(self):
+        return [key for key in PPE_FRAME_KEYS if not self.ppe_detected[key]]
+
+    def as_person(self):
+        return {
+            'track_id': self.track_id,
+            'bbox': self.kalman.bbox,
+            'confidence': round(self.confidence, 2),
+            'ppe': {
+                key: {'detected': self.ppe_detected[key], 'confidence': round(self.ppe_confidence[key], 2)}
+                for key in PPE_FRAME_KEYS
+            },
+            'is_compliant': self.is_compliant,
+            'missing_ppe': self.missing_ppe,
+            'hits': self.hits,
+        }
+
+
+class VideoSafetyMonitor:
+    """Streaming PPE analysis for consecutive video frames.
+
+    Persons from the detector are associated to tracks by IoU against the Kalman
+    prediction (greedy, highest IoU first). PPE is smoothed per track and compliance
+    is evaluated once per track when it is confirmed, then only when its smoothed PPE
+    state changes. While every track is confirmed and stable, up to
+    VIDEO_STABLE_SKIP_FRAMES frames in a row are served from the Kalman prediction
+    without running inference.
+    """
+
+    def __init__(self, detector=None, iou_threshold=0.3, smoothing=0.3,
+                 max_age=None, min_hits=None, max_skip=None):
+        self.detector = detector or get_detector()
+        self.iou_threshold = iou_threshold
+        self.smoothing = smoothing
+        self.max_age = settings.VIDEO_TRACK_MAX_AGE if max_age is None else max_age
+        self.min_hits = settings.VIDEO_TRACK_MIN_HITS if min_hits is None else min_hits
+        self.max_skip = settings.VIDEO_STABLE_SKIP_FRAMES if max_skip is None else max_skip
+
+        self.tracks = []
+        self._ids = itertools.count(1)
+        self.frames = 0
+        self.inference_frames = 0
+        self.frames_since_inference = 0
+        self.unmatched_last = 0
+        self.violating_tracks = set()
+        self.total_tracks = 0
+
+    def process_frame(self, frame):
+        """Update tracks with one frame; returns {'persons': [...], 'frame_stats': {...}}"""
+        self.frames += 1
+        for track in self.tracks:
+            track.kalman.predict()
+
+        new_violations = 0
+        ran_inference = self._should_infer()
+        if ran_inference:
+            persons = self.detector.detect_frame_persons(frame)
+            new_violations = self._update_tracks(persons)
+            self.inference_frames += 1
+            self.frames_since_inference = 0
+        else:
+            self.frames_since_inference += 1
+
+        persons = [track.as_person() for track in self.tracks if self._is_visible(track)]
+        compliant = sum(1 for person in persons if self._is_compliant(person))
+
+        return {
+            'persons': persons,
+            'frame_stats': {
+                'total': len(persons),
+                'compliant': compliant,
+                'violations': len(persons) - compliant,
+                'new_violations': new_violations,
+                'active_tracks': len(self.tracks),
+                'inference': ran_inference,
+            }
+        }
+
+    def summary(self):
+        """Per-video totals counted per track rather than per frame"""
+        return {
+            'frames': self.frames,
+            'inference_frames': self.inference_frames,
+            'tracked_persons': self.total_tracks,
+            'violating_persons': len(self.violating_tracks),
+        }
+
+    def _is_compliant(self, person):
+        if person.get('is_compliant') is not None:
+            return person['is_compliant']
+        ppe = person.get('ppe', {})
+        return all(ppe.get(key, {}).get('detected', False) for key in PPE_FRAME_KEYS)
+
+    def _is_visible(self, track):
+        # Tentative tracks are hidden, except while the monitor itself is warming up
+        return track.misses == 0 and (track.hits >= self.min_hits or self.inference_frames <= self.min_hits)
+
+    def _should_infer(self):
+        if self.frames_since_inference >= self.max_skip:
+            return True
+        if not self.tracks or self.unmatched_last:
+            return True
+        return not all(
+            track.misses == 0 and track.hits >= self.min_hits and track.stable_updates >= self.min_hits
+            for track in self.tracks
+        )
+
+    def _update_tracks(self, persons):
+        """Match detections to tracks; returns how many tracks became violations for the first time"""
+        matches, unmatched_tracks, unmatched_persons = self._associate(persons)
+
+        for track_idx, person_idx in matches:
+            self.tracks[track_idx].update(persons[person_idx])
+        for track_idx in unmatched_tracks:
+            self.tracks[track_idx].misses += 1
+            self.tracks[track_idx].stable_updates = 0
+        for person_idx in unmatched_persons:
+            self.tracks.append(PersonTrack(next(self._ids), persons[person_idx], self.smoothing))
+            self.total_tracks += 1
+
+        self.unmatched_last = len(unmatched_persons)
+        self.tracks = [track for track in self.tracks if track.misses <= self.max_age]
+
+        new_violations = 0
+        for track in self.tracks:
+            if track.hits < self.min_hits:
+                continue
+            if track.is_compliant is None or track.stable_updates == 0:
+                track.is_compliant = not track.missing_ppe
+            if not track.is_compliant and track.track_id not in self.violating_tracks:
+                self.violating_tracks.add(track.track_id)
+                new_violations += 1
+        return new_violations
+
+    def _associate(self, persons):
+        if not self.tracks or not persons:
+            return [], list(range(len(self.tracks))), list(range(len(persons)))
+
+        predicted = np.array([track.kalman.bbox for track in self.tracks])
+        detected = np.array([person['bbox'] for person in persons], dtype=np.float64)
+        iou = YOLOPPEDetector._iou_matrix(predicted, detected)
+
+        matches = []
+        used_tracks = np.zeros(len(self.tracks), dtype=bool)
+        used_persons = np.zeros(len(persons), dtype=bool)
+        for flat_idx in np.argsort(-iou, axis=None).tolist():
+            track_idx, person_idx = divmod(flat_idx, len(persons))
+            if iou[track_idx, person_idx] < self.iou_threshold:
+                break
+            if used_tracks[track_idx] or used_persons[person_idx]:
+                continue
+            used_tracks[track_idx] = used_persons[person_idx] = True
+            matches.append((track_idx, person_idx))
+
+        return (
+            matches,
+            np.flatnonzero(~used_tracks).tolist(),
+            np.flatnonzero(~used_persons).tolist(),
+        )
@@ -0,0 +1,100 @@
+import os
+import time
+
+import cv2
+
+
+# Entry points for the video process pool. Spawned children import this module to
+# unpickle their tasks before Django is set up, so nothing here may import settings,
+# models or app modules at the top level - they are imported inside the functions.
+
+
+def init_worker():
+    """Process-pool initializer: set up Django and keep each worker to its share of the CPU"""
+    import django
+    django.setup()
+
+    import torch
+    from django.conf import settings
+
+    cv2.setNumThreads(1)
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // max(1, settings.VIDEO_PROCESS_WORKERS)))
+
+
+def analyse_chunk(video_path, start_frame, end_frame, stride, fps):
+    """Process-pool task: run VideoSafetyMonitor over [start, end), at least `stride` frames apart.
+
+    The AdaptiveFrameSkipper widens the stride when inference cannot keep up with
+    the video's FPS and, if motion gating is on, skips frames that did not change.
+    Skipped frames are never decoded: large strides seek straight to the next frame,
+    small ones (below VIDEO_SEEK_MIN_STRIDE, where seeking back to a keyframe costs
+    more than it saves) grab() without retrieving.
+    """
+    from django.conf import settings
+
+    from .frame_skip import AdaptiveFrameSkipper
+    from .video_monitor import VideoSafetyMonitor
+    from .yolo_service import get_detector
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError("Could not open video")
+
+    monitor = VideoSafetyMonitor(detector=get_detector(settings.VIDEO_DETECTOR_MODE))
+    frame_skipper = AdaptiveFrameSkipper(source_fps=fps, min_stride=stride)
+    frames = []
+    tracks = {}
+
+    try:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        position = start_frame
+        frame_idx = start_frame
+        while frame_idx < end_frame:
+            step = frame_skipper.stride
+            if position != frame_idx and frame_idx - position >= settings.VIDEO_SEEK_MIN_STRIDE:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+                position = frame_idx
+            while position < frame_idx and cap.grab():
+                position += 1
+
+            ret, frame = cap.read()
+            if not ret:
+                break
+            position += 1
+            frame_skipper.observe_frames(step)
+            if not frame_skipper.motion_gate(frame):
+                frame_idx += step
+                continue
+
+            start = time.time()
+            result = monitor.process_frame(frame)
+            frame_skipper.record(time.time() - start)
+            frames.append({
+                'frame': frame_idx,
+                'time': round(frame_idx / fps, 2),
+                'stats': result['frame_stats']
+            })
+
+            for person in result['persons']:
+                track = tracks.setdefault(person['track_id'], {
+                    'first_frame': frame_idx,
+                    'first_bbox': person['bbox'],
+                    'violation': False,
+                })
+                track['last_frame'] = frame_idx
+                track['last_bbox'] = person['bbox']
+                if person['is_compliant'] is False:
+                    track['violation'] = True
+                    track['missing_ppe'] = person['missing_ppe']
+            frame_idx += step
+    finally:
+        cap.release()
+
+    return {
+        'start_frame': start_frame,
+        'end_frame': end_frame,
+        'frames': frames,
+        'tracks': tracks,
+        'inference_frames': monitor.summary()['inference_frames'],
+        'frame_skip': frame_skipper.metrics(),
+    }
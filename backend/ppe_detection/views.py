@@ -5,19 +5,34 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from django.core.files.base import ContentFile
 from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.conf import settings
 import os
 from datetime import timedelta
 import numpy as np  # ✅ ADD THIS LINE
 import cv2
-from .models import Detection, PersonDetection, Violation, PPEPolicy
+from analytics import rollups
+from analytics.statistics import dashboard_summary, filters_from_params
+from .models import Detection, PersonDetection, Violation, PPEPolicy, VideoJob
 from .serializers import (
-    DetectionSerializer, DetectionCreateSerializer,
+    DetectionSerializer, DetectionCreateSerializer, DetectionListSerializer,
     PersonDetectionSerializer, ViolationSerializer, PPEPolicySerializer,
     NotificationSerializer
 )
 from .yolo_service import get_detector
+from .services import run_detection, run_detection_batch
+from .jobs import detection_workers
+from .pagination import DetectionCursorPagination
+from .exports import EXPORT_FORMATS, stream_violations, violation_export_queryset
+from .ingest import camera_ingest
+from .video_monitor import VideoSafetyMonitor
+from .video_jobs import video_jobs
+from .frame_skip import AdaptiveFrameSkipper
+from .streaming import (
+    FrameBroker, frame_brokers, rtsp_manager, camera_manager, MJPEG_CONTENT_TYPE
+)
 from collections import deque
 
 from rest_framework.decorators import api_view, permission_classes
@@ -71,97 +86,36 @@ def health_check(request):
             'error': str(e)
         }, status=503)
 
-# ✅ RTSP Camera Manager with Threading
-class RTSPCameraManager:
-    _instance = None
-    _lock = threading.Lock()
-    
-    def __new__(cls):
-        if cls._instance is None:
-            with cls._lock:
-                if cls._instance is None:
-                    cls._instance = super().__new__(cls)
-                    cls._instance.streams = {}  # Store multiple camera streams
-        return cls._instance
-    
-    def get_stream(self, camera_id, rtsp_url):
-        """Get or create RTSP stream for a camera"""
-        with self._lock:
-            if camera_id not in self.streams or not self.streams[camera_id]['active']:
-                print(f"[RTSP] Opening stream for camera {camera_id}: {rtsp_url}")
-                
-                cap = cv2.VideoCapture(rtsp_url)
-                cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Reduce latency
-                
-                if not cap.isOpened():
-                    print(f"[ERROR] Failed to open RTSP stream: {rtsp_url}")
-                    return None
-                
-                self.streams[camera_id] = {
-                    'capture': cap,
-                    'active': True,
-                    'frame_queue': Queue(maxsize=2),
-                    'url': rtsp_url
-                }
-                
-                # Start frame reading thread
-                thread = threading.Thread(
-                    target=self._read_frames,
-                    args=(camera_id,),
-                    daemon=True
-                )
-                thread.start()
-            
-            return self.streams[camera_id]['capture']
-    
-    def _read_frames(self, camera_id):
-        """Continuously read frames in background thread"""
-        stream = self.streams.get(camera_id)
-        if not stream:
-            return
-        
-        cap = stream['capture']
-        queue = stream['frame_queue']
-        
-        while stream['active']:
-            ret, frame = cap.read()
-            if not ret:
-                print(f"[WARN] Failed to read frame from camera {camera_id}")
-                time.sleep(0.1)
-                continue
-            
-            # Keep only latest frame
-            if not queue.full():
-                queue.put(frame)
-            else:
-                try:
-                    queue.get_nowait()
-                    queue.put(frame)
-                except:
-                    pass
+
+
+def _mjpeg_response(frames):
+    """Uncached multipart MJPEG response around a broker's chunk generator"""
+    response = StreamingHttpResponse(frames, content_type=MJPEG_CONTENT_TYPE)
     
-    def get_latest_frame(self, camera_id):
-        """Get latest frame from queue"""
-        stream = self.streams.get(camera_id)
-        if not stream:
-            return None
-        
-        try:
-            return stream['frame_queue'].get(timeout=1)
-        except:
-            return None
+    response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+    response['Pragma'] = 'no-cache'
+    response['Expires'] = '0'
     
-    def release_stream(self, camera_id):
-        """Release specific camera stream"""
-        with self._lock:
-            if camera_id in self.streams:
-                print(f"[RTSP] Releasing stream for camera {camera_id}")
-                self.streams[camera_id]['active'] = False
-                if self.streams[camera_id]['capture']:
-                    self.streams[camera_id]['capture'].release()
-                del self.streams[camera_id]
+    return response
 
-rtsp_manager = RTSPCameraManager()
+
+def _open_webcam_broker(on_close):
+    """Shared detection broker for the local webcam"""
+    capture = camera_manager.get_camera()
+    
+    if capture is None:
+        print("[ERROR] Could not get camera")
+        return None
+    
+    return FrameBroker(
+        'webcam',
+        capture=capture,
+        release=camera_manager.release_camera,
+        frame_skipper=AdaptiveFrameSkipper(source_fps=capture.fps or None),
+        reuse_last_annotation=True,
+        max_fails=3,
+        on_close=on_close,
+    )
 
 
 @api_view(['GET'])
@@ -191,136 +145,48 @@ def rtsp_camera_stream(request):
         from django.http import HttpResponse
         return HttpResponse('Unauthorized: Invalid token', status=401)
     
-    def generate_frames():
-        from .yolo_service import get_detector
-        
-        # Get RTSP stream
-        cap = rtsp_manager.get_stream(camera_id, rtsp_url)
-        if not cap:
+    try:
+        target_fps = float(request.GET['fps']) if request.GET.get('fps') else None
+    except ValueError:
+        from django.http import HttpResponse
+        return HttpResponse('Invalid fps', status=400)
+    
+    tier = request.GET.get('tier', 'full')
+    if tier not in settings.MJPEG_TIERS:
+        from django.http import HttpResponse
+        return HttpResponse(f'Unknown tier: {tier}', status=400)
+    
+    def open_broker(on_close):
+        # Passive broker: the ingest scheduler runs inference and pushes results in
+        broker = FrameBroker(
+            f'rtsp:{camera_id}',
+            capture=None,
+            release=lambda: camera_ingest.remove_camera(camera_id),
+            on_close=on_close,
+        )
+        if not camera_ingest.add_camera(camera_id, rtsp_url, on_result=broker.publish_result,
+                                        target_fps=target_fps):
             print("[ERROR] Failed to initialize RTSP stream")
-            return
-        
-        detector = get_detector()
+            return None
         print(f"[RTSP] Streaming from: {rtsp_url}")
-        
-        frame_count = 0
-        process_every = 2  # Process every 2nd frame
-        fail_count = 0
-        max_fails = 10
-        
-        try:
-            while True:
-                # Get latest frame from queue
-                frame = rtsp_manager.get_latest_frame(camera_id)
-                
-                if frame is None:
-                    fail_count += 1
-                    if fail_count >= max_fails:
-                        print(f"[ERROR] {max_fails} consecutive failures")
-                        break
-                    time.sleep(0.1)
-                    continue
-                
-                fail_count = 0
-                frame_count += 1
-                
-                try:
-                    # Process every Nth frame
-                    if frame_count % process_every == 0:
-                        # Use fast video model
-                        result = detector.detect_frame(frame, use_fast_model=True)
-                        annotated_frame = result['results'].plot()
-                    else:
-                        annotated_frame = frame
-                    
-                    # Encode frame
-                    success, buffer = cv2.imencode('.jpg', annotated_frame, 
-                                                   [cv2.IMWRITE_JPEG_QUALITY, 70])
-                    
-                    if not success:
-                        continue
-                    
-                    frame_bytes = buffer.tobytes()
-                    
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-                
-                except GeneratorExit:
-                    print(f"[RTSP] Client disconnected")
-                    break
-                except Exception as e:
-                    print(f"[ERROR] Frame processing: {e}")
-                    continue
-        
-        except Exception as e:
-            print(f"[ERROR] Stream error: {e}")
-        finally:
-            rtsp_manager.release_stream(camera_id)
-            print(f"[RTSP] Stream ended for camera: {camera_id}")
+        return broker
     
-    response = StreamingHttpResponse(
-        generate_frames(),
-        content_type='multipart/x-mixed-replace; boundary=frame'
-    )
-    
-    response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-    response['Pragma'] = 'no-cache'
-    response['Expires'] = '0'
+    # All viewers of one camera share a single slot in the inference scheduler
+    frames = frame_brokers.subscribe(f'rtsp:{camera_id}', open_broker, tier=tier)
+    if frames is None:
+        from django.http import HttpResponse
+        return HttpResponse('Failed to open RTSP stream', status=503)
     
-    return response
+    return _mjpeg_response(frames)
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def stop_camera(request):
     """Force release camera"""
-    camera_manager.active_streams = 0
-    if camera_manager.camera is not None:
-        camera_manager.camera.release()
-        camera_manager.camera = None
+    camera_manager.force_release()
     
     return Response({'status': 'Camera forcefully released'})
 
-# ✅ GLOBAL CAMERA MANAGER
-class CameraManager:
-    _instance = None
-    _lock = threading.Lock()
-    
-    def __new__(cls):
-        if cls._instance is None:
-            with cls._lock:
-                if cls._instance is None:
-                    cls._instance = super().__new__(cls)
-                    cls._instance.camera = None
-                    cls._instance.active_streams = 0
-        return cls._instance
-    
-    def get_camera(self):
-        """Get or create camera instance"""
-        with self._lock:
-            if self.camera is None or not self.camera.isOpened():
-                print("[CAMERA] Opening new camera instance")
-                self.camera = cv2.VideoCapture(0)
-                if not self.camera.isOpened():
-                    print("[ERROR] Failed to open camera")
-                    return None
-            self.active_streams += 1
-            print(f"[CAMERA] Active streams: {self.active_streams}")
-            return self.camera
-    
-    def release_camera(self):
-        """Release camera if no active streams"""
-        with self._lock:
-            self.active_streams = max(0, self.active_streams - 1)
-            print(f"[CAMERA] Active streams: {self.active_streams}")
-            
-            if self.active_streams == 0 and self.camera is not None:
-                print("[CAMERA] Releasing camera (no active streams)")
-                self.camera.release()
-                self.camera = None
-                print("[CAMERA] ✅ Camera released successfully")
-
-# Global camera manager instance
-camera_manager = CameraManager()
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def live_webcam_stream(request):
@@ -342,111 +208,43 @@ def live_webcam_stream(request):
         from django.http import HttpResponse
         return HttpResponse('Unauthorized: Invalid token', status=401)
     
-    def generate_frames():
-        cap = camera_manager.get_camera()
-        
-        if cap is None:
-            print("[ERROR] Could not get camera")
-            return
-        
-        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-        cap.set(cv2.CAP_PROP_FPS, 30)
-        
-        from .yolo_service import get_detector
-        detector = get_detector()
-        print(f"[STREAM] Using FAST video model for {user.username}")
-        
-        frame_count = 0
-        fail_count = 0
-        max_fails = 1
-        process_every = 3
-        last_annotated = None
-        processing_times = deque(maxlen=30)
-        
-        try:
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    fail_count += 1
-                    if fail_count >= max_fails:
-                        print(f"[ERROR] {max_fails} consecutive failures")
-                        break
-                    time.sleep(0.05)
-                    continue
-                
-                fail_count = 0
-                frame_count += 1
-                
-                try:
-                    if frame_count % process_every == 0:
-                        start = time.time()
-                        
-                        # ✅ Use fast model for video
-                        result = detector.detect_frame(frame, use_fast_model=True)
-                        
-                        # Plot annotations
-                        annotated_frame = result['results'].plot()
-                        
-                        processing_time = time.time() - start
-                        processing_times.append(processing_time)
-                        
-                        last_annotated = annotated_frame
-                        
-                        if len(processing_times) > 0:
-                            avg_time = sum(processing_times) / len(processing_times)
-                            fps = 1 / avg_time if avg_time > 0 else 0
-                            if frame_count % 90 == 0:
-                                print(f"[VIDEO MODEL] FPS: {fps:.1f}, Processing: {avg_time*1000:.1f}ms")
-                    else:
-                        if last_annotated is not None:
-                            annotated_frame = last_annotated
-                        else:
-                            annotated_frame = frame
-                    
-                    success, buffer = cv2.imencode('.jpg', annotated_frame, 
-                                                [cv2.IMWRITE_JPEG_QUALITY, 70])
-                    
-                    if not success:
-                        continue
-                    
-                    frame_bytes = buffer.tobytes()
-                    
-                    yield (b'--frame\r\n'
-                        b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-                    
-                except GeneratorExit:
-                    print(f"[STREAM] Client disconnected")
-                    break
-                except Exception as e:
-                    print(f"[ERROR] {e}")
-                    continue
-        
-        except Exception as e:
-            print(f"[ERROR] Stream error: {e}")
-        finally:
-            camera_manager.release_camera()
-            print(f"[STREAM] ✅ Ended")
-
-    
-    response = StreamingHttpResponse(
-        generate_frames(),
-        content_type='multipart/x-mixed-replace; boundary=frame'
-    )
+    tier = request.GET.get('tier', 'full')
+    if tier not in settings.MJPEG_TIERS:
+        from django.http import HttpResponse
+        return HttpResponse(f'Unknown tier: {tier}', status=400)
     
-    response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-    response['Pragma'] = 'no-cache'
-    response['Expires'] = '0'
+    print(f"[STREAM] Using FAST video model for {user.username}")
+    frames = frame_brokers.subscribe('webcam', _open_webcam_broker, tier=tier)
+    if frames is None:
+        from django.http import HttpResponse
+        return HttpResponse('Could not open camera', status=503)
     
-    return response
+    return _mjpeg_response(frames)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def camera_stream_metrics(request):
+    """Latest detection metrics published by a shared camera stream"""
+    camera_id = request.GET.get('camera_id')
+    key = f'rtsp:{camera_id}' if camera_id else 'webcam'
+    
+    metrics = frame_brokers.latest_metrics(key)
+    if metrics is None:
+        return Response({'error': 'Stream not active'}, status=404)
+    return Response(metrics)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def camera_ingest_stats(request):
+    """Per-camera lag, drop and throughput counters of the RTSP inference scheduler"""
+    return Response(camera_ingest.stats())
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def force_release_camera(request):
     """Force release camera (admin/debug endpoint)"""
-    camera_manager.active_streams = 0
-    if camera_manager.camera is not None:
-        camera_manager.camera.release()
-        camera_manager.camera = None
+    camera_manager.force_release()
     
     return Response({
         'status': 'success',
@@ -483,7 +281,7 @@ def process_frame_with_annotation(request):
         
         # Process with YOLO
         start_time = time.time()
-        detector = get_detector()
+        detector = get_detector(settings.STREAM_DETECTOR_MODE)
         
         # Get raw results
         results = detector.model(frame)[0]
@@ -530,70 +328,6 @@ def process_frame_with_annotation(request):
         traceback.print_exc()
         return Response({'error': str(e)}, status=400)
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def live_camera_feed(request):
-    """Stream live camera feed with PPE detection"""
-    def generate_frames():
-        detector = get_detector()
-        cap = cv2.VideoCapture(0)
-        
-        if not cap.isOpened():
-            yield b''
-            return
-        
-        while True:
-            success, frame = cap.read()
-            if not success:
-                break
-            
-            try:
-                # Process with YOLO
-                results = detector.detect_frame(frame)
-                
-                # Annotate frame
-                for person in results.get('persons', []):
-                    bbox = person.get('bbox', [0, 0, 0, 0])
-                    x1, y1, x2, y2 = [int(c) for c in bbox]
-                    
-                    # Check compliance
-                    ppe = person.get('ppe', {})
-                    is_compliant = (
-                        ppe.get('helmet', {}).get('detected', False) and
-                        ppe.get('safety_vest', {}).get('detected', False) and
-                        ppe.get('face_mask', {}).get('detected', False)
-                    )
-                    
-                    # Color coding
-                    color = (0, 255, 0) if is_compliant else (0, 0, 255)
-                    
-                    # Draw bounding box
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), color, 3)
-                    
-                    # Label
-                    label = "✓ Compliant" if is_compliant else "✗ Violation"
-                    cv2.putText(frame, label, (x1, y1 - 10),
-                              cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-                
-                # Encode to JPEG
-                _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                frame_bytes = buffer.tobytes()
-                
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-                
-            except Exception as e:
-                print(f"Frame error: {e}")
-                continue
-        
-        cap.release()
-    
-    return StreamingHttpResponse(
-        generate_frames(),
-        content_type='multipart/x-mixed-replace; boundary=frame'
-    )
-
-
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def process_frame_metrics(request):
@@ -627,7 +361,7 @@ def process_frame_metrics(request):
         
         # Process with timing
         start_time = time.time()
-        detector = get_detector()
+        detector = get_detector(settings.STREAM_DETECTOR_MODE)
         results = detector.detect_frame(frame)
         processing_time = time.time() - start_time
         
@@ -666,79 +400,67 @@ def process_frame_metrics(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
-def export_violations_csv(request):
-    """Export violations to CSV (like Streamlit download)"""
-    import csv
-    from django.http import HttpResponse
-    
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="safetysnap_violations.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Timestamp', 'Violation Type', 'Severity', 'Confidence', 'Status', 'OSHA Standard'])
-    
-    violations = Violation.objects.filter(
-        detection__user=request.user
-    ).select_related('person_detection').order_by('-created_at')
+def export_violations(request):
+    """Stream the user's violations as CSV, NDJSON or Parquet (?output=csv|ndjson|parquet).
+    
+    Filters: ?site=<id>&start=YYYY-MM-DD&end=YYYY-MM-DD&severity=critical,high&status=open
+    Rows are read in chunks from a server-side cursor and written out as they
+    arrive, so memory stays flat however many violations are exported.
+    """
+    export_format = request.query_params.get('output', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return Response({'error': f"Unknown output: {export_format} (expected one of {', '.join(EXPORT_FORMATS)})"}, status=400)
+    if export_format == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return Response({'error': 'Parquet export needs pyarrow (pip install pyarrow)'}, status=400)
     
-    for v in violations:
-        writer.writerow([
-            v.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-            v.violation_type,
-            v.severity.upper(),
-            round(v.person_detection.confidence, 2) if v.person_detection else 0,
-            v.status.upper(),
-            v.osha_standard
-        ])
+    try:
+        filters = filters_from_params(request.query_params)
+        for name in ('severity', 'status'):
+            value = request.query_params.get(name)
+            filters[name] = [item.strip() for item in value.split(',') if item.strip()] if value else None
+        violations = violation_export_queryset(request.user, filters)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
     
+    content_type, extension = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(stream_violations(violations, export_format), content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="safetysnap_violations_{timezone.localdate().isoformat()}.{extension}"'
+    )
     return response
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def violation_statistics(request):
-    """Get violation statistics for dashboard"""
-    from django.db.models import Count, Q
-    from datetime import timedelta
-    
-    twenty_four_hours_ago = timezone.now() - timedelta(hours=24)
-    
-    # Get violations by severity
-    violations = Violation.objects.filter(
-        detection__user=request.user
-    )
-    
-    recent_violations = violations.filter(created_at__gte=twenty_four_hours_ago)
-    
-    by_severity = violations.values('severity').annotate(count=Count('id'))
-    by_status = violations.values('status').annotate(count=Count('id'))
-    
-    # Top violation types
-    top_violations = violations.values('violation_type').annotate(
-        count=Count('id')
-    ).order_by('-count')[:5]
+    """Get violation statistics for dashboard (optional ?site=&start=&end= filters)"""
+    try:
+        filters = filters_from_params(request.query_params)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
     
+    summary = dashboard_summary(request.user, **filters)
     return Response({
-        'total_violations': violations.count(),
-        'recent_violations': recent_violations.count(),
-        'by_severity': {item['severity']: item['count'] for item in by_severity},
-        'by_status': {item['status']: item['count'] for item in by_status},
-        'top_violations': list(top_violations),
-        'compliance_rate': calculate_overall_compliance(request.user)
+        'total_violations': summary['total_violations'],
+        'recent_violations': summary['recent_violations'],
+        'by_severity': summary['by_severity'],
+        'by_status': summary['by_status'],
+        'top_violations': summary['top_violations'],
+        'compliance_rate': summary['compliance_rate'],
     })
 
 
 def calculate_overall_compliance(user):
-    """Calculate overall compliance rate"""
-    detections = Detection.objects.filter(user=user, status='completed')
-    
-    if not detections.exists():
+    """Calculate overall compliance rate (share of completed scans that were fully compliant)"""
+    totals = rollups.user_totals(user)
+    total = totals['total_scans']
+    if total <= 0:
         return 100.0
     
-    compliant = detections.filter(compliance_status='compliant').count()
-    total = detections.count()
-    
-    return round((compliant / total) * 100, 2) if total > 0 else 100.0
+    return round((totals['compliant_scans'] / total) * 100, 2)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -761,7 +483,7 @@ def process_frame_metrics(request):
         
         # Process with timing
         start_time = time.time()
-        detector = get_detector()
+        detector = get_detector(settings.STREAM_DETECTOR_MODE)
         results = detector.detect_frame(frame)
         processing_time = time.time() - start_time
         
@@ -786,89 +508,19 @@ def process_frame_metrics(request):
         
     except Exception as e:
         return Response({'error': str(e)}, status=400)
-from django.http import HttpResponse
-import csv
-
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def export_violations_csv(request):
-    """Export violations to CSV (like Streamlit download feature)"""
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="violations_log.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Timestamp', 'Violation Type', 'Severity', 'Confidence', 'Status'])
-    
-    violations = Violation.objects.filter(
-        detection__user=request.user
-    ).order_by('-created_at')
-    
-    for v in violations:
-        writer.writerow([
-            v.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-            v.violation_type,
-            v.severity,
-            v.person_detection.confidence if v.person_detection else 0,
-            v.status
-        ])
-    
-    return response
-
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def live_camera_feed(request):
-    """Stream live camera feed with PPE detection"""
-    def generate_frames():
-        detector = get_detector()
-        cap = cv2.VideoCapture(0)  # Webcam
-        
-        while True:
-            success, frame = cap.read()
-            if not success:
-                break
-            
-            # Process frame with YOLO
-            try:
-                results = detector.detect_frame(frame)  # You'll need to add this method
-                
-                # Annotate frame (draw bounding boxes)
-                for person in results.get('persons', []):
-                    bbox = person.get('bbox', [0, 0, 0, 0])
-                    x1, y1, x2, y2 = [int(c) for c in bbox]
-                    
-                    # Color: Green if compliant, Red if not
-                    ppe = person.get('ppe', {})
-                    is_compliant = (
-                        ppe.get('helmet', {}).get('detected', False) and
-                        ppe.get('safety_vest', {}).get('detected', False) and
-                        ppe.get('face_mask', {}).get('detected', False)
-                    )
-                    
-                    color = (0, 255, 0) if is_compliant else (0, 0, 255)
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                    
-                    # Add label
-                    label = "✓ Compliant" if is_compliant else "✗ Violation"
-                    cv2.putText(frame, label, (x1, y1 - 10),
-                              cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-                
-                # Encode frame to JPEG
-                _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                frame_bytes = buffer.tobytes()
-                
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-                
-            except Exception as e:
-                print(f"Frame processing error: {e}")
-                continue
-        
-        cap.release()
+    """Stream live camera feed with PPE detection (shares the webcam broker)"""
+    tier = request.query_params.get('tier', 'full')
+    if tier not in settings.MJPEG_TIERS:
+        return Response({'error': f'Unknown tier: {tier}'}, status=400)
     
-    return StreamingHttpResponse(
-        generate_frames(),
-        content_type='multipart/x-mixed-replace; boundary=frame'
-    )
+    frames = frame_brokers.subscribe('webcam', _open_webcam_broker, tier=tier)
+    if frames is None:
+        return Response({'error': 'Could not open camera'}, status=503)
+    
+    return _mjpeg_response(frames)
 
 
 @api_view(['GET'])
@@ -927,74 +579,76 @@ import cv2
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def process_video(request):
-    """Process uploaded video file"""
+    """Queue an uploaded video for background analysis; poll video/jobs/<id>/ for progress"""
     video_file = request.FILES.get('video')
     
     if not video_file:
         return Response({'error': 'No video file provided'}, status=400)
     
-    # Save video temporarily
-    import tempfile
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as tmp:
-        for chunk in video_file.chunks():
-            tmp.write(chunk)
-        video_path = tmp.name
-    
-    # Process video
-    monitor = VideoSafetyMonitor()
-    cap = cv2.VideoCapture(video_path)
-    
-    results = []
-    frame_count = 0
-    
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-        
-        # Process every 5th frame for speed
-        if frame_count % 5 == 0:
-            result = monitor.process_frame(frame)
-            results.append({
-                'frame': frame_count,
-                'stats': result['frame_stats']
-            })
-        
-        frame_count += 1
-    
-    cap.release()
-    os.unlink(video_path)
+    job = VideoJob.objects.create(user=request.user, video=video_file)
+    transaction.on_commit(lambda: video_jobs.submit(job.id))
     
     return Response({
-        'total_frames': frame_count,
-        'processed_frames': len(results),
-        'summary': {
-            'avg_persons': sum(r['stats']['total'] for r in results) / len(results) if results else 0,
-            'avg_violations': sum(r['stats']['violations'] for r in results) / len(results) if results else 0
-        },
-        'frame_results': results
-    })
+        'job_id': str(job.id),
+        'status': job.status,
+        'status_url': f'/api/ppe/video/jobs/{job.id}/',
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def video_job_status(request, job_id):
+    """Progress of a video analysis job, with the merged timeline once completed"""
+    try:
+        job = VideoJob.objects.get(id=job_id, user=request.user)
+    except VideoJob.DoesNotExist:
+        return Response({'error': 'Video job not found'}, status=404)
+    
+    data = {
+        'job_id': str(job.id),
+        'status': job.status,
+        'progress': round(job.progress, 3),
+        'chunks_done': job.chunks_done,
+        'chunks_total': job.chunks_total,
+        'total_frames': job.total_frames,
+        'created_at': job.created_at,
+        'updated_at': job.updated_at,
+    }
+    if job.status == 'completed':
+        data['processing_time'] = job.processing_time
+        data.update(job.result or {})
+    elif job.status == 'failed':
+        data['error'] = job.error
+    
+    return Response(data)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def webcam_stream(request):
-    """Stream webcam with PPE detection"""
-    def generate():
-        monitor = VideoSafetyMonitor()
-        cap = cv2.VideoCapture(0)  # Webcam
-        
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            # Process frame
-            result = monitor.process_frame(frame)
+    """Stream webcam with tracked PPE detection (track IDs), shared by all viewers"""
+    tier = request.query_params.get('tier', 'full')
+    if tier not in settings.MJPEG_TIERS:
+        return Response({'error': f'Unknown tier: {tier}'}, status=400)
+    
+    def open_broker(on_close):
+        capture = camera_manager.get_camera()
+        if capture is None:
+            return None
+        
+        monitor = VideoSafetyMonitor(detector=get_detector(settings.STREAM_DETECTOR_MODE))
+        state = {'persons': []}
+        
+        def annotate(frame, infer):
+            # Skipped frames keep the last tracked boxes
+            metrics = None
+            if infer:
+                result = monitor.process_frame(frame)
+                state['persons'] = result['persons']
+                metrics = result['frame_stats']
             
-            # Annotate frame
             annotated = frame.copy()
-            for person in result['persons']:
+            for person in state['persons']:
                 x1, y1, x2, y2 = [int(c) for c in person['bbox']]
                 
                 is_compliant = monitor._is_compliant(person)
@@ -1003,33 +657,59 @@ def webcam_stream(request):
                 cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
                 cv2.putText(annotated, f"ID: {person['track_id']}", (x1, y1-10),
                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-            
-            # Encode frame
-            _, buffer = cv2.imencode('.jpg', annotated)
-            frame_bytes = buffer.tobytes()
-            
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-        
-        cap.release()
+            return annotated, metrics
+        
+        return FrameBroker(
+            'webcam:tracked',
+            capture=capture,
+            release=camera_manager.release_camera,
+            frame_skipper=AdaptiveFrameSkipper(source_fps=capture.fps or None),
+            annotate=annotate,
+            max_fails=3,
+            on_close=on_close,
+        )
+    
+    frames = frame_brokers.subscribe('webcam:tracked', open_broker, tier=tier)
+    if frames is None:
+        return Response({'error': 'Could not open camera'}, status=503)
     
-    return StreamingHttpResponse(generate(), content_type='multipart/x-mixed-replace; boundary=frame')
+    return _mjpeg_response(frames)
+
+def _request_flag(request, name, default=False):
+    """Read a boolean option from the query string or form data"""
+    value = request.query_params.get(name, request.data.get(name))
+    if value is None or value == '':
+        return default
+    return str(value).lower() in ('1', 'true', 'yes', 'on')
+
 
 class DetectionViewSet(viewsets.ModelViewSet):
     """ViewSet for Detection operations"""
     serializer_class = DetectionSerializer
     permission_classes = [IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser, JSONParser]
-    pagination_class = None
+    pagination_class = DetectionCursorPagination
     
     def get_queryset(self):
         """Get detections for current user only"""
-        queryset = Detection.objects.filter(user=self.request.user).select_related(
-            'site', 'policy', 'user'
-        ).prefetch_related(
-            'person_detections',
-            'violations'
-        ).order_by('-created_at')
+        queryset = Detection.objects.filter(user=self.request.user)
+        
+        if self.action == 'list':
+            # Correlated count: only evaluated for the rows of the requested page
+            violation_counts = Violation.objects.filter(detection=OuterRef('pk')).order_by().values(
+                'detection'
+            ).annotate(count=Count('id')).values('count')
+            queryset = queryset.select_related('site').annotate(
+                num_violations=Coalesce(Subquery(violation_counts), 0)
+            )
+        else:
+            queryset = queryset.select_related(
+                'site', 'policy', 'user'
+            ).prefetch_related(
+                'person_detections',
+                'violations'
+            )
+        queryset = queryset.order_by('-created_at')
         
         # Apply filters if provided
         site = self.request.query_params.get('site', None)
@@ -1049,229 +729,136 @@ class DetectionViewSet(viewsets.ModelViewSet):
         """Return appropriate serializer based on action"""
         if self.action == 'create':
             return DetectionCreateSerializer
+        if self.action == 'list':
+            return DetectionListSerializer
         return DetectionSerializer
     
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        """Delete a detection and take it back out of the daily rollups"""
+        rollups.remove_detection(instance)
+        instance.delete()
+    
     @action(detail=False, methods=['get'])
     def statistics(self, request):
-        """Get detection statistics for current user only"""
-        queryset = Detection.objects.filter(user=request.user)
-        
-        total_detections = queryset.count()
-        
-        if total_detections == 0:
-            return Response({
-                'total_detections': 0,
-                'total_persons_scanned': 0,
-                'total_violations': 0,
-                'compliant': 0,
-                'partial_compliant': 0,
-                'non_compliant': 0,
-                'compliance_rate': 0,
-            })
-        
-        total_persons = sum(d.total_persons_detected for d in queryset)
-        total_violations = Violation.objects.filter(detection__user=request.user).count()
-        
-        compliant = queryset.filter(compliance_status='compliant').count()
-        partial = queryset.filter(compliance_status='partial').count()
-        non_compliant = queryset.filter(compliance_status='non_compliant').count()
+        """Get detection statistics for current user only (optional ?site=&start=&end= filters)"""
+        try:
+            filters = filters_from_params(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
         
+        summary = dashboard_summary(request.user, **filters)
         return Response({
-            'total_detections': total_detections,
-            'total_persons_scanned': total_persons,
-            'total_violations': total_violations,
-            'compliant': compliant,
-            'partial_compliant': partial,
-            'non_compliant': non_compliant,
-            'compliance_rate': (compliant / total_detections * 100) if total_detections > 0 else 0,
+            'total_detections': summary['total_detections'],
+            'total_persons_scanned': summary['total_persons_scanned'],
+            'total_violations': summary['total_violations'],
+            'compliant': summary['compliant'],
+            'partial_compliant': summary['partial_compliant'],
+            'non_compliant': summary['non_compliant'],
+            'compliance_rate': summary['compliance_rate'] if summary['total_detections'] > 0 else 0,
         })
     
-    @transaction.atomic
     def create(self, request, *args, **kwargs):
-        """Create a new detection"""
+        """Create a new detection (202 + pending row in job mode, 201 with results otherwise)"""
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        image = serializer.validated_data.get('original_image')
-        
-        # REMOVED: policy_id logic - no longer needed
+        if _request_flag(request, 'async', settings.DETECTION_JOB_MODE):
+            detection = serializer.save(
+                user=request.user,
+                status='pending',
+                policy=None
+            )
+            transaction.on_commit(detection_workers.enqueue)
+            
+            output_serializer = DetectionSerializer(detection)
+            return Response(output_serializer.data, status=status.HTTP_202_ACCEPTED)
         
+        upload = serializer.validated_data['original_image']
         detection = serializer.save(
             user=request.user,
-           
             status='processing',
             policy=None  # No policy
         )
         
+        # Decode from the upload in memory instead of reading the stored file back
+        upload.seek(0)
+        data = upload.read()
+        
+        # Inference runs outside any transaction; results are written in one short one
         try:
-            detector = get_detector()
-            print(f"[VIEWS] Using detector: {type(detector).__name__}")
-            
-            image_path = detection.original_image.path
-            print(f"[VIEWS] Processing image: {image_path}")
-            
-            results = detector.detect(image_path)
-            print(f"[VIEWS] Detection results: {results.get('num_persons')} persons found")
-            
-            # Save annotated image
-            if results.get('annotated_image_path'):
-                annotated_path = results['annotated_image_path']
-                if os.path.exists(annotated_path):
-                    with open(annotated_path, 'rb') as f:
-                        detection.annotated_image.save(
-                            os.path.basename(annotated_path),
-                            ContentFile(f.read()),
-                            save=False
-                        )
-                    try:
-                        os.remove(annotated_path)
-                    except:
-                        pass
-            
-            detection.total_persons_detected = results.get('num_persons', 0)
-            detection.confidence_score = results.get('avg_confidence', 0)
-            detection.processing_time = results.get('processing_time', 0)
-            detection.status = 'completed'
-            
-            compliant_count = 0
-            non_compliant_count = 0
-            
-            # SIMPLIFIED: Always check Helmet, Vest, Mask (no policy)
-            for idx, person in enumerate(results.get('persons', [])):
-                bbox = person.get('bbox', [0, 0, 0, 0])
-                ppe = person.get('ppe', {})
-                
-                # Check ONLY these 3 items
-                has_helmet = ppe.get('helmet', {}).get('detected', False)
-                has_vest = ppe.get('safety_vest', {}).get('detected', False)
-                has_mask = ppe.get('face_mask', {}).get('detected', False)
-                
-                missing_items = []
-                if not has_helmet:
-                    missing_items.append('helmet')
-                if not has_vest:
-                    missing_items.append('safety_vest')
-                if not has_mask:
-                    missing_items.append('face_mask')
-                
-                is_compliant = len(missing_items) == 0
-                
-                if is_compliant:
-                    compliant_count += 1
-                else:
-                    non_compliant_count += 1
-                
-                person_detection = PersonDetection.objects.create(
-                    detection=detection,
-                    person_id=idx + 1,
-                    bbox_x1=float(bbox[0]),
-                    bbox_y1=float(bbox[1]),
-                    bbox_x2=float(bbox[2]),
-                    bbox_y2=float(bbox[3]),
-                    confidence=float(person.get('confidence', 0)),
-                    helmet_detected=has_helmet,
-                    helmet_confidence=float(ppe.get('helmet', {}).get('confidence', 0)),
-                    vest_detected=has_vest,
-                    vest_confidence=float(ppe.get('safety_vest', {}).get('confidence', 0)),
-                    boots_detected=ppe.get('safety_boots', {}).get('detected', False),
-                    boots_confidence=float(ppe.get('safety_boots', {}).get('confidence', 0)),
-                    gloves_detected=ppe.get('gloves', {}).get('detected', False),
-                    gloves_confidence=float(ppe.get('gloves', {}).get('confidence', 0)),
-                    glasses_detected=ppe.get('safety_glasses', {}).get('detected', False),
-                    glasses_confidence=float(ppe.get('safety_glasses', {}).get('confidence', 0)),
-                    mask_detected=has_mask,
-                    mask_confidence=float(ppe.get('face_mask', {}).get('confidence', 0)),
-                    harness_detected=ppe.get('harness', {}).get('detected', False),
-                    harness_confidence=float(ppe.get('harness', {}).get('confidence', 0)),
-                    is_compliant=is_compliant,
-                    missing_ppe=missing_items
-                )
-                
-                # Create violation if non-compliant
-                if not is_compliant and missing_items:
-                    violation_desc = f"Person {idx + 1} is missing: {', '.join([item.replace('_', ' ').title() for item in missing_items])}"
-                    
-                    # Severity based on what's missing
-                    severity = 'medium'
-                    if 'helmet' in missing_items:
-                        severity = 'critical'
-                    elif 'safety_vest' in missing_items:
-                        severity = 'high'
-                    
-                    osha_standard = "29 CFR 1910.132"
-                    if 'helmet' in missing_items:
-                        osha_standard = "29 CFR 1910.135"
-                    
-                    Violation.objects.create(
-                        detection=detection,
-                        person_detection=person_detection,
-                        violation_type=f"Missing PPE: {', '.join([item.replace('_', ' ').title() for item in missing_items])}",
-                        severity=severity,
-                        description=violation_desc,
-                        recommendation=f"Worker must wear {', '.join([item.replace('_', ' ') for item in missing_items])} before entering work area",
-                        osha_standard=osha_standard,
-                        status='open'
-                    )
-            
-            detection.compliant_persons = compliant_count
-            detection.non_compliant_persons = non_compliant_count
-            
-            # Overall compliance
-            if detection.total_persons_detected == 0:
-                detection.compliance_status = 'compliant'
-            elif compliant_count == detection.total_persons_detected:
-                detection.compliance_status = 'compliant'
-            elif non_compliant_count == detection.total_persons_detected:
-                detection.compliance_status = 'non_compliant'
-            else:
-                detection.compliance_status = 'partial'
-            
-            detection.save()
-            # After detection.save()
-            # ✅ Create notification
-            from .models import Notification
-
-            if detection.compliance_status == 'compliant':
-                notif_type = 'success'
-                title = '✓ Full Compliance'
-                message = f'All {detection.total_persons_detected} persons are compliant'
-            elif detection.compliance_status == 'non_compliant':
-                notif_type = 'danger'
-                title = '✗ Non-Compliant'
-                message = f'{detection.non_compliant_persons} out of {detection.total_persons_detected} persons have violations'
-            else:
-                notif_type = 'warning'
-                title = '⚠ Partial Compliance'
-                message = f'{detection.compliant_persons} compliant, {detection.non_compliant_persons} non-compliant'
-
-            Notification.objects.create(
-                user=request.user,
-                type=notif_type,
-                title=title,
-                message=message,
-                detection=detection
-            )
-
-            
-            output_serializer = DetectionSerializer(detection)
-            return Response(output_serializer.data, status=status.HTTP_201_CREATED)
-            
+            run_detection(detection, data=data)
         except Exception as e:
-            import traceback
-            error_trace = traceback.format_exc()
-            print(f"Detection error: {error_trace}")
-            
-            detection.status = 'failed'
-            detection.notes = str(e)
-            detection.save()
-            
             return Response(
                 {'error': f'Detection failed: {str(e)}'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-
-
-
+        
+        output_serializer = DetectionSerializer(detection)
+        return Response(output_serializer.data, status=status.HTTP_201_CREATED)
+    
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request):
+        """Upload a set of images (field 'images') and run them through batched inference"""
+        images = request.FILES.getlist('images')
+        
+        if not images:
+            return Response({'error': 'No images provided'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(images) > settings.DETECTION_BULK_MAX_IMAGES:
+            return Response(
+                {'error': f'At most {settings.DETECTION_BULK_MAX_IMAGES} images per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        shared = {
+            key: request.data.get(key)
+            for key in ('site', 'location_lat', 'location_lng', 'notes', 'inference_mode')
+            if request.data.get(key) not in (None, '')
+        }
+        create_serializers = [DetectionCreateSerializer(data={**shared, 'original_image': image}) for image in images]
+        for serializer in create_serializers:
+            serializer.is_valid(raise_exception=True)
+        
+        job_mode = _request_flag(request, 'async', settings.DETECTION_JOB_MODE)
+        
+        with transaction.atomic():
+            detections = [
+                serializer.save(
+                    user=request.user,
+                    status='pending' if job_mode else 'processing',
+                    policy=None
+                )
+                for serializer in create_serializers
+            ]
+            if job_mode:
+                transaction.on_commit(detection_workers.enqueue)
+        
+        if job_mode:
+            output_serializer = DetectionSerializer(detections, many=True)
+            return Response(output_serializer.data, status=status.HTTP_202_ACCEPTED)
+        
+        run_detection_batch(detections)
+        
+        output_serializer = DetectionSerializer(detections, many=True)
+        return Response(output_serializer.data, status=status.HTTP_201_CREATED)
+    
+    @action(detail=True, methods=['get'], url_path='status')
+    def job_status(self, request, pk=None):
+        """Poll the processing state of a detection job"""
+        detection = self.get_object()
+        
+        data = {
+            'id': str(detection.id),
+            'status': detection.status,
+            'created_at': detection.created_at,
+            'updated_at': detection.updated_at,
+        }
+        if detection.status == 'completed':
+            data['detection'] = DetectionSerializer(detection).data
+        elif detection.status == 'failed':
+            data['error'] = detection.notes
+        
+        return Response(data)
 
 
 class ViolationViewSet(viewsets.ReadOnlyModelViewSet):
@@ -1299,10 +886,11 @@ class ViolationViewSet(viewsets.ReadOnlyModelViewSet):
     def acknowledge(self, request, pk=None):
         """Acknowledge a violation"""
         violation = self.get_object()
-        violation.status = 'acknowledged'
-        violation.acknowledged_by = request.user
-        violation.acknowledged_at = timezone.now()
-        violation.save()
+        set_violation_status(
+            violation, 'acknowledged',
+            acknowledged_by=request.user,
+            acknowledged_at=timezone.now()
+        )
         
         serializer = self.get_serializer(violation)
         return Response(serializer.data)
@@ -1311,15 +899,33 @@ class ViolationViewSet(viewsets.ReadOnlyModelViewSet):
     def resolve(self, request, pk=None):
         """Resolve a violation"""
         violation = self.get_object()
-        violation.status = 'resolved'
-        violation.resolved_by = request.user
-        violation.resolved_at = timezone.now()
-        violation.save()
+        set_violation_status(
+            violation, 'resolved',
+            resolved_by=request.user,
+            resolved_at=timezone.now()
+        )
         
         serializer = self.get_serializer(violation)
         return Response(serializer.data)
 
 
+def set_violation_status(violation, new_status, **fields):
+    """Change a violation's status and move it between the rollup status counters.
+
+    The row is locked while its old status is read, so concurrent changes of the
+    same violation are counted once each.
+    """
+    with transaction.atomic():
+        old_status = Violation.objects.select_for_update().values_list('status', flat=True).get(pk=violation.pk)
+        violation.status = new_status
+        for name, value in fields.items():
+            setattr(violation, name, value)
+        violation.save()
+        rollups.record_status_change(
+            violation.detection.user_id, timezone.localdate(violation.detection.created_at), old_status, new_status
+        )
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_notifications(request):
@@ -1408,12 +1014,15 @@ def mark_notification_read(request, notification_id):
         if notification_id.startswith('violation_'):
             violation_id = int(notification_id.split('_')[1])
             try:
-                violation = Violation.objects.get(id=violation_id, detection__user=request.user)
+                violation = Violation.objects.select_related('detection').get(
+                    id=violation_id, detection__user=request.user
+                )
                 if violation.status == 'open':
-                    violation.status = 'acknowledged'
-                    violation.acknowledged_by = request.user
-                    violation.acknowledged_at = timezone.now()
-                    violation.save()
+                    set_violation_status(
+                        violation, 'acknowledged',
+                        acknowledged_by=request.user,
+                        acknowledged_at=timezone.now()
+                    )
                 return Response({'status': 'success', 'message': 'Notification marked as read'})
             except Violation.DoesNotExist:
                 return Response({'error': 'Violation not found'}, status=404)
@@ -1428,14 +1037,24 @@ def mark_notification_read(request, notification_id):
 @permission_classes([IsAuthenticated])
 def mark_all_notifications_read(request):
     """Mark all notifications as read"""
-    Violation.objects.filter(
-        detection__user=request.user,
-        status='open'
-    ).update(
-        status='acknowledged',
-        acknowledged_by=request.user,
-        acknowledged_at=timezone.now()
-    )
+    from collections import Counter
+    
+    with transaction.atomic():
+        # Lock the open violations so the rollups move exactly the rows that get updated
+        opened = list(Violation.objects.select_for_update(of=('self',)).filter(
+            detection__user=request.user,
+            status='open'
+        ).values_list('id', 'detection__created_at'))
+        
+        Violation.objects.filter(id__in=[violation_id for violation_id, _ in opened]).update(
+            status='acknowledged',
+            acknowledged_by=request.user,
+            acknowledged_at=timezone.now()
+        )
+        
+        per_day = Counter(timezone.localdate(created_at) for _, created_at in opened)
+        for day, count in per_day.items():
+            rollups.record_status_change(request.user.id, day, 'open', 'acknowledged', count)
     return Response({'status': 'success'})
 
 
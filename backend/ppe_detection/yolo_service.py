@@ -1,16 +1,175 @@
-from ultralytics import YOLO
 import cv2
-import math
+import hashlib
+import io
+from concurrent.futures import ThreadPoolExecutor
 import os
+import threading
+import time
 from django.conf import settings
 import numpy as np
-from PIL import Image
+from PIL import Image, ImageOps
 import torch
 
+from .backends import load_inference_model
+from .result_cache import result_cache
+
+
+class ModelRegistry:
+    """Process-wide registry of loaded models, keyed by (weight file path, inference backend)"""
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance.models = {}
+                    cls._instance.generation = 0
+        return cls._instance
+
+    def get(self, weight_path, backend=None):
+        """Return the model for a weight file, loading it once per process and reloading it when the file changes"""
+        key = (weight_path, backend or settings.INFERENCE_BACKEND)
+        entry = self.models.get(key)
+        if entry is not None and not self._changed_on_disk(entry):
+            return entry['model']
+
+        with self._lock:
+            current = self.models.get(key)
+            # Another thread may have loaded or reloaded it while we waited
+            if current is None or current is entry:
+                current = self._load(*key, previous=entry)
+            return current['model']
+
+    def warmup(self, weight_path, imgsz=640, backend=None):
+        """Run one dummy inference so the first real request does not pay for lazy init"""
+        model = self.get(weight_path, backend)
+        entry = self.models[(weight_path, backend or settings.INFERENCE_BACKEND)]
+        if entry['warm']:
+            return
+
+        start = time.time()
+        model(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), verbose=False)
+        entry['warm'] = True
+        print(f"[MODEL REGISTRY] Warmed up {os.path.basename(entry['source'])} in {(time.time() - start) * 1000:.0f}ms")
+
+    def version(self, weight_path, backend=None):
+        """Return the content hash of the currently loaded model file"""
+        self.get(weight_path, backend)
+        return self.models[(weight_path, backend or settings.INFERENCE_BACKEND)]['sha256']
+
+    def loaded_versions(self):
+        """(generation, content hashes of every loaded model), read together under the lock"""
+        with self._lock:
+            return self.generation, {entry['sha256'] for entry in self.models.values()}
+
+    def _load(self, weight_path, backend, previous=None):
+        start = time.time()
+        # `source` is the exported model for onnx/openvino (or the .pt if it has not been exported)
+        model, source = load_inference_model(weight_path, backend)
+
+        entry = {
+            'path': weight_path,
+            'backend': backend,
+            'source': source,
+            'model': model,
+            'mtime': os.path.getmtime(source),
+            'sha256': self._file_digest(source),
+            'checked_at': time.monotonic(),
+            'warm': False,
+        }
+        self.models[(weight_path, backend)] = entry
+
+        if previous is not None:
+            self.generation += 1
+            print(f"[MODEL REGISTRY] 🔄 Reloaded {os.path.basename(source)} (weights changed on disk)")
+        else:
+            device = torch.cuda.get_device_name(0) if torch.cuda.is_available() else 'CPU'
+            print(f"[MODEL REGISTRY] ✅ Loaded {os.path.basename(source)} ({backend}) on {device} in {time.time() - start:.2f}s")
+        return entry
+
+    def _changed_on_disk(self, entry):
+        """Cheap mtime check, throttled; only hash the file when the mtime moved"""
+        interval = getattr(settings, 'MODEL_RELOAD_CHECK_INTERVAL', 5.0)
+        if interval < 0:
+            return False
+
+        now = time.monotonic()
+        if now - entry['checked_at'] < interval:
+            return False
+        entry['checked_at'] = now
+
+        source = entry['source']
+        try:
+            mtime = os.path.getmtime(source)
+        except OSError:
+            # File is being replaced; keep serving the loaded weights
+            return False
+
+        if mtime == entry['mtime']:
+            return False
+
+        if self._file_digest(source) == entry['sha256']:
+            entry['mtime'] = mtime
+            return False
+        return True
+
+    @staticmethod
+    def _file_digest(path):
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+
+model_registry = ModelRegistry()
+
+
+# Compact detector output: one record per box, built from a single boxes.data transfer
+DETECTION_DTYPE = np.dtype([
+    ('bbox', np.float64, (4,)),
+    ('confidence', np.float64),
+    ('class_id', np.int16),
+])
+
+PPE_FRAME_KEYS = ('helmet', 'safety_vest', 'face_mask')
+
+# Input size the models run at; images larger than this are downscaled to it
+MODEL_INPUT_SIZE = 640
+
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# EXIF orientation tag -> transform that makes the decoded pixels upright
+EXIF_ORIENTATION = 0x0112
+EXIF_TRANSFORMS = {
+    2: lambda img: cv2.flip(img, 1),
+    3: lambda img: cv2.rotate(img, cv2.ROTATE_180),
+    4: lambda img: cv2.flip(img, 0),
+    5: lambda img: cv2.transpose(img),
+    6: lambda img: cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE),
+    7: lambda img: cv2.flip(cv2.transpose(img), -1),
+    8: lambda img: cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE),
+}
+
+
+# Detector modes: 'default' runs INFERENCE_BACKEND, 'quantized' the INT8 model from `manage.py quantize_model`
+DETECTOR_MODE_BACKENDS = {
+    'default': None,
+    'quantized': 'onnx_int8',
+}
+
+
 class YOLOPPEDetector:
     """Dual-model PPE Detector: Fast model for video, Accurate model for images"""
     
-    def __init__(self):
+    def __init__(self, mode='default'):
        
         image_model_path = os.path.join(settings.BASE_DIR, 'YOLO11n.pt')
         
@@ -29,283 +188,601 @@ class YOLOPPEDetector:
             else:
                 raise FileNotFoundError(f"Image model not found in {settings.BASE_DIR}")
         
+        self.registry = model_registry
+        self.mode = mode
+        self.backend = DETECTOR_MODE_BACKENDS[mode]
+        self.image_conf = settings.DETECTION_IMAGE_CONF
+        self.frame_conf = settings.DETECTION_FRAME_CONF
+        self.iou = settings.DETECTION_IOU
+        self.image_model_path = image_model_path
         
-        self.image_model = YOLO(image_model_path)
-        self.model = self.image_model  # Default reference
-        
-    
         if os.path.exists(video_model_path):
-            self.video_model = YOLO(video_model_path)
-            print(f"[PPE DETECTOR] ✅ Loaded IMAGE model: {os.path.basename(image_model_path)}")
-            print(f"[PPE DETECTOR] ✅ Loaded VIDEO model: {os.path.basename(video_model_path)}")
+            self.video_model_path = video_model_path
+            print(f"[PPE DETECTOR] IMAGE model: {os.path.basename(image_model_path)}")
+            print(f"[PPE DETECTOR] VIDEO model: {os.path.basename(video_model_path)}")
         else:
-           
-            self.video_model = self.image_model
+            self.video_model_path = image_model_path
             print(f"[PPE DETECTOR] ⚠️ Using single model: {os.path.basename(image_model_path)}")
             print(f"[PPE DETECTOR] 💡 Tip: Add 'best.pt' for faster video streaming")
         
         self.classNames = ['Hardhat', 'Mask', 'NO-Hardhat', 'NO-Mask', 'NO-Safety Vest', 
                           'Person', 'Safety Cone', 'Safety Vest', 'machinery', 'vehicle']
-        
-        if torch.cuda.is_available():
-            self.image_model.to('cuda')
-            self.video_model.to('cuda')
-            print(f"[PPE DETECTOR]  Using GPU: {torch.cuda.get_device_name(0)}")
-        else:
-            print("[PPE DETECTOR]  Using CPU")
+        self._build_lookup_tables()
     
-    def _load_image(self, image_path: str):
-        
-        try:
-            pil_image = Image.open(image_path)
-            
-            if pil_image.mode != 'RGB':
-                print(f"[IMAGE] Converting {pil_image.mode} to RGB")
-                pil_image = pil_image.convert('RGB')
-            
-            img = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
-            
-            print(f"[IMAGE] Loaded: {image_path} ({pil_image.format}, {pil_image.mode})")
-            return img
+    def _build_lookup_tables(self):
+        """Per-class tables so names, colors and PPE state are array lookups (last row = Unknown)"""
+        names = self.classNames + ['Unknown']
+        self.unknown_class_id = len(self.classNames)
+        self.person_class_id = self.classNames.index('Person')
+        self.class_name_lut = np.array(names, dtype=object)
+        
+        colors = []
+        ppe_key = []
+        ppe_present = []
+        for class_name in names:
+            if class_name in ['Mask', 'Hardhat', 'Safety Vest']:
+                colors.append((0, 255, 0))
+            elif class_name in ['NO-Hardhat', 'NO-Mask', 'NO-Safety Vest']:
+                colors.append((0, 0, 255))
+            elif class_name in ['machinery', 'vehicle']:
+                colors.append((0, 149, 255))
+            else:
+                colors.append((85, 45, 255))
             
-        except Exception as e:
-            print(f"[ERROR] PIL failed, trying cv2: {e}")
-            img = cv2.imread(image_path)
-            if img is None:
-                raise ValueError(f"Could not read image: {image_path}")
-            return img
+            class_lower = class_name.lower()
+            key = -1
+            if 'helmet' in class_lower or 'hardhat' in class_lower:
+                key = 0
+            elif 'vest' in class_lower or 'jacket' in class_lower:
+                key = 1
+            elif 'mask' in class_lower:
+                key = 2
+            ppe_key.append(key)
+            ppe_present.append('no' not in class_lower)
+        
+        self.color_lut = np.array(colors, dtype=np.int32)
+        self.ppe_key_lut = np.array(ppe_key, dtype=np.int8)
+        self.ppe_present_lut = np.array(ppe_present, dtype=bool)
+        self.ppe_item_mask = np.array(
+            [n not in ('Person', 'Safety Cone', 'machinery', 'vehicle') for n in names], dtype=bool
+        )
+    
+    def _to_detection_array(self, result):
+        """Copy a Results' boxes to a DETECTION_DTYPE array with one device->host transfer"""
+        data = result.boxes.data.cpu().numpy()  # (N, 6): x1, y1, x2, y2, conf, cls (+ track id when tracking)
+        detections = np.empty(len(data), dtype=DETECTION_DTYPE)
+        if len(data) == 0:
+            return detections
+        
+        detections['bbox'] = data[:, :4]
+        detections['confidence'] = data[:, -2]
+        class_ids = data[:, -1].astype(np.int16)
+        detections['class_id'] = np.where(
+            (class_ids >= 0) & (class_ids < self.unknown_class_id), class_ids, self.unknown_class_id
+        )
+        return detections
+    
+    @property
+    def image_model(self):
+        return self.registry.get(self.image_model_path, self.backend)
+    
+    @property
+    def video_model(self):
+        return self.registry.get(self.video_model_path, self.backend)
+    
+    @property
+    def model(self):
+        """Default reference (image model)"""
+        return self.image_model
+    
+    def warmup(self):
+        """Load and warm up both models ahead of the first request"""
+        self.registry.warmup(self.image_model_path, backend=self.backend)
+        if self.video_model_path != self.image_model_path:
+            self.registry.warmup(self.video_model_path, backend=self.backend)
+    
+    def _decode_image(self, data, reduce=False):
+        """Decode image bytes to BGR with EXIF orientation applied; returns (image, (full_width, full_height)).
+        
+        cv2.imdecode goes straight to BGR (no PIL -> NumPy -> cvtColor copies). With
+        `reduce`, JPEGs are decoded at 1/2, 1/4 or 1/8 scale through libjpeg's DCT
+        scaling (IMREAD_REDUCED_*), keeping the long side >= MODEL_INPUT_SIZE, which
+        is all inference needs. Only the header is read through PIL (size, format,
+        orientation); PIL decodes only what OpenCV cannot.
+        """
+        try:
+            header = Image.open(io.BytesIO(data))
+            width, height = header.size
+            image_format = header.format
+            orientation = header.getexif().get(EXIF_ORIENTATION, 1)
+        except Exception:
+            width = height = image_format = None
+            orientation = 1
+        
+        reduction = 1
+        if reduce and image_format == 'JPEG':
+            for factor in (8, 4, 2):
+                if max(width, height) / factor >= MODEL_INPUT_SIZE:
+                    reduction = factor
+                    break
+        
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        img = cv2.imdecode(buffer, REDUCED_DECODE_FLAGS[reduction] | cv2.IMREAD_IGNORE_ORIENTATION)
+        if img is None:
+            # Formats OpenCV cannot decode
+            pil_image = ImageOps.exif_transpose(Image.open(io.BytesIO(data))).convert('RGB')
+            img = cv2.cvtColor(np.asarray(pil_image), cv2.COLOR_RGB2BGR)
+            print(f"[IMAGE] Decoded {pil_image.size[0]}x{pil_image.size[1]} {image_format} with PIL")
+            return img, pil_image.size
+        
+        if orientation in EXIF_TRANSFORMS:
+            img = EXIF_TRANSFORMS[orientation](img)
+        if width is None:
+            width, height = img.shape[1], img.shape[0]
+        full_size = (height, width) if orientation in (5, 6, 7, 8) else (width, height)
+        
+        if reduction > 1:
+            print(f"[IMAGE] Decoded {width}x{height} {image_format} at 1/{reduction} scale for inference")
+        return img, full_size
+    
+    @staticmethod
+    def _scale_detections(detections, img, full_size):
+        """Map boxes from a reduced decode back to full-resolution coordinates (in place)"""
+        height, width = img.shape[:2]
+        if (width, height) != tuple(full_size):
+            sx, sy = full_size[0] / width, full_size[1] / height
+            detections['bbox'] *= (sx, sy, sx, sy)
+        return detections
     
     
     def detect_frame(self, frame, use_fast_model=True):
         
         model = self.video_model if use_fast_model else self.image_model
         
-      
-        results = model(frame, verbose=False, conf=0.5, iou=0.5)[0]
+        results = model(frame, verbose=False, conf=self.frame_conf, iou=self.iou)[0]
+        return self._frame_result(results)
+    
+    def detect_frames(self, frames, use_fast_model=True):
+        """detect_frame() for several frames (e.g. from different cameras) in one model call"""
+        if not frames:
+            return []
+        model = self.video_model if use_fast_model else self.image_model
         
-        persons = []
-        for box in results.boxes:
-            cls_id = int(box.cls[0])
-            class_name = self.classNames[cls_id] if cls_id < len(self.classNames) else "Unknown"
-            confidence = float(box.conf[0])
-            
-            x1, y1, x2, y2 = box.xyxy[0].tolist()
-            
-            person_data = {
-                'bbox': [x1, y1, x2, y2],
+        results = model(list(frames), verbose=False, conf=self.frame_conf, iou=self.iou)
+        return [self._frame_result(r) for r in results]
+    
+    def detect_frame_persons(self, frame, use_fast_model=True):
+        """Per-person PPE for a video frame, using the same association as image uploads"""
+        model = self.video_model if use_fast_model else self.image_model
+        
+        results = model(frame, verbose=False, conf=self.frame_conf, iou=self.iou)[0]
+        detections = self._to_detection_array(results)
+        height, width = frame.shape[:2]
+        return self._build_person_data_optimized(detections, width, height, verbose=False)
+    
+    def _frame_result(self, results):
+        detections = self._to_detection_array(results)
+        
+        class_ids = detections['class_id']
+        ppe_keys = self.ppe_key_lut[class_ids].tolist()
+        ppe_present = self.ppe_present_lut[class_ids].tolist()
+        bboxes = detections['bbox'].tolist()
+        confidences = detections['confidence'].tolist()
+        
+        persons = [
+            {
+                'bbox': bbox,
                 'confidence': confidence,
-                'ppe': self._extract_ppe_from_class(class_name, confidence)
+                'ppe': self._frame_ppe(key, present, confidence)
             }
-            persons.append(person_data)
+            for bbox, confidence, key, present in zip(bboxes, confidences, ppe_keys, ppe_present)
+        ]
         
         return {
             'persons': persons,
             'num_persons': len(persons),
+            'detections': detections,
             'results': results  
         }
 
-    def _extract_ppe_from_class(self, class_name, confidence):
-     
-        ppe = {
-            'helmet': {'detected': False, 'confidence': 0},
-            'safety_vest': {'detected': False, 'confidence': 0},
-            'face_mask': {'detected': False, 'confidence': 0},
-        }
-        
-        class_lower = class_name.lower()
-        if 'helmet' in class_lower or 'hardhat' in class_lower:
-            ppe['helmet'] = {'detected': 'no' not in class_lower, 'confidence': confidence}
-        if 'vest' in class_lower or 'jacket' in class_lower:
-            ppe['safety_vest'] = {'detected': 'no' not in class_lower, 'confidence': confidence}
-        if 'mask' in class_lower:
-            ppe['face_mask'] = {'detected': 'no' not in class_lower, 'confidence': confidence}
-        
+    @staticmethod
+    def _frame_ppe(key, present, confidence):
+        """PPE dict for a single frame box from its class lookup (key index into PPE_FRAME_KEYS)"""
+        ppe = {name: {'detected': False, 'confidence': 0} for name in PPE_FRAME_KEYS}
+        if key >= 0:
+            ppe[PPE_FRAME_KEYS[key]] = {'detected': present, 'confidence': confidence}
         return ppe
 
 
-    def detect(self, image_path: str):
-        """Detect PPE with accurate model (for image uploads)"""
-        import time
+    def detect(self, image_path: str, sliced=False, data=None):
+        """Detect PPE with accurate model (for image uploads); `sliced` adds tiled passes for small workers.
+        
+        `data` is the image's bytes when they are already in memory (e.g. the upload);
+        otherwise they are read from image_path.
+        """
         start_time = time.time()
         
         print(f"\n{'='*70}")
         print(f"PROCESSING IMAGE: {os.path.basename(image_path)}")
         print(f"{'='*70}")
         
-        img = self._load_image(image_path)
+        if data is None:
+            with open(image_path, 'rb') as f:
+                data = f.read()
+        cache_key, model_version = self._cache_key(data, sliced)
+        cached = result_cache.get(cache_key, model_version)
+        if cached is not None:
+            processing_time = time.time() - start_time
+            print(f"[CACHE] Hit: {cached['num_persons']} persons, inference skipped ({processing_time * 1000:.0f}ms)\n")
+            return dict(cached, cache_hit=True, processing_time=round(processing_time, 2))
+        
+        # Tiles need every pixel; a plain pass only needs ~model resolution
+        img, full_size = self._decode_image(data, reduce=not sliced)
+        print(f"Image: {full_size[0]}x{full_size[1]}px")
+        
+        if sliced:
+            detections, slicing = self._detect_sliced(img)
+        else:
+            result = self.image_model(img, verbose=False, conf=self.image_conf, iou=self.iou)[0]
+            detections, slicing = self._scale_detections(self._to_detection_array(result), img, full_size), None
+            if img.shape[1::-1] != tuple(full_size):
+                img = self._decode_image(data)[0]  # full resolution for the annotation
         
-        height, width = img.shape[:2]
-        print(f"Image: {width}x{height}px")
+        output = self._postprocess_image(img, detections)
+        if slicing is not None:
+            output['slicing'] = slicing
+        result_cache.put(cache_key, model_version, output)
         
-      
-        results = self.image_model(img, stream=True, conf=0.4, iou=0.5)
+        processing_time = time.time() - start_time
+        output['processing_time'] = round(processing_time, 2)
+        print(f"[TIME] {processing_time:.2f}s (Accurate Model{', sliced' if sliced else ''})\n")
         
-        all_detections = []
+        return output
+    
+    def detect_batch(self, image_paths, batch_size=None):
+        """Detect PPE on many images: parallel reduced-size decode, fixed-size inference batches.
         
-        for r in results:
-            boxes = r.boxes
-            for box in boxes:
-                x1, y1, x2, y2 = box.xyxy[0]
-                x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                
-                conf = math.ceil((box.conf[0] * 100)) / 100
-                cls = int(box.cls[0])
-                class_name = self.classNames[cls] if cls < len(self.classNames) else "Unknown"
+        Returns one result dict per path, in order. A path that cannot be decoded
+        or processed yields {'error': ...} instead of failing the whole batch.
+        """
+        batch_size = batch_size or settings.DETECTION_BATCH_SIZE
+        start_time = time.time()
+        
+        def load(path):
+            """{'data', 'key', 'version', 'image' (reduced decode), 'full_size', 'cached'} or None"""
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                cache_key, model_version = self._cache_key(data)
+                item = {'data': data, 'key': cache_key, 'version': model_version, 'image': None,
+                        'cached': result_cache.get(cache_key, model_version)}
+                if item['cached'] is None:
+                    item['image'], item['full_size'] = self._decode_image(data, reduce=True)
+                return item
+            except Exception as e:
+                print(f"[BATCH] Could not decode {path}: {e}")
+                return None
+        
+        def postprocess(idx, result):
+            item = loaded[idx]
+            img = item['image']
+            detections = self._scale_detections(self._to_detection_array(result), img, item['full_size'])
+            if img.shape[1::-1] != tuple(item['full_size']):
+                img = self._decode_image(item['data'])[0]  # full resolution for the annotation
+            output = self._postprocess_image(img, detections)
+            result_cache.put(item['key'], item['version'], output)
+            return output
+        
+        outputs = [None] * len(image_paths)
+        with ThreadPoolExecutor(max_workers=settings.DETECTION_DECODE_WORKERS) as pool:
+            loaded = list(pool.map(load, image_paths))
+            decode_time = time.time() - start_time
+            
+            valid = [idx for idx, item in enumerate(loaded) if item is not None and item['image'] is not None]
+            for idx, item in enumerate(loaded):
+                if item is None:
+                    outputs[idx] = {'error': f'Could not read image: {image_paths[idx]}'}
+                elif item['cached'] is not None:
+                    outputs[idx] = dict(item['cached'], cache_hit=True,
+                                        processing_time=round(decode_time / len(image_paths), 2))
+            
+            for offset in range(0, len(valid), batch_size):
+                chunk = valid[offset:offset + batch_size]
+                batch_start = time.time()
                 
-                print(f"  - {class_name}: {conf:.0%}")
+                results = self.image_model(
+                    [loaded[idx]['image'] for idx in chunk], verbose=False, conf=self.image_conf, iou=self.iou
+                )
                 
-                if class_name in ['Mask', 'Hardhat', 'Safety Vest']:
-                    color = (0, 255, 0)
-                elif class_name in ['NO-Hardhat', 'NO-Mask', 'NO-Safety Vest']:
-                    color = (0, 0, 255)
-                elif class_name in ['machinery', 'vehicle']:
-                    color = (0, 149, 255)
-                else:
-                    color = (85, 45, 255)
+                # Full-resolution decode + annotation of the chunk in parallel
+                futures = [pool.submit(postprocess, idx, result) for idx, result in zip(chunk, results)]
+                for idx, future in zip(chunk, futures):
+                    try:
+                        outputs[idx] = future.result()
+                    except Exception as e:
+                        outputs[idx] = {'error': str(e)}
+                    loaded[idx] = None  # release the decoded frame and bytes early
                 
-                if conf > 0.4:
-                    all_detections.append({
-                        'class': class_name,
-                        'bbox': [x1, y1, x2, y2],
-                        'confidence': conf,
-                        'color': color
-                    })
+                # Attribute batch cost evenly to its images
+                per_image = (time.time() - batch_start) / len(chunk) + decode_time / max(len(valid), 1)
+                for idx in chunk:
+                    if 'error' not in outputs[idx]:
+                        outputs[idx]['processing_time'] = round(per_image, 2)
         
-        print(f"\n[RESULTS] {len(all_detections)} detections")
+        total_time = time.time() - start_time
+        print(f"[BATCH] {len(image_paths)} images in {total_time:.2f}s "
+              f"({total_time / max(len(image_paths), 1):.2f}s/image, batch size {batch_size})")
         
-        annotated_path = self._create_annotated_image(img, all_detections, image_path)
-        persons = self._build_person_data_optimized(all_detections, width, height)
+        return outputs
+    
+    def _cache_key(self, data, sliced=False):
+        """Result cache key for image bytes under the current model and settings; (key, model version)"""
+        model_version = self.registry.version(self.image_model_path, self.backend)
+        result_cache.sync(self.registry)
+        params = {
+            'conf': self.image_conf,
+            'iou': self.iou,
+            'annotation': [settings.ANNOTATION_FORMAT, settings.ANNOTATION_QUALITY],
+            'sliced': [settings.SLICE_SIZE, settings.SLICE_OVERLAP, settings.SLICE_MIN_PERSON_PX,
+                       settings.SLICE_MATCH_THRESHOLD] if sliced else False,
+        }
+        return result_cache.make_key(data, model_version, params), model_version
+    
+    def _detect_sliced(self, img):
+        """SAHI-style sliced inference: full-image pass plus overlapping tiles, merged with NMS.
+        
+        Tiling is skipped when the image already fits the model input, or when every
+        person found by the full pass is at least SLICE_MIN_PERSON_PX tall after the
+        downscale to MODEL_INPUT_SIZE. All tiles go through the model in one call.
+        Returns (detections, slicing report).
+        """
+        height, width = img.shape[:2]
+        start = time.time()
+        result = self.image_model(img, verbose=False, conf=self.image_conf, iou=self.iou)[0]
+        full = self._to_detection_array(result)
+        full_ms = (time.time() - start) * 1000
+        
+        tiles = self._plan_tiles(width, height, settings.SLICE_SIZE, settings.SLICE_OVERLAP)
+        skipped = self._slicing_skip_reason(full, width, height, len(tiles))
+        if skipped:
+            print(f"[SLICED] Tiling skipped: {skipped}")
+            return full, {'tiles': 0, 'skipped': skipped, 'full_ms': round(full_ms, 1), 'added_ms': 0.0}
+        
+        start = time.time()
+        results = self.image_model(
+            [img[y1:y2, x1:x2] for x1, y1, x2, y2 in tiles], verbose=False, conf=self.image_conf, iou=self.iou
+        )
+        parts = [full]
+        for (x1, y1, _, _), result in zip(tiles, results):
+            tile_detections = self._to_detection_array(result)
+            tile_detections['bbox'] += (x1, y1, x1, y1)
+            parts.append(tile_detections)
+        detections = self._merge_detections(np.concatenate(parts), settings.SLICE_MATCH_THRESHOLD)
+        added_ms = (time.time() - start) * 1000
+        
+        print(f"[SLICED] {len(tiles)} tiles: +{added_ms:.0f}ms over the full pass ({full_ms:.0f}ms), "
+              f"{added_ms / len(tiles):.1f}ms/tile, {len(detections)} detections after merge")
+        return detections, {
+            'tiles': len(tiles),
+            'skipped': None,
+            'full_ms': round(full_ms, 1),
+            'added_ms': round(added_ms, 1),
+            'per_tile_ms': round(added_ms / len(tiles), 1),
+        }
+    
+    @staticmethod
+    def _plan_tiles(width, height, size, overlap):
+        """Overlapping size x size tiles covering the image; the last row/column is aligned to the edge"""
+        step = max(1, int(size * (1 - overlap)))
+        
+        def starts(length):
+            if length <= size:
+                return [0]
+            return list(range(0, length - size, step)) + [length - size]
+        
+        return [
+            (x, y, min(x + size, width), min(y + size, height))
+            for y in starts(height) for x in starts(width)
+        ]
+    
+    def _slicing_skip_reason(self, detections, width, height, tile_count):
+        """Why tiling would not help this image, or None"""
+        if tile_count <= 1:
+            return 'image fits the model input'
+        
+        persons = detections[detections['class_id'] == self.person_class_id]
+        if not len(persons):
+            return None
+        scale = min(1.0, MODEL_INPUT_SIZE / max(width, height))
+        smallest = float((persons['bbox'][:, 3] - persons['bbox'][:, 1]).min()) * scale
+        if smallest >= settings.SLICE_MIN_PERSON_PX:
+            return f'smallest person is {smallest:.0f}px tall at model input'
+        return None
+    
+    @staticmethod
+    def _merge_detections(detections, threshold):
+        """Class-wise greedy NMS over full-image and tile detections.
+        
+        Overlap is intersection over the smaller box (as SAHI does), so a box cut
+        off at a tile edge is suppressed by the complete box from a neighbouring
+        tile or from the full-image pass.
+        """
+        if len(detections) < 2:
+            return detections
+        
+        detections = detections[np.argsort(-detections['confidence'], kind='stable')]
+        boxes = detections['bbox']
+        a = boxes[:, None, :]
+        inter_w = np.clip(np.minimum(a[..., 2], boxes[:, 2]) - np.maximum(a[..., 0], boxes[:, 0]), 0, None)
+        inter_h = np.clip(np.minimum(a[..., 3], boxes[:, 3]) - np.maximum(a[..., 1], boxes[:, 1]), 0, None)
+        areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+        smaller = np.minimum(areas[:, None], areas[None, :])
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            overlap = np.where(smaller > 0, inter_w * inter_h / smaller, 0.0)
+        class_ids = detections['class_id']
+        suppress = (overlap > threshold) & (class_ids[:, None] == class_ids[None, :])
+        
+        keep = np.ones(len(detections), dtype=bool)
+        for idx in range(len(detections)):
+            if keep[idx]:
+                keep[idx + 1:] &= ~suppress[idx, idx + 1:]
+        return detections[keep]
+    
+    def _postprocess_image(self, img, detections):
+        """Turn one image's detections into annotation and per-person PPE"""
+        height, width = img.shape[:2]
+        
+        # Integer pixel boxes and confidence rounded up to 2 decimals
+        detections['bbox'] = np.trunc(detections['bbox'])
+        # Ceil in float32 like the model output, divide in float64 so 0.4 is exactly 0.4 for the cut below
+        detections['confidence'] = np.ceil(detections['confidence'].astype(np.float32) * np.float32(100)).astype(np.float64) / 100
+        detections = detections[detections['confidence'] > 0.4]
+        
+        names, counts = np.unique(self.class_name_lut[detections['class_id']].astype(str), return_counts=True)
+        summary = ', '.join(f"{name} x{count}" for name, count in zip(names, counts))
+        print(f"\n[RESULTS] {len(detections)} detections{': ' + summary if summary else ''}")
+        
+        annotated_image, annotated_ext = self._encode_annotated_image(img, detections)
+        persons = self._build_person_data_optimized(detections, width, height)
         
         is_compliant = all(p['ppe']['helmet']['detected'] and 
                           p['ppe']['safety_vest']['detected'] and
                           p['ppe']['face_mask']['detected'] 
                           for p in persons) if persons else False
         
-        processing_time = time.time() - start_time
-        print(f"[TIME] {processing_time:.2f}s (Accurate Model)\n")
-        
         return {
             'num_persons': len(persons),
             'persons': persons,
-            'avg_confidence': np.mean([d['confidence'] for d in all_detections]) if all_detections else 0,
-            'processing_time': round(processing_time, 2),
-            'annotated_image_path': annotated_path,
+            'detections': detections,
+            'avg_confidence': float(detections['confidence'].mean()) if len(detections) else 0,
+            'annotated_image': annotated_image,
+            'annotated_image_ext': annotated_ext,
             'is_compliant': is_compliant
         }
     
-    def _build_person_data_optimized(self, all_detections, width, height):
-        """Optimized person-PPE association with enhanced mask detection"""
-        if not all_detections:
+    def _person_regions(self, person_boxes):
+        """Build head/face/upper-body/full-body regions for all persons: (P, 4, 4)"""
+        px1, py1, px2, py2 = person_boxes.T
+        h = py2 - py1
+        head = np.stack([px1 - 80, py1 - 100, px2 + 80, py1 + h * 0.4], axis=1)
+        face = np.stack([px1 - 60, py1 - 50, px2 + 60, py1 + h * 0.25], axis=1)
+        upper_body = np.stack([px1 - 70, py1 + h * 0.15, px2 + 70, py1 + h * 0.7], axis=1)
+        full_body = np.stack([px1 - 120, py1 - 120, px2 + 120, py2 + 120], axis=1)
+        return np.stack([head, face, upper_body, full_body], axis=1)
+    
+    @staticmethod
+    def _iou_matrix(boxes1, boxes2):
+        """IoU between every box in boxes1 (..., 4) and boxes2 (K, 4): (..., K)"""
+        a = boxes1[..., None, :]
+        inter_w = np.clip(np.minimum(a[..., 2], boxes2[:, 2]) - np.maximum(a[..., 0], boxes2[:, 0]), 0, None)
+        inter_h = np.clip(np.minimum(a[..., 3], boxes2[:, 3]) - np.maximum(a[..., 1], boxes2[:, 1]), 0, None)
+        intersection = inter_w * inter_h
+        
+        area1 = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+        area2 = (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1])
+        union = area1 + area2 - intersection
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(union > 0, intersection / union, 0.0)
+    
+    @staticmethod
+    def _assign(eligible, keys, fit):
+        """One-to-one matching of persons to items over the whole image: (P,) item index or -1.
+        
+        Every eligible (person, item) pair is ranked by keys ((P, K) arrays, most
+        significant first, higher is better), then by lowest item index, and taken
+        best-first unless its person or item is already matched. An item that
+        several persons rank equally goes to the best fit ((P, K), then lowest person
+        index) instead of to whoever comes first in detection order.
+        """
+        assigned = np.full(eligible.shape[0], -1, dtype=np.intp)
+        person_idx, item_idx = np.nonzero(eligible)
+        if len(person_idx) == 0:
+            return assigned
+        
+        # lexsort sorts by its last key first
+        order = np.lexsort((
+            person_idx, -fit[person_idx, item_idx], item_idx,
+            *[-key[person_idx, item_idx] for key in reversed(keys)]
+        ))
+        item_taken = np.zeros(eligible.shape[1], dtype=bool)
+        for person, item in zip(person_idx[order].tolist(), item_idx[order].tolist()):
+            if assigned[person] < 0 and not item_taken[item]:
+                assigned[person] = item
+                item_taken[item] = True
+        return assigned
+    
+    def _build_person_data_optimized(self, all_detections, width, height, verbose=True):
+        """Optimized person-PPE association with enhanced mask detection.
+        
+        Region IoUs for every (person, PPE item) pair come from one NumPy pass.
+        Each PPE kind is then matched globally (see _assign): a person gets their
+        most confident helmet/vest and best-placed mask, and a box two overlapping
+        persons could both claim goes to the one whose region it fits best.
+        """
+        if len(all_detections) == 0:
             return []
         
-        person_detections = [d for d in all_detections if d['class'] == 'Person']
-        ppe_items = [d for d in all_detections if d['class'] != 'Person' and d['class'] not in ['Safety Cone', 'machinery', 'vehicle']]
+        class_ids = all_detections['class_id']
+        person_detections = all_detections[class_ids == self.person_class_id]
+        ppe_items = all_detections[self.ppe_item_mask[class_ids] & (class_ids != self.person_class_id)]
         
-        if not person_detections:
+        if len(person_detections) == 0:
             return self._create_single_person_from_ppe(ppe_items, width, height)
         
-        assigned_ppe = set()
+        person_boxes = person_detections['bbox']
+        ppe_boxes = ppe_items['bbox']
+        ppe_conf = ppe_items['confidence']
+        ppe_class = self.class_name_lut[ppe_items['class_id']]
+        
+        # (P, 4 regions, K) -> head, face, upper_body, full_body overlaps
+        overlaps = self._iou_matrix(self._person_regions(person_boxes), ppe_boxes)
+        head, face, body, full = overlaps[:, 0], overlaps[:, 1], overlaps[:, 2], overlaps[:, 3]
+        
+        is_helmet = np.isin(ppe_class, ['Hardhat', 'NO-Hardhat'])
+        is_vest = np.isin(ppe_class, ['Safety Vest', 'NO-Safety Vest'])
+        is_mask = np.isin(ppe_class, ['Mask', 'NO-Mask'])
+        
+        helmet_score = head * 2.0 + full * 0.5
+        vest_score = body * 2.0 + full * 0.5
+        mask_score = np.maximum.reduce([face * 3.0, head * 2.0, full * 0.8])
+        conf = np.broadcast_to(ppe_conf, mask_score.shape)
+        
+        helmets = self._assign(is_helmet & (helmet_score > 0.05), (conf,), helmet_score)
+        vests = self._assign(is_vest & (vest_score > 0.05), (conf,), vest_score)
+        masks = self._assign(is_mask & (mask_score > 0.02), (mask_score, conf), mask_score)
+        
         persons = []
         
-        for idx, person_det in enumerate(person_detections):
-            px1, py1, px2, py2 = person_det['bbox']
-            person_conf = person_det['confidence']
-            person_height = py2 - py1
-            
-            print(f"\n  Person #{idx+1} at ({px1:.0f}, {py1:.0f}, {px2:.0f}, {py2:.0f})")
-            
-            regions = {
-                'head': [px1 - 80, py1 - 100, px2 + 80, py1 + (person_height * 0.4)],
-                'face': [px1 - 60, py1 - 50, px2 + 60, py1 + (person_height * 0.25)],
-                'upper_body': [px1 - 70, py1 + (person_height * 0.15), px2 + 70, py1 + (person_height * 0.7)],
-                'full_body': [px1 - 120, py1 - 120, px2 + 120, py2 + 120]
-            }
-            
-            ppe_tracking = {
-                'helmet': {'detected': False, 'confidence': 0.0, 'source': None, 'ppe_id': None},
-                'vest': {'detected': False, 'confidence': 0.0, 'source': None, 'ppe_id': None},
-                'mask': {'detected': False, 'confidence': 0.0, 'source': None, 'ppe_id': None}
-            }
+        for idx, (person_box, person_conf) in enumerate(zip(person_boxes.tolist(), person_detections['confidence'].tolist())):
+            px1, py1, px2, py2 = person_box
             
-            mask_candidates = []
-            
-            for ppe_idx, ppe in enumerate(ppe_items):
-                ppe_id = f"{ppe['class']}_{ppe_idx}"
-                
-                if ppe_id in assigned_ppe:
+            ppe_tracking = {}
+            for key, item_idx, present_class in (
+                ('helmet', helmets[idx], 'Hardhat'),
+                ('vest', vests[idx], 'Safety Vest'),
+                ('mask', masks[idx], 'Mask'),
+            ):
+                if item_idx < 0:
+                    ppe_tracking[key] = {'detected': False, 'confidence': 0.0, 'source': None}
                     continue
-                
-                ppe_class = ppe['class']
-                ppe_bbox = ppe['bbox']
-                ppe_conf = ppe['confidence']
-                
-                head_overlap = self._calculate_overlap_score(regions['head'], ppe_bbox)
-                face_overlap = self._calculate_overlap_score(regions['face'], ppe_bbox)
-                body_overlap = self._calculate_overlap_score(regions['upper_body'], ppe_bbox)
-                full_overlap = self._calculate_overlap_score(regions['full_body'], ppe_bbox)
-                
-                if ppe_class in ['Hardhat', 'NO-Hardhat']:
-                    score = head_overlap * 2.0 + full_overlap * 0.5
-                    
-                    if score > 0.05 and ppe_conf > ppe_tracking['helmet']['confidence']:
-                        detected = (ppe_class == 'Hardhat')
-                        ppe_tracking['helmet'] = {
-                            'detected': detected,
-                            'confidence': ppe_conf,
-                            'source': ppe_class,
-                            'ppe_id': ppe_id
-                        }
-                
-                elif ppe_class in ['Safety Vest', 'NO-Safety Vest']:
-                    score = body_overlap * 2.0 + full_overlap * 0.5
-                    if score > 0.05 and ppe_conf > ppe_tracking['vest']['confidence']:
-                        detected = (ppe_class == 'Safety Vest')
-                        ppe_tracking['vest'] = {
-                            'detected': detected,
-                            'confidence': ppe_conf,
-                            'source': ppe_class,
-                            'ppe_id': ppe_id
-                        }
-                
-                elif ppe_class in ['Mask', 'NO-Mask']:
-                    face_score = face_overlap * 3.0
-                    head_score = head_overlap * 2.0
-                    full_score = full_overlap * 0.8
-                    total_score = max(face_score, head_score, full_score)
-                    
-                    if total_score > 0.02:
-                        mask_candidates.append({
-                            'detected': (ppe_class == 'Mask'),
-                            'confidence': ppe_conf,
-                            'score': total_score,
-                            'source': ppe_class,
-                            'ppe_id': ppe_id
-                        })
-            
-            if mask_candidates:
-                mask_candidates.sort(key=lambda x: (x['score'], x['confidence']), reverse=True)
-                best_mask = mask_candidates[0]
-                ppe_tracking['mask'] = {
-                    'detected': best_mask['detected'],
-                    'confidence': best_mask['confidence'],
-                    'source': best_mask['source'],
-                    'ppe_id': best_mask['ppe_id']
+                ppe_tracking[key] = {
+                    'detected': ppe_class[item_idx] == present_class,
+                    'confidence': float(ppe_conf[item_idx]),
+                    'source': ppe_class[item_idx],
                 }
             
-    
-            for key in ['helmet', 'vest', 'mask']:
-                if ppe_tracking[key]['ppe_id']:
-                    assigned_ppe.add(ppe_tracking[key]['ppe_id'])
-            
             has_helmet = ppe_tracking['helmet']['detected']
             has_vest = ppe_tracking['vest']['detected']
             has_mask = ppe_tracking['mask']['detected']
             
-         
             if not has_mask and ppe_tracking['mask']['source'] == 'NO-Mask' and ppe_tracking['mask']['confidence'] < 0.7:
                 has_mask = True
             
-            print(f"     FINAL: Helmet={has_helmet}, Vest={has_vest}, Mask={has_mask}")
+            if verbose:
+                print(f"  Person #{idx+1} at ({px1:.0f}, {py1:.0f}, {px2:.0f}, {py2:.0f}): "
+                      f"Helmet={has_helmet}, Vest={has_vest}, Mask={has_mask}")
             
             persons.append({
                 'person_id': idx + 1,
@@ -335,21 +812,17 @@ class YOLOPPEDetector:
     
     def _create_single_person_from_ppe(self, ppe_items, width, height):
         """Create single person from PPE when no person detected"""
-        if not ppe_items:
+        if len(ppe_items) == 0:
             return []
         
-        all_x = []
-        all_y = []
-        for d in ppe_items:
-            all_x.extend([d['bbox'][0], d['bbox'][2]])
-            all_y.extend([d['bbox'][1], d['bbox'][3]])
+        boxes = ppe_items['bbox']
+        person_bbox = [float(boxes[:, 0].min()), float(boxes[:, 1].min()), 
+                      float(boxes[:, 2].max()), float(boxes[:, 3].max())]
         
-        person_bbox = [float(min(all_x)), float(min(all_y)), 
-                      float(max(all_x)), float(max(all_y))]
-        
-        has_helmet = any(p['class'] == 'Hardhat' for p in ppe_items) and not any(p['class'] == 'NO-Hardhat' for p in ppe_items)
-        has_vest = any(p['class'] == 'Safety Vest' for p in ppe_items) and not any(p['class'] == 'NO-Safety Vest' for p in ppe_items)
-        has_mask = any(p['class'] == 'Mask' for p in ppe_items) and not any(p['class'] == 'NO-Mask' for p in ppe_items)
+        present = set(self.class_name_lut[np.unique(ppe_items['class_id'])])
+        has_helmet = 'Hardhat' in present and 'NO-Hardhat' not in present
+        has_vest = 'Safety Vest' in present and 'NO-Safety Vest' not in present
+        has_mask = 'Mask' in present and 'NO-Mask' not in present
         
         return [{
             'person_id': 1,
@@ -366,39 +839,23 @@ class YOLOPPEDetector:
             }
         }]
     
-    def _calculate_overlap_score(self, box1, box2):
-        """Calculate IoU (Intersection over Union)"""
-        x1_min, y1_min, x1_max, y1_max = box1
-        x2_min, y2_min, x2_max, y2_max = box2
-        
-        inter_x_min = max(x1_min, x2_min)
-        inter_y_min = max(y1_min, y2_min)
-        inter_x_max = min(x1_max, x2_max)
-        inter_y_max = min(y1_max, y2_max)
-        
-        if inter_x_max < inter_x_min or inter_y_max < inter_y_min:
-            return 0.0
-        
-        intersection = (inter_x_max - inter_x_min) * (inter_y_max - inter_y_min)
-        
-        area1 = (x1_max - x1_min) * (y1_max - y1_min)
-        area2 = (x2_max - x2_min) * (y2_max - y2_min)
-        
-        union = area1 + area2 - intersection
-        
-        return intersection / union if union > 0 else 0.0
-    
-    def _create_annotated_image(self, img, detections, original_path):
-        """Create annotated image"""
-        annotated = img.copy()
-        
-        for detection in detections:
-            class_name = detection['class']
-            x1, y1, x2, y2 = detection['bbox']
-            conf = detection['confidence']
-            color = detection['color']
-            
-            label = f'{class_name} {conf:.2f}'
+    def _encode_annotated_image(self, img, detections):
+        """Draw detections and encode straight to an in-memory buffer.
+        
+        Draws onto img in place (callers no longer need the clean frame). Returns
+        (bytes, extension); format and quality come from ANNOTATION_FORMAT / ANNOTATION_QUALITY.
+        """
+        annotated = img
+        
+        class_ids = detections['class_id']
+        labels = [
+            f'{class_name} {conf:.2f}'
+            for class_name, conf in zip(self.class_name_lut[class_ids], detections['confidence'].tolist())
+        ]
+        boxes = detections['bbox'].astype(np.int32).tolist()
+        colors = self.color_lut[class_ids].tolist()
+        
+        for (x1, y1, x2, y2), color, label in zip(boxes, colors, labels):
             t_size = cv2.getTextSize(label, 0, fontScale=0.8, thickness=2)[0]
             c2 = x1 + t_size[0], y1 - t_size[1] - 3
             
@@ -406,19 +863,31 @@ class YOLOPPEDetector:
             cv2.rectangle(annotated, (x1, y1), c2, color, -1, cv2.LINE_AA)
             cv2.putText(annotated, label, (x1, y1 - 2), 0, 0.8, [255, 255, 255], thickness=2, lineType=cv2.LINE_AA)
         
-        results_dir = os.path.join(settings.MEDIA_ROOT, 'results')
-        os.makedirs(results_dir, exist_ok=True)
-        
-        import time
-        filename = f"annotated_{os.path.splitext(os.path.basename(original_path))[0]}_{int(time.time())}.jpg"
-        annotated_path = os.path.join(results_dir, filename)
+        image_format = settings.ANNOTATION_FORMAT
+        quality = settings.ANNOTATION_QUALITY
+        if image_format == 'webp':
+            ext, params = 'webp', [cv2.IMWRITE_WEBP_QUALITY, quality]
+        else:
+            ext, params = 'jpg', [cv2.IMWRITE_JPEG_QUALITY, quality]
         
-        cv2.imwrite(annotated_path, annotated)
-        print(f"[SAVED] {annotated_path}")
+        success, buffer = cv2.imencode(f'.{ext}', annotated, params)
+        if not success:
+            raise ValueError(f"Could not encode annotated image as {ext}")
         
-        return annotated_path
+        return buffer.tobytes(), ext
+
+
+_detectors = {}
+_detector_lock = threading.Lock()
 
 
-def get_detector():
-    """Get singleton detector instance"""
-    return YOLOPPEDetector()
+def get_detector(mode=None):
+    """Get the singleton detector for a mode (models are shared through model_registry)"""
+    mode = mode or 'default'
+    detector = _detectors.get(mode)
+    if detector is None:
+        with _detector_lock:
+            detector = _detectors.get(mode)
+            if detector is None:
+                detector = _detectors[mode] = YOLOPPEDetector(mode)
+    return detector
@@ -0,0 +1,354 @@
+import io
+import tempfile
+import time
+import traceback
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+
+from analytics.statistics import day_start, scan_aggregates, violation_aggregates
+from ppe_detection.exports import VIOLATION_EXPORT_COLUMNS
+from ppe_detection.models import Detection, Violation
+
+from .models import Report
+
+
+# (column, ORM lookup) of the Excel "Detections" sheet
+DETECTION_EXPORT_COLUMNS = [
+    ('detection_id', 'id'),
+    ('created_at', 'created_at'),
+    ('user', 'user__username'),
+    ('compliance_status', 'compliance_status'),
+    ('persons', 'total_persons_detected'),
+    ('compliant_persons', 'compliant_persons'),
+    ('non_compliant_persons', 'non_compliant_persons'),
+    ('confidence', 'confidence_score'),
+    ('processing_time', 'processing_time'),
+    ('inference_mode', 'inference_mode'),
+]
+
+
+def report_period(report_type, date):
+    """(start, end) of the daily, weekly (Monday-based) or monthly period containing a local date"""
+    if report_type == 'daily':
+        start, end = date, date + timedelta(days=1)
+    elif report_type == 'weekly':
+        start = date - timedelta(days=date.weekday())
+        end = start + timedelta(days=7)
+    elif report_type == 'monthly':
+        start = date.replace(day=1)
+        end = (start + timedelta(days=32)).replace(day=1)
+    else:
+        raise ValueError(f'{report_type} reports need an explicit start_date and end_date')
+    return day_start(start), day_start(end)
+
+
+def report_detections(report):
+    """Completed detections covered by a report.
+
+    Staff and the site's manager get every detection at the site; anyone else
+    only their own. Incident reports keep the detections with violations.
+    """
+    detections = Detection.objects.filter(
+        site_id=report.site_id,
+        status='completed',
+        created_at__gte=report.start_date,
+        created_at__lt=report.end_date
+    )
+    user = report.generated_by
+    if not (user.is_staff or report.site.manager_id == user.id):
+        detections = detections.filter(user_id=user.id)
+    if report.report_type == 'incident':
+        detections = detections.filter(non_compliant_persons__gt=0)
+    return detections
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def build_summary(report, detections):
+    """Fill the report's counters and report_data from aggregate queries (no detection rows are loaded)"""
+    violations = Violation.objects.filter(detection__in=detections)
+    totals = detections.aggregate(**scan_aggregates())
+    totals.update(violations.aggregate(**violation_aggregates()))
+
+    top_violations = list(
+        violations.values('violation_type').annotate(count=Count('id')).order_by('-count')[:10]
+    )
+    daily = [
+        {
+            'date': timezone.localtime(row['day']).date().isoformat(),
+            'detections': row['total_scans'],
+            'persons': row['total_persons'],
+            'compliant_persons': row['compliant_persons'],
+            'non_compliant_persons': row['non_compliant_persons'],
+        }
+        for row in detections.annotate(day=TruncDay('created_at')).values('day').annotate(
+            **scan_aggregates()
+        ).order_by('day')
+    ]
+
+    total_scans = totals['total_scans']
+    total_persons = totals['total_persons']
+    report.total_detections = total_scans
+    report.total_persons_scanned = total_persons
+    report.compliant_count = totals['compliant_persons']
+    report.violation_count = totals['total_violations']
+    report.compliance_rate = round(totals['compliant_persons'] / total_persons * 100, 2) if total_persons > 0 else 100.0
+    report.report_data = {
+        'scans': {
+            'compliant': totals['compliant_scans'],
+            'partial_compliant': totals['partial_scans'],
+            'non_compliant': totals['non_compliant_scans'],
+            'compliance_rate': round(totals['compliant_scans'] / total_scans * 100, 2) if total_scans > 0 else 100.0,
+        },
+        'by_severity': {
+            severity: totals[f'{severity}_violations'] for severity, _ in Violation.SEVERITY_CHOICES
+        },
+        'by_status': {
+            status: totals[f'{status}_violations'] for status, _ in Violation.STATUS_CHOICES
+        },
+        'top_violations': top_violations,
+        'daily': daily,
+    }
+
+
+def link_detections(report, detections):
+    """Replace the report's detections M2M with bulk inserts of REPORT_CHUNK_SIZE ids at a time"""
+    through = Report.detections.through
+    with transaction.atomic():
+        through.objects.filter(report_id=report.pk).delete()
+        ids = detections.values_list('id', flat=True).iterator(chunk_size=settings.REPORT_CHUNK_SIZE)
+        for batch in _batched(ids, settings.REPORT_CHUNK_SIZE):
+            through.objects.bulk_create([
+                through(report_id=report.pk, detection_id=detection_id) for detection_id in batch
+            ])
+
+
+def _cell(value):
+    # openpyxl cannot store timezone-aware datetimes
+    if hasattr(value, 'tzinfo') and value.tzinfo is not None:
+        return timezone.localtime(value).replace(tzinfo=None)
+    if isinstance(value, list):
+        return ';'.join(value)
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+
+def write_excel(report, detections):
+    """Write-only workbook: rows go straight to disk, so sheet size does not affect memory.
+
+    Returns an open temporary file positioned at the start.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+
+    sheet = workbook.create_sheet('Summary')
+    sheet.append(['Report', report.title])
+    sheet.append(['Site', report.site.name])
+    sheet.append(['From', _cell(report.start_date)])
+    sheet.append(['To (exclusive)', _cell(report.end_date)])
+    sheet.append([])
+    for label, value in (
+        ('Detections', report.total_detections),
+        ('Persons scanned', report.total_persons_scanned),
+        ('Compliant persons', report.compliant_count),
+        ('Violations', report.violation_count),
+        ('Compliance rate (%)', report.compliance_rate),
+    ):
+        sheet.append([label, value])
+    sheet.append([])
+    sheet.append(['Date', 'Detections', 'Persons', 'Compliant persons', 'Non-compliant persons'])
+    for day in report.report_data['daily']:
+        sheet.append([
+            day['date'], day['detections'], day['persons'], day['compliant_persons'], day['non_compliant_persons']
+        ])
+
+    for title, columns, queryset in (
+        ('Detections', DETECTION_EXPORT_COLUMNS, detections.order_by('created_at')),
+        ('Violations', VIOLATION_EXPORT_COLUMNS, Violation.objects.filter(detection__in=detections).order_by('created_at')),
+    ):
+        sheet = workbook.create_sheet(title)
+        sheet.append([name for name, _ in columns])
+        rows = queryset.values_list(*[lookup for _, lookup in columns]).iterator(chunk_size=settings.REPORT_CHUNK_SIZE)
+        for row in rows:
+            sheet.append([_cell(value) for value in row])
+
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+def _thumbnail(field, size):
+    """Downsampled JPEG of a stored image as (BytesIO, (width, height))"""
+    from PIL import Image as PILImage
+
+    with field.open('rb') as f:
+        image = PILImage.open(f)
+        # JPEG: let the decoder scale by 1/2..1/8 instead of decoding full resolution
+        image.draft('RGB', (size, size))
+        image = image.convert('RGB')
+    image.thumbnail((size, size))
+
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=75)
+    buffer.seek(0)
+    return buffer, image.size
+
+
+def write_pdf(report, detections):
+    """Summary tables plus a grid of downsampled annotated images of the worst detections.
+
+    Returns an open temporary file positioned at the start.
+    """
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import mm
+    from reportlab.platypus import Image, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    styles = getSampleStyleSheet()
+    table_style = TableStyle([
+        ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f97316')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ])
+    data = report.report_data
+
+    def table(rows):
+        flowable = Table(rows, hAlign='LEFT')
+        flowable.setStyle(table_style)
+        return flowable
+
+    start = timezone.localtime(report.start_date)
+    end = timezone.localtime(report.end_date)
+    story = [
+        Paragraph(report.title, styles['Title']),
+        Paragraph(f"{report.site.name} &middot; {start:%Y-%m-%d %H:%M} to {end:%Y-%m-%d %H:%M}", styles['Normal']),
+        Spacer(1, 6 * mm),
+        table([
+            ['Detections', 'Persons scanned', 'Compliant', 'Violations', 'Compliance'],
+            [
+                report.total_detections, report.total_persons_scanned, report.compliant_count,
+                report.violation_count, f'{report.compliance_rate:.1f}%'
+            ],
+        ]),
+        Spacer(1, 6 * mm),
+        Paragraph('Violations by severity and status', styles['Heading2']),
+        table([
+            ['Severity', 'Count'],
+            *[[severity.title(), count] for severity, count in data['by_severity'].items()],
+        ]),
+        Spacer(1, 3 * mm),
+        table([
+            ['Status', 'Count'],
+            *[[status.title(), count] for status, count in data['by_status'].items()],
+        ]),
+    ]
+
+    if data['top_violations']:
+        story += [
+            Paragraph('Most frequent violations', styles['Heading2']),
+            table([['Violation', 'Count'], *[[row['violation_type'], row['count']] for row in data['top_violations']]]),
+        ]
+    if len(data['daily']) > 1:
+        story += [
+            Paragraph('Daily breakdown', styles['Heading2']),
+            table([
+                ['Date', 'Detections', 'Persons', 'Compliant', 'Non-compliant'],
+                *[
+                    [day['date'], day['detections'], day['persons'], day['compliant_persons'], day['non_compliant_persons']]
+                    for day in data['daily']
+                ],
+            ]),
+        ]
+
+    # Only REPORT_PDF_THUMBNAILS images are ever decoded, each at reduced size
+    worst = detections.exclude(annotated_image='').exclude(annotated_image__isnull=True).order_by(
+        '-non_compliant_persons', '-created_at'
+    ).only('id', 'annotated_image', 'created_at', 'non_compliant_persons', 'total_persons_detected')[
+        :settings.REPORT_PDF_THUMBNAILS
+    ]
+    cells = []
+    cell_width = 58 * mm
+    for detection in worst:
+        try:
+            buffer, (width, height) = _thumbnail(detection.annotated_image, settings.REPORT_THUMBNAIL_SIZE)
+        except (OSError, ValueError) as e:
+            print(f"[REPORT] Skipping thumbnail of {detection.id}: {e}")
+            continue
+        cells.append([
+            Image(buffer, width=cell_width, height=cell_width * height / width),
+            Paragraph(
+                f"{timezone.localtime(detection.created_at):%Y-%m-%d %H:%M} &middot; "
+                f"{detection.non_compliant_persons}/{detection.total_persons_detected} non-compliant",
+                styles['Normal']
+            ),
+        ])
+    if cells:
+        story += [
+            Paragraph('Violation snapshots', styles['Heading2']),
+            Table(
+                [cells[idx:idx + 3] for idx in range(0, len(cells), 3)],
+                colWidths=[cell_width + 2 * mm] * 3,
+                hAlign='LEFT'
+            ),
+        ]
+
+    output = tempfile.TemporaryFile()
+    SimpleDocTemplate(output, pagesize=A4, title=report.title).build(story)
+    output.seek(0)
+    return output
+
+
+def generate_report(report):
+    """Build a report's summary, detection links, Excel and PDF files; marks it completed or failed"""
+    start = time.time()
+    # Files of the previous generation; removed once the row points at their replacements
+    previous_files = [field.name for field in (report.excel_file, report.pdf_file) if field]
+    Report.objects.filter(pk=report.pk).update(status='processing', error='', updated_at=timezone.now())
+    try:
+        detections = report_detections(report)
+        build_summary(report, detections)
+        link_detections(report, detections)
+
+        name = f"{report.report_type}_{timezone.localtime(report.start_date):%Y%m%d}_{str(report.id)[:8]}"
+        for field, extension, write in (
+            (report.excel_file, 'xlsx', write_excel),
+            (report.pdf_file, 'pdf', write_pdf),
+        ):
+            with write(report, detections) as output:
+                field.save(f'{name}.{extension}', File(output), save=False)
+
+        report.status = 'completed'
+        report.error = ''
+    except Exception as e:
+        print(f"Report error: {traceback.format_exc()}")
+        report.status = 'failed'
+        report.error = str(e)
+
+    report.processing_time = round(time.time() - start, 2)
+    report.save()
+
+    current_files = {report.excel_file.name, report.pdf_file.name}
+    for stale in previous_files:
+        if stale not in current_files:
+            report.pdf_file.storage.delete(stale)
+    print(f"[REPORT] {report.id}: {report.status} in {report.processing_time:.2f}s")
+    return report
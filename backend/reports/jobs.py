@@ -0,0 +1,77 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .builder import generate_report
+from .models import Report
+
+
+def stale_cutoff():
+    """Reports queued or started before this were left behind by a process that stopped"""
+    return timezone.now() - timedelta(seconds=settings.REPORT_JOB_TIMEOUT)
+
+
+class ReportJobRunner:
+    """Builds Reports in the background of this process (REPORT_JOB_CONCURRENCY at a time).
+
+    The queue lives in memory, so the first submit after a restart also queues
+    the reports a previous process left unfinished.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance.executor = None
+        return cls._instance
+
+    def start(self):
+        """Create the executor once per process and queue the reports left pending"""
+        with self._lock:
+            if self.executor is not None:
+                return
+            self.executor = ThreadPoolExecutor(
+                max_workers=settings.REPORT_JOB_CONCURRENCY, thread_name_prefix='report-job'
+            )
+            for report_id in self.requeue_stale():
+                self.executor.submit(self._run, report_id)
+
+    def submit(self, report_id):
+        """Queue a committed Report for generation"""
+        self.start()
+        self.executor.submit(self._run, report_id)
+
+    def requeue_stale(self):
+        """Put back reports stuck in 'processing' past REPORT_JOB_TIMEOUT; returns the ids of all pending reports"""
+        count = Report.objects.filter(status='processing', updated_at__lt=stale_cutoff()).update(
+            status='pending', updated_at=timezone.now()
+        )
+        if count:
+            print(f"[REPORT] Requeued {count} stale report(s)")
+        return list(Report.objects.filter(status='pending').values_list('pk', flat=True))
+
+    def _run(self, report_id):
+        close_old_connections()
+        try:
+            # A report can be queued twice (recovery, or by two processes); only one run takes it
+            claimed = Report.objects.filter(pk=report_id, status='pending').update(
+                status='processing', updated_at=timezone.now()
+            )
+            if not claimed:
+                print(f"[REPORT] {report_id} is no longer pending; skipped")
+                return
+            generate_report(Report.objects.select_related('site', 'generated_by').get(pk=report_id))
+        except Exception as e:
+            print(f"[REPORT] {report_id} could not run: {e}")
+        finally:
+            close_old_connections()
+
+
+report_jobs = ReportJobRunner()
@@ -0,0 +1,34 @@
+# Generated by Django 5.1 on 2026-10-17 16:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='processing_time',
+            field=models.FloatField(default=0.0, help_text='Generation time in seconds'),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['generated_by', '-created_at'], name='reports_generat_4f8043_idx'),
+        ),
+    ]
@@ -18,14 +18,22 @@ class Report(models.Model):
         ('custom', 'Custom Report'),
     ]
     
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     title = models.CharField(max_length=300)
     report_type = models.CharField(max_length=20, choices=REPORT_TYPE_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     
     site = models.ForeignKey(Site, on_delete=models.CASCADE, related_name='reports')
     generated_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='generated_reports')
     
-    # Date range
+    # Date range (end_date is exclusive)
     start_date = models.DateTimeField()
     end_date = models.DateTimeField()
     
@@ -47,6 +55,8 @@ class Report(models.Model):
     excel_file = models.FileField(upload_to='reports/excel/%Y/%m/', blank=True, null=True)
     
     notes = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    processing_time = models.FloatField(default=0.0, help_text='Generation time in seconds')
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -54,6 +64,9 @@ class Report(models.Model):
     class Meta:
         db_table = 'reports'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['generated_by', '-created_at']),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.report_type}"
@@ -0,0 +1,61 @@
+from rest_framework import serializers
+from django.utils import timezone
+from users.models import Site
+from .models import Report
+from .builder import report_period
+
+
+class ReportSerializer(serializers.ModelSerializer):
+    """Serializer for Report"""
+    site_name = serializers.CharField(source='site.name', read_only=True)
+    
+    class Meta:
+        model = Report
+        fields = [
+            'id', 'title', 'report_type', 'status', 'site', 'site_name',
+            'start_date', 'end_date',
+            'total_detections', 'total_persons_scanned', 'compliant_count',
+            'violation_count', 'compliance_rate', 'report_data',
+            'pdf_file', 'excel_file', 'notes', 'error', 'processing_time',
+            'created_at', 'updated_at',
+        ]
+        read_only_fields = fields
+
+
+class ReportCreateSerializer(serializers.ModelSerializer):
+    """Serializer for requesting a Report.
+    
+    daily / weekly / monthly reports cover the period containing `date` (default:
+    today); incident and custom reports need start_date and end_date.
+    """
+    site = serializers.PrimaryKeyRelatedField(queryset=Site.objects.all())
+    title = serializers.CharField(max_length=300, required=False, allow_blank=True)
+    date = serializers.DateField(required=False, write_only=True)
+    start_date = serializers.DateTimeField(required=False)
+    end_date = serializers.DateTimeField(required=False)
+    notes = serializers.CharField(required=False, allow_blank=True)
+    
+    class Meta:
+        model = Report
+        fields = ['title', 'report_type', 'site', 'date', 'start_date', 'end_date', 'notes']
+    
+    def validate(self, attrs):
+        date = attrs.pop('date', None)
+        if attrs['report_type'] in ('daily', 'weekly', 'monthly'):
+            attrs['start_date'], attrs['end_date'] = report_period(
+                attrs['report_type'], date or timezone.localdate()
+            )
+        elif not attrs.get('start_date') or not attrs.get('end_date'):
+            raise serializers.ValidationError(
+                f"{attrs['report_type']} reports need start_date and end_date"
+            )
+        
+        if attrs['end_date'] <= attrs['start_date']:
+            raise serializers.ValidationError('end_date must be after start_date')
+        
+        if not attrs.get('title'):
+            attrs['title'] = (
+                f"{dict(Report.REPORT_TYPE_CHOICES)[attrs['report_type']]} - {attrs['site'].name} - "
+                f"{timezone.localtime(attrs['start_date']):%Y-%m-%d}"
+            )
+        return attrs
@@ -1,3 +1,247 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from analytics.statistics import day_start
+from ppe_detection.models import Detection
+from users.models import Site
+
+from .builder import generate_report, report_period
+from .jobs import ReportJobRunner
+from .models import Report
+from .serializers import ReportCreateSerializer
+
+
+class ReportPeriodTests(SimpleTestCase):
+    def test_daily(self):
+        self.assertEqual(
+            report_period('daily', date(2024, 3, 13)), (day_start(date(2024, 3, 13)), day_start(date(2024, 3, 14)))
+        )
+
+    def test_weekly_starts_on_monday(self):
+        for day in (date(2024, 3, 11), date(2024, 3, 13), date(2024, 3, 17)):
+            with self.subTest(day=day):
+                self.assertEqual(
+                    report_period('weekly', day), (day_start(date(2024, 3, 11)), day_start(date(2024, 3, 18)))
+                )
+
+    def test_monthly(self):
+        self.assertEqual(
+            report_period('monthly', date(2024, 2, 29)), (day_start(date(2024, 2, 1)), day_start(date(2024, 3, 1)))
+        )
+        self.assertEqual(
+            report_period('monthly', date(2024, 12, 31)), (day_start(date(2024, 12, 1)), day_start(date(2025, 1, 1)))
+        )
+
+    def test_custom_and_incident_need_explicit_dates(self):
+        for report_type in ('custom', 'incident'):
+            with self.subTest(report_type=report_type):
+                with self.assertRaises(ValueError):
+                    report_period(report_type, date(2024, 3, 13))
+
+
+class ReportTestCase(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('inspector', password='secret')
+        self.site = Site.objects.create(name='North Yard', location='Pier 4', manager=self.user)
+
+
+class ReportCreateSerializerTests(ReportTestCase):
+    def validate(self, **data):
+        serializer = ReportCreateSerializer(data={'site': self.site.pk, **data})
+        return serializer.is_valid(), serializer
+
+    def test_periodic_reports_cover_the_period_of_date(self):
+        valid, serializer = self.validate(report_type='weekly', date='2024-03-13')
+        self.assertTrue(valid, serializer.errors)
+        self.assertEqual(serializer.validated_data['start_date'], day_start(date(2024, 3, 11)))
+        self.assertEqual(serializer.validated_data['end_date'], day_start(date(2024, 3, 18)))
+        self.assertNotIn('date', serializer.validated_data)
+        self.assertEqual(serializer.validated_data['title'], 'Weekly Report - North Yard - 2024-03-11')
+
+    def test_periodic_reports_default_to_today(self):
+        valid, serializer = self.validate(report_type='daily')
+        self.assertTrue(valid, serializer.errors)
+        self.assertEqual(serializer.validated_data['start_date'], day_start(timezone.localdate()))
+
+    def test_periodic_reports_ignore_explicit_range(self):
+        valid, serializer = self.validate(
+            report_type='monthly', date='2024-02-10',
+            start_date='2023-01-01T00:00:00Z', end_date='2023-06-01T00:00:00Z'
+        )
+        self.assertTrue(valid, serializer.errors)
+        self.assertEqual(serializer.validated_data['start_date'], day_start(date(2024, 2, 1)))
+
+    def test_custom_reports_need_both_dates(self):
+        valid, serializer = self.validate(report_type='custom', start_date='2024-03-01T00:00:00Z')
+        self.assertFalse(valid)
+        self.assertIn('non_field_errors', serializer.errors)
+
+    def test_end_must_be_after_start(self):
+        valid, serializer = self.validate(
+            report_type='incident', start_date='2024-03-02T00:00:00Z', end_date='2024-03-02T00:00:00Z'
+        )
+        self.assertFalse(valid)
+
+    def test_explicit_title_is_kept(self):
+        valid, serializer = self.validate(report_type='daily', date='2024-03-13', title='Crane audit')
+        self.assertTrue(valid, serializer.errors)
+        self.assertEqual(serializer.validated_data['title'], 'Crane audit')
+
+
+class GenerateReportTests(ReportTestCase):
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        now = timezone.now()
+        for compliant, non_compliant in ((2, 0), (1, 2), (0, 1)):
+            Detection.objects.create(
+                user=self.user, site=self.site, original_image='uploads/photo.jpg', status='completed',
+                compliance_status='compliant' if not non_compliant else 'non_compliant',
+                total_persons_detected=compliant + non_compliant,
+                compliant_persons=compliant, non_compliant_persons=non_compliant,
+            )
+        # Another user's, at the same site but outside the period
+        other = get_user_model().objects.create_user('visitor', password='secret')
+        Detection.objects.create(user=other, site=self.site, original_image='uploads/photo.jpg', status='completed')
+        Detection.objects.filter(user=other).update(created_at=now - timedelta(days=30))
+
+        self.report = Report.objects.create(
+            title='Custom', report_type='custom', site=self.site, generated_by=self.user,
+            start_date=now - timedelta(days=1), end_date=now + timedelta(days=1),
+        )
+
+    def test_builds_summary_and_files(self):
+        report = generate_report(self.report)
+
+        self.assertEqual(report.status, 'completed', report.error)
+        self.assertEqual(report.total_detections, 3)
+        self.assertEqual(report.total_persons_scanned, 6)
+        self.assertEqual(report.compliant_count, 3)
+        self.assertEqual(report.compliance_rate, 50.0)
+        self.assertEqual(report.report_data['scans']['compliant'], 1)
+        self.assertEqual(report.report_data['scans']['non_compliant'], 2)
+        self.assertEqual(report.detections.count(), 3)
+        for field in (report.pdf_file, report.excel_file):
+            self.assertTrue(field.storage.exists(field.name))
+
+    def test_incident_report_keeps_detections_with_violations(self):
+        self.report.report_type = 'incident'
+        report = generate_report(self.report)
+        self.assertEqual(report.total_detections, 2)
+
+    def test_regenerating_replaces_previous_files(self):
+        report = generate_report(self.report)
+        old_files = [report.pdf_file.name, report.excel_file.name]
+
+        report = generate_report(Report.objects.get(pk=report.pk))
+
+        self.assertEqual(report.status, 'completed', report.error)
+        for name in old_files:
+            self.assertFalse(report.pdf_file.storage.exists(name), name)
+        for field in (report.pdf_file, report.excel_file):
+            self.assertNotIn(field.name, old_files)
+            self.assertTrue(field.storage.exists(field.name))
+
+    def test_failed_regeneration_keeps_files_still_referenced(self):
+        report = generate_report(self.report)
+        old_pdf = report.pdf_file.name
+
+        with mock.patch('reports.builder.write_pdf', side_effect=ValueError('no fonts')):
+            report = generate_report(Report.objects.get(pk=report.pk))
+
+        self.assertEqual(report.status, 'failed')
+        self.assertEqual(report.error, 'no fonts')
+        self.assertEqual(report.pdf_file.name, old_pdf)
+        self.assertTrue(report.pdf_file.storage.exists(old_pdf))
+
+
+class RegenerateReportTests(ReportTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        now = timezone.now()
+        self.report = Report.objects.create(
+            title='Daily', report_type='daily', site=self.site, generated_by=self.user,
+            start_date=now - timedelta(days=1), end_date=now,
+        )
+
+    def regenerate(self):
+        return self.client.post(f'/api/reports/{self.report.pk}/regenerate/')
+
+    def test_finished_report_is_queued_again(self):
+        for finished in ('completed', 'failed'):
+            Report.objects.filter(pk=self.report.pk).update(status=finished)
+            with self.subTest(status=finished), mock.patch('reports.views.report_jobs') as jobs:
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = self.regenerate()
+                self.assertEqual(response.status_code, 202)
+                self.assertEqual(response.data['status'], 'pending')
+                jobs.submit.assert_called_once_with(self.report.pk)
+
+    def test_report_in_progress_is_a_conflict(self):
+        for in_progress in ('pending', 'processing'):
+            Report.objects.filter(pk=self.report.pk).update(status=in_progress)
+            with self.subTest(status=in_progress), mock.patch('reports.views.report_jobs') as jobs:
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = self.regenerate()
+                self.assertEqual(response.status_code, 409)
+                jobs.submit.assert_not_called()
+                self.assertEqual(Report.objects.get(pk=self.report.pk).status, in_progress)
+
+    @override_settings(REPORT_JOB_TIMEOUT=600)
+    def test_abandoned_report_is_taken_over(self):
+        for in_progress in ('pending', 'processing'):
+            Report.objects.filter(pk=self.report.pk).update(
+                status=in_progress, updated_at=timezone.now() - timedelta(minutes=11)
+            )
+            with self.subTest(status=in_progress), mock.patch('reports.views.report_jobs') as jobs:
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = self.regenerate()
+                self.assertEqual(response.status_code, 202)
+                jobs.submit.assert_called_once_with(self.report.pk)
+
+
+@override_settings(REPORT_JOB_TIMEOUT=600)
+class ReportJobRunnerTests(ReportTestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        self.reports = {}
+        for name, status, minutes_ago in (
+            ('pending', 'pending', 0), ('running', 'processing', 1),
+            ('abandoned', 'processing', 11), ('completed', 'completed', 11),
+        ):
+            report = Report.objects.create(
+                title=name, report_type='daily', site=self.site, generated_by=self.user,
+                start_date=now - timedelta(days=1), end_date=now,
+            )
+            Report.objects.filter(pk=report.pk).update(status=status, updated_at=now - timedelta(minutes=minutes_ago))
+            self.reports[name] = report.pk
+
+    def test_requeue_stale(self):
+        queued = ReportJobRunner().requeue_stale()
+        self.assertCountEqual(queued, [self.reports['pending'], self.reports['abandoned']])
+        self.assertEqual(Report.objects.get(pk=self.reports['abandoned']).status, 'pending')
+        self.assertEqual(Report.objects.get(pk=self.reports['running']).status, 'processing')
+
+    def test_report_queued_twice_is_generated_once(self):
+        # close_old_connections would drop the test's transaction
+        with mock.patch('reports.jobs.close_old_connections'), mock.patch('reports.jobs.generate_report') as generate:
+            for _ in range(2):
+                ReportJobRunner()._run(self.reports['pending'])
+            ReportJobRunner()._run(self.reports['running'])
+        generate.assert_called_once()
+        self.assertEqual(generate.call_args.args[0].pk, self.reports['pending'])
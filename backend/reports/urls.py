@@ -0,0 +1,10 @@
+from django.urls import path, include
+from rest_framework.routers import SimpleRouter
+from . import views
+
+router = SimpleRouter()
+router.register(r'', views.ReportViewSet, basename='report')
+
+urlpatterns = [
+    path('', include(router.urls)),
+]
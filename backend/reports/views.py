@@ -1,3 +1,86 @@
-from django.shortcuts import render
+from django.db import transaction
+from django.db.models import Q
+from django.http import FileResponse
+from django.utils import timezone
+from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
-# Create your views here.
+from .jobs import report_jobs, stale_cutoff
+from .models import Report
+from .serializers import ReportSerializer, ReportCreateSerializer
+
+
+class ReportViewSet(viewsets.ModelViewSet):
+    """ViewSet for compliance reports; files are built in the background after create"""
+    serializer_class = ReportSerializer
+    permission_classes = [IsAuthenticated]
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
+    
+    def get_queryset(self):
+        """Get reports generated by the current user"""
+        queryset = Report.objects.filter(generated_by=self.request.user).select_related('site')
+        
+        site = self.request.query_params.get('site', None)
+        report_type = self.request.query_params.get('report_type', None)
+        if site:
+            queryset = queryset.filter(site_id=site)
+        if report_type:
+            queryset = queryset.filter(report_type=report_type)
+        
+        return queryset.order_by('-created_at')
+    
+    def get_serializer_class(self):
+        if self.action == 'create':
+            return ReportCreateSerializer
+        return ReportSerializer
+    
+    def create(self, request, *args, **kwargs):
+        """Queue a report (202 + pending row; poll the detail endpoint for status)"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        report = serializer.save(generated_by=request.user, status='pending')
+        transaction.on_commit(lambda: report_jobs.submit(report.id))
+        
+        return Response(ReportSerializer(report).data, status=status.HTTP_202_ACCEPTED)
+    
+    def perform_destroy(self, instance):
+        """Delete the report and its generated files"""
+        for field in (instance.pdf_file, instance.excel_file):
+            if field:
+                field.delete(save=False)
+        instance.delete()
+    
+    @action(detail=True, methods=['post'])
+    def regenerate(self, request, pk=None):
+        """Rebuild a report from the current data"""
+        report = self.get_object()
+        # Conditional update so two requests cannot queue the same report twice; a report
+        # still 'pending'/'processing' past REPORT_JOB_TIMEOUT lost its process and is taken over
+        queued = Report.objects.filter(
+            Q(status__in=['completed', 'failed']) | Q(status__in=['pending', 'processing'], updated_at__lt=stale_cutoff()),
+            pk=report.pk
+        ).update(status='pending', updated_at=timezone.now())
+        if not queued:
+            return Response({'error': 'Report is already being generated'}, status=status.HTTP_409_CONFLICT)
+        
+        report.refresh_from_db()
+        transaction.on_commit(lambda: report_jobs.submit(report.id))
+        
+        return Response(ReportSerializer(report).data, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """Download the generated file (?file=pdf|excel)"""
+        report = self.get_object()
+        file_type = request.query_params.get('file', 'pdf')
+        if file_type not in ('pdf', 'excel'):
+            return Response({'error': f'Unknown file: {file_type} (expected pdf or excel)'}, status=400)
+        
+        field = report.pdf_file if file_type == 'pdf' else report.excel_file
+        if report.status != 'completed' or not field:
+            return Response({'error': f'Report is {report.status}'}, status=404)
+        
+        return FileResponse(field.open('rb'), as_attachment=True, filename=field.name.rsplit('/', 1)[-1])
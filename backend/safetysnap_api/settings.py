@@ -144,4 +144,131 @@ CHANNEL_LAYERS = {
 }
 
 # Custom User model
-AUTH_USER_MODEL = "users.User"
\ No newline at end of file
+AUTH_USER_MODEL = "users.User"
+
+# PPE detection models
+# Seconds between mtime checks for hot-reloading weight files (negative disables reload)
+MODEL_RELOAD_CHECK_INTERVAL = float(os.getenv('MODEL_RELOAD_CHECK_INTERVAL', '5'))
+# Load and warm up the YOLO models when the app starts instead of on the first request
+PPE_WARMUP_ON_START = os.getenv('PPE_WARMUP_ON_START', 'False') == 'True'
+# Confidence thresholds for image uploads and video/camera frames, and the NMS IoU
+DETECTION_IMAGE_CONF = float(os.getenv('DETECTION_IMAGE_CONF', '0.4'))
+DETECTION_FRAME_CONF = float(os.getenv('DETECTION_FRAME_CONF', '0.5'))
+DETECTION_IOU = float(os.getenv('DETECTION_IOU', '0.5'))
+
+# Inference backends
+# 'torch', 'onnx' (ONNX Runtime) or 'openvino'; export with `manage.py export_models`
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'torch').lower()
+# ONNX Runtime threads (0 = let the runtime decide) and graph optimization ('disable', 'basic', 'extended', 'all')
+ONNX_INTRA_OP_THREADS = int(os.getenv('ONNX_INTRA_OP_THREADS', '0'))
+ONNX_INTER_OP_THREADS = int(os.getenv('ONNX_INTER_OP_THREADS', '0'))
+ONNX_GRAPH_OPTIMIZATION = os.getenv('ONNX_GRAPH_OPTIMIZATION', 'all').lower()
+# OpenVINO device, inference threads (0 = default) and performance hint ('LATENCY' or 'THROUGHPUT')
+OPENVINO_DEVICE = os.getenv('OPENVINO_DEVICE', 'CPU')
+OPENVINO_THREADS = int(os.getenv('OPENVINO_THREADS', '0'))
+OPENVINO_PERFORMANCE_HINT = os.getenv('OPENVINO_PERFORMANCE_HINT', 'LATENCY').upper()
+
+# Detector modes and INT8 quantization
+# Per endpoint: 'default' (INFERENCE_BACKEND) or 'quantized' (INT8, see `manage.py quantize_model`)
+IMAGE_DETECTOR_MODE = os.getenv('IMAGE_DETECTOR_MODE', 'default')
+STREAM_DETECTOR_MODE = os.getenv('STREAM_DETECTOR_MODE', 'default')
+VIDEO_DETECTOR_MODE = os.getenv('VIDEO_DETECTOR_MODE', 'default')
+# Classes whose recall an INT8 model may not lose against FP32
+QUANTIZATION_GATE_CLASSES = [
+    name.strip() for name in os.getenv('QUANTIZATION_GATE_CLASSES', 'NO-Hardhat,NO-Safety Vest').split(',') if name.strip()
+]
+
+# Detection job queue (the detections table is the queue; no broker required)
+# When True, uploads return 202 with a pending Detection and are processed by background workers
+DETECTION_JOB_MODE = os.getenv('DETECTION_JOB_MODE', 'False') == 'True'
+# Worker threads per process; 0 disables the in-process pool (use `manage.py run_detection_workers`)
+DETECTION_WORKERS = int(os.getenv('DETECTION_WORKERS', '2'))
+DETECTION_JOB_POLL_INTERVAL = float(os.getenv('DETECTION_JOB_POLL_INTERVAL', '2'))
+# Seconds after which a detection stuck in 'processing' is put back in the queue
+DETECTION_JOB_TIMEOUT = int(os.getenv('DETECTION_JOB_TIMEOUT', '600'))
+
+# Batched image inference
+DETECTION_BATCH_SIZE = int(os.getenv('DETECTION_BATCH_SIZE', '8'))
+DETECTION_DECODE_WORKERS = int(os.getenv('DETECTION_DECODE_WORKERS', '4'))
+DETECTION_BULK_MAX_IMAGES = int(os.getenv('DETECTION_BULK_MAX_IMAGES', '200'))
+
+# Sliced inference (Detection.inference_mode='sliced'): tile size and overlap in pixels/fraction
+SLICE_SIZE = int(os.getenv('SLICE_SIZE', '640'))
+SLICE_OVERLAP = float(os.getenv('SLICE_OVERLAP', '0.2'))
+# Tiling is skipped when every person from the full-image pass is at least this tall at model input size
+SLICE_MIN_PERSON_PX = int(os.getenv('SLICE_MIN_PERSON_PX', '96'))
+# Same-class boxes overlapping more than this (intersection over the smaller box) are merged
+SLICE_MATCH_THRESHOLD = float(os.getenv('SLICE_MATCH_THRESHOLD', '0.5'))
+
+# Annotated result images ('jpeg' or 'webp') and encoder quality (0-100)
+ANNOTATION_FORMAT = os.getenv('ANNOTATION_FORMAT', 'jpeg').lower()
+ANNOTATION_QUALITY = int(os.getenv('ANNOTATION_QUALITY', '90'))
+
+# Result cache for re-uploaded images (keyed on image hash + model version + thresholds)
+# In-memory LRU bounds; RESULT_CACHE_SIZE=0 disables the memory tier
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '256'))
+RESULT_CACHE_MAX_MB = int(os.getenv('RESULT_CACHE_MAX_MB', '128'))
+# Optional disk tier shared by all processes (empty disables it)
+RESULT_CACHE_DIR = os.getenv('RESULT_CACHE_DIR', '')
+
+# Multi-camera RTSP ingest: fixed inference pool shared by all cameras
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', '2'))
+# Max frames (from different cameras) run through the model in one call
+INFERENCE_BATCH_SIZE = int(os.getenv('INFERENCE_BATCH_SIZE', '4'))
+# Default per-camera inference rate; override per stream with ?fps=
+CAMERA_TARGET_FPS = float(os.getenv('CAMERA_TARGET_FPS', '5'))
+
+# Video tracking (VideoSafetyMonitor)
+# Inference frames a track may go unmatched before it is dropped
+VIDEO_TRACK_MAX_AGE = int(os.getenv('VIDEO_TRACK_MAX_AGE', '15'))
+# Matched detections before a track is reported and its compliance evaluated
+VIDEO_TRACK_MIN_HITS = int(os.getenv('VIDEO_TRACK_MIN_HITS', '3'))
+# Max consecutive frames served from track prediction while all tracks are stable (0 = infer every frame)
+VIDEO_STABLE_SKIP_FRAMES = int(os.getenv('VIDEO_STABLE_SKIP_FRAMES', '4'))
+
+# Background video analysis (VideoJob)
+# Worker processes shared by all video jobs; each loads the video model once
+VIDEO_PROCESS_WORKERS = int(os.getenv('VIDEO_PROCESS_WORKERS', '2'))
+# Videos processed concurrently per web process
+VIDEO_JOB_CONCURRENCY = int(os.getenv('VIDEO_JOB_CONCURRENCY', '1'))
+# Seconds without a finished chunk after which a job still 'processing' is queued again
+VIDEO_JOB_TIMEOUT = int(os.getenv('VIDEO_JOB_TIMEOUT', '1800'))
+# Length of the time ranges a video is split into
+VIDEO_CHUNK_SECONDS = float(os.getenv('VIDEO_CHUNK_SECONDS', '60'))
+# Minimum stride between analysed frames (raised adaptively when inference cannot keep up)
+VIDEO_FRAME_STRIDE = int(os.getenv('VIDEO_FRAME_STRIDE', '5'))
+# From this stride on, skipped frames are seeked over instead of grabbed
+VIDEO_SEEK_MIN_STRIDE = int(os.getenv('VIDEO_SEEK_MIN_STRIDE', '30'))
+
+# Adaptive frame skipping (AdaptiveFrameSkipper), shared by all streaming paths
+# Capture-to-result latency above which the detection stride is raised (seconds)
+FRAME_SKIP_TARGET_LATENCY = float(os.getenv('FRAME_SKIP_TARGET_LATENCY', '0.5'))
+# Fraction of source frame time inference may use when picking the stride
+FRAME_SKIP_UTILIZATION = float(os.getenv('FRAME_SKIP_UTILIZATION', '0.8'))
+FRAME_SKIP_MAX_STRIDE = int(os.getenv('FRAME_SKIP_MAX_STRIDE', '30'))
+# Mean grayscale difference (0-255) below which a frame counts as static; 0 disables motion gating
+FRAME_SKIP_MOTION_THRESHOLD = float(os.getenv('FRAME_SKIP_MOTION_THRESHOLD', '0'))
+# Static scenes are still analysed at least this often (seconds of source time)
+FRAME_SKIP_MAX_IDLE = float(os.getenv('FRAME_SKIP_MAX_IDLE', '2'))
+
+# Frame buffers per capture reused by cap.read(image=...); a buffer is reused once no consumer holds its frame
+FRAME_RING_SIZE = int(os.getenv('FRAME_RING_SIZE', '4'))
+
+# MJPEG streams: each frame is encoded once per tier that has viewers (?tier=full|thumbnail)
+MJPEG_TIERS = {
+    'full': {'max_width': None, 'quality': int(os.getenv('MJPEG_QUALITY', '70'))},
+    'thumbnail': {'max_width': int(os.getenv('MJPEG_THUMBNAIL_WIDTH', '320')), 'quality': 50},
+}
+# JPEG encoder: 'auto' (simplejpeg if installed, else OpenCV), 'simplejpeg', 'pil' or 'opencv'
+MJPEG_ENCODER = os.getenv('MJPEG_ENCODER', 'auto').lower()
+
+# Background report generation (reports.Report -> PDF + Excel)
+# Reports built concurrently per web process
+REPORT_JOB_CONCURRENCY = int(os.getenv('REPORT_JOB_CONCURRENCY', '1'))
+# Seconds after which a report still 'pending' or 'processing' is treated as abandoned and queued again
+REPORT_JOB_TIMEOUT = int(os.getenv('REPORT_JOB_TIMEOUT', '1800'))
+# Rows fetched per database round trip while writing report files and detection links
+REPORT_CHUNK_SIZE = int(os.getenv('REPORT_CHUNK_SIZE', '2000'))
+# Annotated images shown in the PDF (most violations first) and their longest side in pixels
+REPORT_PDF_THUMBNAILS = int(os.getenv('REPORT_PDF_THUMBNAILS', '24'))
+REPORT_THUMBNAIL_SIZE = int(os.getenv('REPORT_THUMBNAIL_SIZE', '320'))
@@ -20,6 +20,8 @@ def api_root(request):
         'endpoints': {
             'auth': '/api/auth/',
             'ppe': '/api/ppe/',
+            'analytics': '/api/analytics/',
+            'reports': '/api/reports/',
             'admin': '/admin/',
         }
     })
@@ -28,6 +30,8 @@ urlpatterns = [
     path('api/', api_root, name='api-root'),
     path('api/auth/', include('users.urls')),
     path('api/ppe/', include('ppe_detection.urls')),
+    path('api/analytics/', include('analytics.urls')),
+    path('api/reports/', include('reports.urls')),
     path('api/health/', health_check, name='health_check'),
     
 ]
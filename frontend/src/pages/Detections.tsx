@@ -1,5 +1,5 @@
 import { useState } from 'react';
-import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query';
+import { useInfiniteQuery, useMutation, useQueryClient } from '@tanstack/react-query';
 import { useNavigate } from 'react-router-dom';
 import { 
   FileSearch, 
@@ -40,6 +40,12 @@ interface Detection {
   processing_time?: number;
 }
 
+interface DetectionPage {
+  next: string | null;
+  previous: string | null;
+  results: Detection[];
+}
+
 const formatDate = (dateString: string) => {
   try {
     const date = new Date(dateString);
@@ -63,16 +69,20 @@ export const Detections = () => {
   const [selectedIds, setSelectedIds] = useState<string[]>([]);
   const [isSelectionMode, setIsSelectionMode] = useState(false);
 
-  const { data: detections, isLoading } = useQuery<Detection[]>({
+  // Cursor-paginated: each page carries the URL of the next one
+  const { data, isLoading, fetchNextPage, hasNextPage, isFetchingNextPage } = useInfiniteQuery({
     queryKey: ['detections'],
-    queryFn: async () => {
+    queryFn: async ({ pageParam }) => {
       const token = localStorage.getItem('token');
-      const response = await axios.get(`${API_BASE_URL}/api/ppe/detections/`, {
+      const response = await axios.get<DetectionPage>(pageParam || `${API_BASE_URL}/api/ppe/detections/`, {
         headers: { Authorization: `Token ${token}` }
       });
       return response.data;
-    }
+    },
+    initialPageParam: '',
+    getNextPageParam: (lastPage) => lastPage.next ?? undefined,
   });
+  const detections = data?.pages.flatMap(page => page.results);
 
   const deleteMutation = useMutation({
     mutationFn: async (id: string) => {
@@ -178,7 +188,7 @@ export const Detections = () => {
               Detection History
             </h1>
             <p className="text-sm sm:text-base text-gray-600 dark:text-gray-400 mt-1">
-              {detections?.length || 0} total detections
+              {detections?.length || 0}{hasNextPage ? '+' : ''} total detections
               {isSelectionMode && selectedIds.length > 0 && (
                 <span className="ml-2 text-orange-600 dark:text-orange-400">
                   ({selectedIds.length} selected)
@@ -432,6 +442,14 @@ export const Detections = () => {
             })}
           </div>
         )}
+
+        {hasNextPage && (
+          <div className="flex justify-center">
+            <Button variant="secondary" onClick={() => fetchNextPage()} isLoading={isFetchingNextPage}>
+              Load more
+            </Button>
+          </div>
+        )}
       </div>
     </PageTransition>
   );